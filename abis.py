@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+"""
+abis.py
+
+Contract ABIs without parsing the Hardhat artifacts on every start.
+
+The artifacts carry bytecode, deployed bytecode and link references next to
+the ABI; only the ABI is needed to talk to a deployed contract.  load_abi()
+reads a small extracted copy from abi/<Name>.json and only falls back to
+the artifact when that copy is missing or older than the artifact (e.g.
+right after `npx hardhat compile`), refreshing the copy as it goes.
+
+    python abis.py        # re-extract every ABI into abi/
+"""
+
+import json
+import os
+
+ARTIFACTS = {
+    "ChainCustody": "artifacts/contracts/ChainCustody.sol/ChainCustody.json",
+    "WasteChain":   "artifacts/contracts/WasteChain.sol/WasteChain.json"
+}
+ABI_DIR = "abi"
+
+
+def _cache_path(name):
+    return os.path.join(ABI_DIR, f"{name}.json")
+
+
+def extract_abi(name):
+    with open(ARTIFACTS[name]) as f:
+        abi = json.load(f)["abi"]
+    try:
+        os.makedirs(ABI_DIR, exist_ok=True)
+        with open(_cache_path(name), "w") as f:
+            json.dump(abi, f, separators=(",", ":"))
+    except OSError:
+        pass   # read-only checkout; the artifact still works, just slower
+    return abi
+
+
+def load_abi(name):
+    cached = _cache_path(name)
+    try:
+        fresh = os.path.getmtime(cached) >= os.path.getmtime(ARTIFACTS[name])
+    except FileNotFoundError:
+        # no artifacts (deployed without node_modules/hardhat) -> trust the cache
+        fresh = os.path.exists(cached) and not os.path.exists(ARTIFACTS[name])
+    if not fresh:
+        return extract_abi(name)
+    with open(cached) as f:
+        return json.load(f)
+
+
+def main():
+    for name in ARTIFACTS:
+        abi = extract_abi(name)
+        print(f"Wrote {_cache_path(name)} ({len(abi)} entries)")
+
+
+if __name__ == "__main__":
+    main()
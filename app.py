@@ -1,101 +1,129 @@
 import os
 import io
+import re
 import csv
 import json
 import time
-
-from flask import Flask, jsonify, request, Response, send_file
-from pymongo import MongoClient, ASCENDING, GEOSPHERE
-from pymongo.errors import DuplicateKeyError
+import zlib
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from flask import Blueprint, Flask, current_app, jsonify, make_response, request, Response, \
+    send_file, stream_with_context
+from pymongo import MongoClient, ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError, BulkWriteError, OperationFailure
+from bson import ObjectId
+from bson.errors import InvalidId
+from jobs import JobQueue
+from chain_cache import ChainCache
+from signer import SignerPool, load_keys
+from receipts import ReceiptWaiter
+from lazy import Lazy
+from abis import load_abi
+from reports import ReportCache, ReportRenderer
+from geo import TileCache, bbox_polygon, line_bbox, line_touches, overlaps, parse_bbox, \
+    simplify, tile_bbox, tiles_for_bbox, tolerance_for_zoom, union_bbox
+from migrations import run as run_migrations
+from json_provider import FastJSONProvider
+from feed import TransferFeed
+import compression
+import consistency
+import metrics
+import rollups
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 from datetime import datetime, timedelta
 from functools import wraps
 from web3 import Web3
 from web3.exceptions import ContractLogicError
-from reportlab.pdfgen import canvas as pdf_canvas
+from web3.logs import DISCARD
 from flask_cors import CORS
 
 def normalize_point(d):
     # Accept a full GeoJSON Point
     if isinstance(d, dict) and d.get("type") == "Point" and isinstance(d.get("coordinates"), list):
-        return d
+        coords = d["coordinates"]
     # Or accept a simple {lat, lng}
-    if isinstance(d, dict) and "lat" in d and "lng" in d:
-        return {"type":"Point","coordinates":[d["lng"], d["lat"]]}
-    raise ValueError("location must be GeoJSON Point or {lat,lng}")
-
-app = Flask(__name__)
-CORS(app, supports_credentials=True)  
+    elif isinstance(d, dict) and "lat" in d and "lng" in d:
+        coords = [d["lng"], d["lat"]]
+    else:
+        raise ValueError("location must be GeoJSON Point or {lat,lng}")
+    # a 2dsphere index rejects the whole write for a bad point, so check here
+    if len(coords) != 2 or not all(isinstance(v, (int, float)) and not isinstance(v, bool)
+                                   for v in coords) \
+            or not (-180 <= coords[0] <= 180 and -90 <= coords[1] <= 90):
+        raise ValueError("coordinates must be [lng, lat] with lng in [-180, 180] "
+                         "and lat in [-90, 90]")
+    return {"type": "Point", "coordinates": list(coords)}
+
+def checksum_address(value):
+    if not isinstance(value, str) or not Web3.is_address(value):
+        raise ValueError("newHolder must be an Ethereum address")
+    return Web3.to_checksum_address(value)
+
+# Routes live on a blueprint; create_app() (bottom of this file) builds the
+# Flask app around it.
+api = Blueprint("api", __name__)
 
 # ─── MongoDB Setup ─────────────────────────────────────────────────────────────
-client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
-db     = client["chain_custody_db"]
-
-# Materials
-materials_col = db["materials"]
-materials_col.create_index(
-    [("materialId", ASCENDING)],
-    name="materialId_1",
-    unique=True
-)
-materials_col.create_index(
-    [("location", GEOSPHERE)],
-    name="location_2dsphere_idx"
-)
-
-# Transfers
-transfers_col = db["transfers"]
-transfers_col.create_index(
-    [("materialId", ASCENDING), ("timestamp", ASCENDING)],
-    name="material_ts_idx"
-)
-
-# Waste (low priority for now)
-waste_col = db["waste"]
-waste_col.create_index(
-    [("wasteId", ASCENDING)],
-    name="wasteId_1",
-    unique=True
-)
-history_col = db["waste_history"]
-history_col.create_index(
-    [("wasteId", ASCENDING), ("timestamp", ASCENDING)],
-    name="waste_history_ts_idx"
-)
+# Nothing connects at import time: each handle is built on first use, once per
+# process (so after gunicorn forks).  Indexes are created by `flask migrate`
+# / migrations.py, not here.
+client = Lazy(lambda: MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"),
+                                  event_listeners=[metrics.MongoListener()]))
+db     = Lazy(lambda: client["chain_custody_db"])
+
+materials_col = Lazy(lambda: db["materials"])
+transfers_col = Lazy(lambda: db["transfers"])
+waste_col     = Lazy(lambda: db["waste"])           # Waste (low priority for now)
+history_col   = Lazy(lambda: db["waste_history"])
+jobs_col      = Lazy(lambda: db["jobs"])            # Background write jobs (async mode)
+rollups_col   = Lazy(lambda: db["rollups"])         # Analytics buckets (rollups.py)
+
+# ─── Read Routing ──────────────────────────────────────────────────────────────
+# List, export, map and geo reads go to READ_PREFERENCE (e.g. secondaryPreferred,
+# at most MAX_STALENESS_SECONDS behind); everything else stays on the primary.
+# With routing on, each request runs in a causal session and its response
+# carries X-Consistency-Token: a client that sends it back reads at least its
+# own writes, whichever member answers (see consistency.py).
+READ_PREFERENCE = os.getenv("READ_PREFERENCE", "primary")
+read_pref       = consistency.read_preference(READ_PREFERENCE,     # fails fast on a typo
+                                              int(os.getenv("MAX_STALENESS_SECONDS", "-1")))
+replica_db      = Lazy(lambda: db.with_options(read_preference=read_pref))
+
+def replica(name):
+    # collection `name` for a list/export/map read, in this request's session
+    return consistency.bind(replica_db[name])
 
 # ─── Companies Auth Setup ───────────────────────────────────────────────────────
-companies_col = db["companies"]
-companies_col.create_index(
-    [("companyName", ASCENDING)],
-    name="companyName_1",
-    unique=True
-)
+companies_col = Lazy(lambda: db["companies"])
 
-# Secret for JWT signing
-app.config["SECRET_KEY"] = os.getenv("FLASK_SECRET", "super-secret-key")
+def bearer_company(auth, secret):
+    # (companyName, None) for a valid `Bearer <jwt>` header, else (None, error)
+    parts = auth.split()
+    if len(parts) != 2 or parts[0] != "Bearer":
+        return None, "Missing or invalid auth header"
+    try:
+        payload = jwt.decode(parts[1], secret, algorithms=["HS256"])
+    except jwt.ExpiredSignatureError:
+        return None, "Token expired"
+    except jwt.InvalidTokenError:
+        return None, "Invalid token"
+    return payload["companyName"], None
 
 def require_auth(f):
     @wraps(f)
     def wrapped(*args, **kwargs):
-        auth = request.headers.get("Authorization", "")
-        parts = auth.split()
-        if len(parts) != 2 or parts[0] != "Bearer":
-            return jsonify({"error": "Missing or invalid auth header"}), 401
-        token = parts[1]
-        try:
-            payload = jwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
-            request.companyName = payload["companyName"]
-        except jwt.ExpiredSignatureError:
-            return jsonify({"error": "Token expired"}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({"error": "Invalid token"}), 401
+        company, error = bearer_company(request.headers.get("Authorization", ""),
+                                        current_app.config["SECRET_KEY"])
+        if error:
+            return jsonify({"error": error}), 401
+        request.companyName = company
         return f(*args, **kwargs)
     return wrapped
 
 # ─── Company Registration & Login ──────────────────────────────────────────────
 
-@app.route("/api/companies/register", methods=["POST"])
+@api.route("/api/companies/register", methods=["POST"])
 def register_company():
     data = request.json or {}
     name     = data.get("companyName")
@@ -115,7 +143,7 @@ def register_company():
 
     return jsonify({"message": "company registered"}), 201
 
-@app.route("/api/companies/login", methods=["POST"])
+@api.route("/api/companies/login", methods=["POST"])
 def login_company():
     data = request.json or {}
     name     = data.get("companyName")
@@ -132,105 +160,542 @@ def login_company():
             "companyName": name,
             "exp":         datetime.utcnow() + timedelta(hours=24)
         },
-        app.config["SECRET_KEY"],
+        current_app.config["SECRET_KEY"],
         algorithm="HS256"
     )
     return jsonify({"token": token}), 200
 
 # ─── Web3 / Ethereum Setup ─────────────────────────────────────────────────────
-w3 = Web3(Web3.HTTPProvider(os.getenv("HTTP_PROVIDER", "http://127.0.0.1:8545")))
-w3.eth.default_account = w3.eth.accounts[0]
-
-# ChainCustody contract
-with open("artifacts/contracts/ChainCustody.sol/ChainCustody.json") as f:
-    contract_json    = json.load(f)
-chain_abi          = contract_json["abi"]
-chain_address      = os.getenv("CONTRACT_ADDRESS")
-contract           = w3.eth.contract(address=chain_address, abi=chain_abi)
-
-# WasteChain contract
-with open("artifacts/contracts/WasteChain.sol/WasteChain.json") as f:
-    waste_json       = json.load(f)
-waste_abi           = waste_json["abi"]
-waste_address       = os.getenv("WASTE_CONTRACT_ADDRESS")
-waste_contract      = w3.eth.contract(address=waste_address, abi=waste_abi)
+def connect_web3():
+    w3 = Web3(Web3.HTTPProvider(os.getenv("HTTP_PROVIDER", "http://127.0.0.1:8545")))
+    w3.middleware_onion.add(metrics.web3_middleware, "metrics")
+    w3.eth.default_account = w3.eth.accounts[0]
+    return w3
+
+w3 = Lazy(connect_web3)
+
+# Contracts; ABIs come from the small extracted copies in abi/ (see abis.py)
+chain_address  = os.getenv("CONTRACT_ADDRESS")
+contract       = Lazy(lambda: w3.eth.contract(address=chain_address,
+                                              abi=load_abi("ChainCustody")))
+waste_address  = os.getenv("WASTE_CONTRACT_ADDRESS")
+waste_contract = Lazy(lambda: w3.eth.contract(address=waste_address,
+                                              abi=load_abi("WasteChain")))
+
+# With indexer.py running, Mongo already tracks the chain and reads can skip RPC
+READ_FROM_INDEX = os.getenv("READ_FROM_INDEX", "0") == "1"
+
+# Mirrors `enum Status` in WasteChain.sol; getWaste() returns the ordinal
+WASTE_STATUSES = ["Created", "InTransit", "Delivered", "Disposed"]
+
+def receipt_event(c, name, receipt):
+    # args of the first `name` log `c` emitted in this transaction; the new
+    # chain state is in the receipt already, so no follow-up eth_call
+    for log in c.events[name]().process_receipt(receipt, errors=DISCARD):
+        if log.address == c.address:
+            return log.args
+    return None
+
+# ─── Contract Read Cache ───────────────────────────────────────────────────────
+# getMaterial/getWaste results are reused until the next block (or until we
+# send a transaction for that id ourselves).
+chain_cache = Lazy(lambda: ChainCache(
+    w3,
+    maxsize=int(os.getenv("CHAIN_CACHE_SIZE", "10000")),
+    block_poll_interval=float(os.getenv("CHAIN_CACHE_BLOCK_POLL", "1.0"))
+))
+
+# Other caches of the same reads (asgi.py's AsyncChainCache) register their
+# invalidate here, so a write made through Flask drops their entry too.
+chain_cache_listeners = []
+
+def invalidate_chain_read(key):
+    if chain_cache._lazy_built():     # nothing cached until something has read
+        chain_cache.invalidate(key)
+    for invalidate in chain_cache_listeners:
+        invalidate(key)
+
+def read_material(material_id):
+    # (holder, sequence, id, description); raises ContractLogicError if unknown
+    return chain_cache.get(
+        ("material", material_id),
+        lambda: contract.functions.getMaterial(material_id).call()
+    )
+
+def read_waste(waste_id):
+    # (holder, status, wasteType, hazardClass, quantity, units, sequence)
+    return chain_cache.get(
+        ("waste", waste_id),
+        lambda: waste_contract.functions.getWaste(waste_id).call()
+    )
+
+# ─── Transaction Signing ───────────────────────────────────────────────────────
+# Accounts from SIGNER_KEYS/SIGNER_KEYS_FILE sign locally with their own nonce
+# counters; without keys everything goes through the node's default account.
+signers = Lazy(lambda: SignerPool(w3, load_keys(), default_account=w3.eth.default_account))
+
+# One thread polls the head for every pending transaction in the process and
+# fetches their receipts in a single batched call per block.
+receipts = Lazy(lambda: ReceiptWaiter(
+    w3,
+    confirmations=int(os.getenv("RECEIPT_CONFIRMATIONS", "0")),
+    timeout=int(os.getenv("RECEIPT_TIMEOUT", "120")),
+    poll_interval=float(os.getenv("RECEIPT_POLL_INTERVAL", "0.5")),
+    on_dropped=signers.dropped
+))
+
+# ─── Async Write Mode ──────────────────────────────────────────────────────────
+# Writes block until the receipt is mined unless the client opts in with
+# `?async=1` or `Prefer: respond-async` (ASYNC_WRITES=1 makes it the default).
+# Async writes answer 202 with a job id; poll GET /api/jobs/<id> for the result.
+ASYNC_WRITES = os.getenv("ASYNC_WRITES", "0") == "1"
+jobs = Lazy(lambda: JobQueue(
+    receipts, jobs_col,
+    submitters=int(os.getenv("JOB_SUBMITTERS", "4")),
+    confirmers=int(os.getenv("JOB_CONFIRMERS", "4"))
+))
+
+# Backlog gauges for /metrics; a handle nobody has used yet reads as 0
+# rather than being built (and connecting) by the scrape
+metrics.gauge("pending_transactions", "Transactions waiting for a receipt",
+              lambda: receipts.pending() if receipts._lazy_built() else 0)
+metrics.gauge("jobs_waiting_submit", "Async jobs not yet sent to the node",
+              lambda: jobs.queued()[0] if jobs._lazy_built() else 0)
+metrics.gauge("jobs_waiting_persist", "Mined async jobs not yet written to Mongo",
+              lambda: jobs.queued()[1] if jobs._lazy_built() else 0)
+
+def wants_async():
+    if "respond-async" in request.headers.get("Prefer", ""):
+        return True
+    flag = request.args.get("async")
+    if flag is not None:
+        return flag.lower() in ("1", "true", "yes")
+    return ASYNC_WRITES
+
+def accepted(kind, subject, submit, persist):
+    job_id = jobs.enqueue(kind, subject, submit, persist)
+    return jsonify({"jobId": job_id, "status": "pending"}), 202, \
+        {"Location": f"/api/jobs/{job_id}"}
+
+@api.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    # read in the request session: a finished job's token covers its writes
+    job = jobs.get(job_id, session=consistency.session())
+    if not job:
+        return jsonify({"error": "Not found"}), 404
+    return jsonify(job), 200
 
 # ─── Sample Users Endpoint ──────────────────────────────────────────────────────
-@app.route("/api/users", methods=["GET"])
+@api.route("/api/users", methods=["GET"])
 def list_users():
     return jsonify([
         {"userId": "1", "username": "alice", "role": "manufacturer"},
         {"userId": "2", "username": "bob",   "role": "transporter"},
     ])
 
+# ─── Streaming / Paging Helpers ────────────────────────────────────────────────
+MAX_PAGE_SIZE     = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def stream_json(docs, ndjson=False):
+    # Serialise documents as the cursor yields them, flushing ~64 KB at a time,
+    # so the full result set is never held in memory.
+    def generate():
+        buf, size = ["" if ndjson else "["], 0
+        for i, doc in enumerate(docs):
+            part = current_app.json.dumps(doc)
+            if ndjson:
+                part += "\n"
+            elif i:
+                part = "," + part
+            buf.append(part)
+            size += len(part)
+            if size >= STREAM_CHUNK_SIZE:
+                yield "".join(buf)
+                buf, size = [], 0
+        if not ndjson:
+            buf.append("]")
+        yield "".join(buf)
+
+    mimetype = "application/x-ndjson" if ndjson else "application/json"
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+def page_limit():
+    # `?limit=` turns a streamed listing into a bounded page (None = stream all)
+    limit = request.args.get("limit", type=int)
+    if limit is None:
+        return None
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def wants_ndjson():
+    return request.args.get("format") == "ndjson" or \
+        "application/x-ndjson" in request.headers.get("Accept", "")
+
+# ─── Field Selection ───────────────────────────────────────────────────────────
+# ?fields=materialId,status,metadata.grade becomes the Mongo projection, so
+# fields nobody asked for are neither read nor serialised.  A handler that
+# needs a field for itself (a paging cursor, the chain write-back) adds it
+# to the projection and drops it again before responding.
+FIELD_NAME = re.compile(r"[A-Za-z_]\w*(\.[A-Za-z_]\w*)*")   # dotted paths, no operators
+
+def parse_fields(value):
+    """["a", "b.c"] from "a,b.c"; None (everything) without ?fields=;
+    ValueError on a name that isn't a plain field path."""
+    if value is None:
+        return None
+    fields = [f.strip() for f in value.split(",") if f.strip()]
+    if not fields:
+        raise ValueError("fields must name at least one field")
+    for f in fields:
+        if not FIELD_NAME.fullmatch(f):
+            raise ValueError(f"invalid field {f!r}")
+    return fields
+
+def requested_fields():
+    return parse_fields(request.args.get("fields"))
+
+def field_projection(fields, needed=()):
+    """(projection, fields to drop before responding) for the requested
+    fields plus those the handler needs itself."""
+    if fields is None:
+        return {"_id": 0}, ()
+    drop  = [n for n in needed if not any(f == n or f.startswith(n + ".") for f in fields)]
+    paths = set(fields) | set(needed)
+    # Mongo rejects a path next to its own parent ("metadata", "metadata.grade")
+    proj = {p: 1 for p in sorted(paths)
+            if not any(p.startswith(q + ".") for q in paths)}
+    proj["_id"] = 0
+    return proj, drop
+
+def wanted(fields, name):
+    return fields is None or name in fields
+
+def without(doc, drop):
+    for name in drop:
+        doc.pop(name, None)
+    return doc
+
+# ─── Conditional GETs ──────────────────────────────────────────────────────────
+# lastSequence / sequence go up on every change, so they make strong ETags.
+# A material also counts `revision`, bumped when merge_indexed_material
+# adds fields the chain doesn't track (the sequence can't move for those:
+# it mirrors the contract's).
+# The sequence is read with a covered query on a (id, sequence) index before
+# the handler runs; a matching If-None-Match is answered with 304 without
+# touching the full document, the transfers or the contract.  Mongo's
+# sequence is the version: a change the chain has seen but Mongo hasn't yet
+# (indexer lag) shows up once Mongo catches up.  It is read on the primary in
+# the request's session, so a body read from a secondary is never older.
+def covered_first(col, query, projection, index):
+    # first match through `index`; before migrations.py has built it the
+    # hint fails, so fall back to the planner rather than failing every GET
+    def find():
+        return col.find(query, projection, session=consistency.session()).limit(1)
+    try:
+        return next(find().hint(index), None)
+    except OperationFailure:
+        return next(find(), None)
+
+def material_version(m):
+    # "<lastSequence>" or, once merged, "<lastSequence>.<revision>"
+    if m is None:
+        return None
+    if m.get("revision"):
+        return f"{m.get('lastSequence')}.{m['revision']}"
+    return m.get("lastSequence")
+
+def material_sequence(material_id):
+    return material_version(covered_first(
+        materials_col, {"materialId": material_id},
+        {"_id": 0, "lastSequence": 1, "revision": 1}, "materialId_lastSequence_revision_idx"))
+
+def waste_sequence(waste_id):
+    w = covered_first(waste_col, {"wasteId": waste_id},
+                      {"_id": 0, "sequence": 1}, "wasteId_sequence_idx")
+    return w and w.get("sequence")
+
+def etag_from(sequence_of):
+    def decorator(f):
+        @wraps(f)
+        def wrapped(**kwargs):
+            (key,) = kwargs.values()
+            seq = sequence_of(key)
+            if seq is None:
+                return f(**kwargs)        # unknown here; let the handler decide
+            etag = f"{key}-{seq}"
+            if request.if_none_match.contains_weak(etag):   # W/ once compressed
+                resp = Response(status=304)
+            else:
+                resp = make_response(f(**kwargs))
+                if resp.status_code != 200:
+                    return resp
+            if "ETag" not in resp.headers:   # set by a handler that found a newer version
+                resp.set_etag(etag)
+            resp.headers["Cache-Control"] = "no-cache"   # always revalidate
+            return resp
+        return wrapped
+    return decorator
+
 # ─── Materials CRUD Endpoints ──────────────────────────────────────────────────
-@app.route("/api/materials", methods=["GET"])
+@api.route("/api/materials", methods=["GET"])
 def get_materials():
-    docs = list(materials_col.find({}, {"_id": 0}))
-    return jsonify(docs), 200
+    # keyset pagination on materialId_1: ?after=<materialId>&limit=<n>
+    query = {}
+    for field in ("status", "companyName"):
+        if request.args.get(field):
+            query[field] = request.args[field]
+    after = request.args.get("after")
+    if after:
+        query["materialId"] = {"$gt": after}
+    try:
+        fields = requested_fields()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-@app.route("/api/materials", methods=["POST"])
-@require_auth
-def create_material():
-    data = request.json or {}
-    if "materialId" not in data or "description" not in data:
-        return jsonify({"error": "materialId and description are required"}), 400
+    limit = page_limit()
+    # a page needs its last materialId for the cursor
+    projection, drop = field_projection(fields, () if limit is None else ("materialId",))
+    cursor = replica("materials").find(query, projection)\
+                                 .sort("materialId", ASCENDING)\
+                                 .hint("materialId_1")
+    if limit is None:
+        return stream_json(cursor, ndjson=wants_ndjson()), 200
+
+    docs = list(cursor.limit(limit))
+    next_cursor = docs[-1]["materialId"] if len(docs) == limit else None
+    docs = [without(d, drop) for d in docs]
+    resp = stream_json(docs, ndjson=True) if wants_ndjson() else jsonify(docs)
+    if next_cursor:
+        resp.headers["X-Next-Cursor"] = next_cursor
+    return resp, 200
+
+def build_material_doc(data, company_name, holder):
+    # shared by the single and batch create routes; raises ValueError on bad input
+    if not isinstance(data, dict) or "materialId" not in data or "description" not in data:
+        raise ValueError("materialId and description are required")
+    # both go to initializeMaterial as strings and key the batch's duplicate check
+    if not all(isinstance(data[k], str) and data[k] for k in ("materialId", "description")):
+        raise ValueError("materialId and description must be non-empty strings")
 
-    # build doc
     new_doc = {
         "materialId":   data["materialId"],
         "description":  data["description"],
         "metadata":     data.get("metadata", {}),
-        "currentHolder": w3.eth.default_account,
+        "currentHolder": holder,
         "lastSequence": 0,
         "status":       "Created",
         "createdAt":    int(time.time()),
-        "companyName":  request.companyName   # if you’re stamping companies
+        "companyName":  company_name   # if you’re stamping companies
     }
     loc = data.get("location")
     if loc is not None:
-        try:
-            new_doc["location"] = normalize_point(loc)
-        except ValueError as e:
-            return jsonify({"error": str(e)}), 400
+        new_doc["location"] = normalize_point(loc)
+    return new_doc
+
+def merge_indexed_material(doc):
+    # indexer.py saw MaterialInitialized before we inserted: keep its chain
+    # state and add the fields only the API knows about; a new revision, so
+    # ETags and cached reports of the indexed record go stale
+    merged = materials_col.find_one_and_update(
+        {"materialId": doc["materialId"]},
+        {"$set": {k: doc[k] for k in ("metadata", "companyName", "location") if k in doc},
+         "$inc": {"revision": 1}},
+        return_document=ReturnDocument.AFTER,
+        session=consistency.session()
+    )
+    merged["_id"] = str(merged["_id"])
+    return merged
 
-    # ── 1A. initialize on‑chain ─────────────────
+@api.route("/api/materials", methods=["POST"])
+@require_auth
+def create_material():
+    data = request.json or {}
+
+    # build doc
+    sender = signers.pick()
     try:
-        tx = contract.functions.initializeMaterial(
+        new_doc = build_material_doc(data, request.companyName, holder=sender)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # ── 1A. initialize on‑chain ─────────────────
+    def submit():
+        return signers.send(contract.functions.initializeMaterial(
          new_doc["materialId"],          # 1️⃣ first string
          new_doc["description"]          # 2️⃣ second string
-     ).transact({"from": w3.eth.default_account})
-        w3.eth.wait_for_transaction_receipt(tx)
+     ), sender)
+
+    # insert into Mongo
+    def persist(receipt):
+        try:
+            result = materials_col.insert_one(new_doc, session=consistency.session())
+        except DuplicateKeyError:
+            return merge_indexed_material(new_doc)
+        new_doc["_id"] = str(result.inserted_id)   # make _id JSON‑serialisable
+        return new_doc
+
+    if wants_async():
+        if materials_col.find_one({"materialId": new_doc["materialId"]}, {"_id": 1}):
+            return jsonify({"error": "material already exists"}), 409
+        return accepted("create_material", new_doc["materialId"], submit, persist)
+
+    try:
+        receipt = receipts.wait(submit())
     except ContractLogicError as e:
         return jsonify({"error": "on‑chain init failed", "reason": str(e)}), 400
     # ────────────────────────────────────────────
 
-    # insert into Mongo
-    result = materials_col.insert_one(new_doc)
-    new_doc["_id"] = str(result.inserted_id)   # make _id JSON‑serialisable
-    return jsonify(new_doc), 201
+    return jsonify(persist(receipt)), 201
+
+
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+
+@api.route("/api/materials/batch", methods=["POST"])
+@require_auth
+def create_materials_batch():
+    items = request.json
+    if isinstance(items, dict):
+        items = items.get("materials")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "expected a non-empty array of materials"}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"at most {MAX_BATCH_SIZE} materials per batch"}), 413
+
+    results = [None] * len(items)
+    docs    = {}                                  # index -> doc still in flight
+
+    # 1. Validate every item and drop duplicates before touching the chain
+    for i, data in enumerate(items):
+        try:
+            # spread the batch across the signer pool
+            doc = build_material_doc(data, request.companyName, holder=signers.pick())
+        except ValueError as e:
+            results[i] = {"index": i, "status": "failed", "error": str(e)}
+            continue
+        docs[i] = doc
+
+    seen = {}
+    for i, doc in list(docs.items()):
+        mid = doc["materialId"]
+        if mid in seen:
+            results[i] = {"index": i, "materialId": mid, "status": "failed",
+                          "error": "duplicate materialId in batch"}
+            del docs[i]
+        else:
+            seen[mid] = i
+    for m in materials_col.find({"materialId": {"$in": list(seen)}}, {"materialId": 1, "_id": 0}):
+        i = seen[m["materialId"]]
+        results[i] = {"index": i, "materialId": m["materialId"], "status": "failed",
+                      "error": "material already exists"}
+        del docs[i]
+
+    # 2. Send every initializeMaterial back-to-back; the signer pool hands
+    #    out nonces locally so nothing waits on the node between sends.  Any
+    #    failure fails just that item: the ones already sent are on-chain and
+    #    still need their documents
+    sent = {}                                     # tx hash -> index
+    for i, doc in list(docs.items()):
+        try:
+            tx = signers.send(contract.functions.initializeMaterial(
+                doc["materialId"], doc["description"]
+            ), doc["currentHolder"])
+        except Exception as e:
+            results[i] = {"index": i, "materialId": doc["materialId"],
+                          "status": "failed", "error": str(e)}
+            del docs[i]
+            continue
+        sent[tx] = i
+
+    # 3. Wait for all receipts together
+    mined     = receipts.wait_all(list(sent))
+    to_insert = []
+    for tx, i in sent.items():
+        doc     = docs[i]
+        receipt = mined.get(tx)
+        if receipt is None or receipt.status != 1:
+            results[i] = {"index": i, "materialId": doc["materialId"], "status": "failed",
+                          "txHash": tx.hex(),
+                          "error": "timed out waiting for receipt" if receipt is None
+                                   else "transaction reverted"}
+            continue
+        doc["txHash"] = tx.hex()
+        to_insert.append(i)
+
+    # 4. One insert_many for everything that made it on-chain
+    if to_insert:
+        failed = {}
+        try:
+            materials_col.insert_many([docs[i] for i in to_insert], ordered=False,
+                                      session=consistency.session())
+        except BulkWriteError as e:
+            for err in e.details.get("writeErrors", []):
+                i = to_insert[err["index"]]
+                if err["code"] == 11000:
+                    # mined by us, but indexer.py inserted the record first
+                    docs[i] = merge_indexed_material(docs[i])
+                else:
+                    failed[i] = err.get("errmsg", "insert failed")
+        for i in to_insert:
+            doc = docs[i]
+            if i in failed:
+                results[i] = {"index": i, "materialId": doc["materialId"], "status": "failed",
+                              "txHash": doc["txHash"], "error": failed[i]}
+            else:
+                doc["_id"] = str(doc["_id"])
+                results[i] = {"index": i, "materialId": doc["materialId"],
+                              "status": "created", "txHash": doc["txHash"], "material": doc}
+
+    created = sum(1 for r in results if r["status"] == "created")
+    return jsonify({
+        "created": created,
+        "failed":  len(results) - created,
+        "results": results
+    }), 201 if created == len(results) else 207
+
 
+# what get_material compares with the chain before writing back, and the
+# revision its ETag needs
+MATERIAL_CHAIN_FIELDS = ("currentHolder", "lastSequence", "revision")
 
-@app.route("/api/materials/<material_id>", methods=["GET"])
+@api.route("/api/materials/<material_id>", methods=["GET"])
+@etag_from(material_sequence)
 def get_material(material_id):
-    m = materials_col.find_one({"materialId": material_id}, {"_id": 0})
-    if not m:
+    try:
+        fields = requested_fields()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    projection, drop = field_projection(fields, () if READ_FROM_INDEX else MATERIAL_CHAIN_FIELDS)
+    m = materials_col.find_one({"materialId": material_id}, projection)
+    if m is None:
         return jsonify({"error": "Not found"}), 404
+    if READ_FROM_INDEX:
+        return jsonify(m), 200
 
     try:
-        holder, seq, _, _ = contract.functions.getMaterial(material_id).call()
+        holder, seq, _, _ = read_material(material_id)
     except ContractLogicError:
-        return jsonify(m), 200      # Mongo record only
-
+        return jsonify(without(m, drop)), 200      # Mongo record only
+
+    # The chain only wins when it is ahead: a cached read can predate a
+    # transfer another worker or indexer.py has already stored, so older
+    # chain state is ignored, and the write-back is sequence-guarded like
+    # transfer_update() so it can never move a record backwards.
+    if seq <= m.get("lastSequence", 0):
+        return jsonify(without(m, drop)), 200
     materials_col.update_one(
-        {"materialId": material_id},
-        {"$set": {"currentHolder": holder, "lastSequence": seq}}
+        {"materialId": material_id, "lastSequence": {"$lt": seq}},
+        {"$set": {"currentHolder": holder, "lastSequence": seq}},
+        session=consistency.session()
     )
     m.update({"currentHolder": holder, "lastSequence": seq})
-    return jsonify(m), 200
+    etag = f"{material_id}-{material_version(m)}"    # this body's version, not the one read first
+    resp = jsonify(without(m, drop))
+    resp.set_etag(etag)
+    return resp, 200
 
 
-@app.route("/api/materials/<material_id>/status", methods=["GET"])
+@api.route("/api/materials/<material_id>/status", methods=["GET"])
+@etag_from(material_sequence)
 def get_status(material_id):
     m = materials_col.find_one(
         {"materialId": material_id},
@@ -244,103 +709,150 @@ def to_point(d):
     # helper to convert {lat, lng} → GeoJSON Point
     return {"type": "Point", "coordinates": [d["lng"], d["lat"]]}
 
-@app.route("/api/materials/<material_id>/transfer", methods=["POST"])
+# Transfer building blocks, shared with the async routes in asgi.py
+def parse_transfer(data):
+    # (newHolder, from, to, description); ValueError with the message for a 400
+    from_info = data.get("from")  # {"lat": ..., "lng": ...}
+    to_info   = data.get("to")    # {"lat": ..., "lng": ...}
+    if not data.get("newHolder") or not from_info or not to_info:
+        raise ValueError("newHolder, from and to are all required")
+    description = data.get("description", "")
+    if not isinstance(description, str):
+        raise ValueError("description must be a string")
+    # Normalize inputs: full GeoJSON or {lat,lng}
+    return (checksum_address(data["newHolder"]), normalize_point(from_info),
+            normalize_point(to_info), description)
+
+def transfer_record(material_id, company_name, pt_from, pt_to, description, tx_hash):
+    # one transfer step for the transfers collection; each point is stored
+    # once, the point–line–point path is rebuilt on read (with_transfer_path)
+    return {
+        "materialId":  material_id,
+        "companyName": company_name,
+        "from":        pt_from,
+        "to":          pt_to,
+        "timestamp":   int(time.time()),
+        "description": description,
+        "status":      "In Transit",
+        "txHash":      tx_hash
+    }
+
+def with_transfer_path(t):
+    # the transferPath GeometryCollection clients get, built from from/to
+    # (it reuses the point dicts, so it costs three small dicts per step)
+    frm, to = t["from"], t["to"]
+    t["transferPath"] = {
+        "type": "GeometryCollection",
+        "geometries": [
+            frm,
+            {"type": "LineString", "coordinates": [frm["coordinates"], to["coordinates"]]},
+            to
+        ]
+    }
+    return t
+
+def transfer_projection(fields):
+    """(projection, fields to drop, rebuild transferPath?) for ?fields= on
+    a transfer listing: asking for transferPath reads from/to instead."""
+    if fields is None:
+        return {"_id": 0, "transferPath": 0}, (), True
+    stored = [f for f in fields if f.split(".")[0] != "transferPath"]
+    path   = len(stored) < len(fields)
+    projection, drop = field_projection(stored, ("from", "to") if path else ())
+    return projection, drop, path
+
+def transfer_update(material_id, event, tx_hash):
+    # (filter, update) moving a material to the holder/sequence in its
+    # MaterialTransferred event; matches nothing if indexer.py got there first
+    return (
+        {"materialId": material_id, "lastSequence": {"$lt": event.sequence}},
+        {"$set": {
+            "currentHolder": event.to,
+            "lastSequence":  event.sequence,
+            "status":        "In Transit",
+            "txHash":        tx_hash
+        }}
+    )
+
+@api.route("/api/materials/<material_id>/transfer", methods=["POST"])
 @require_auth
 def transfer_material(material_id):
-    data = request.json or {}
-
-    # 1. Validate inputs
-    new_holder = data.get("newHolder")
-    from_info  = data.get("from")  # {"lat": ..., "lng": ...}
-    to_info    = data.get("to")    # {"lat": ..., "lng": ...}
-    if not new_holder or not from_info or not to_info:
-        return jsonify({"error": "newHolder, from and to are all required"}), 400
+    # 1. Validate everything before the chain sees anything
+    try:
+        new_holder, pt_from, pt_to, description = parse_transfer(request.json or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     # 2. Look up current holder
-    existing = materials_col.find_one({"materialId": material_id}, {"_id": 0})
+    existing = materials_col.find_one({"materialId": material_id},
+                                      {"_id": 0, "currentHolder": 1})
     if not existing:
         return jsonify({"error": "Not found"}), 404
-    prev_holder = existing["currentHolder"]
+    prev_holder  = existing["currentHolder"]
+    company_name = request.companyName
 
     # 3. On‑chain transfer
+    def submit():
+        # must come from the current holder; local key if we have one
+        return signers.send(
+            contract.functions.transferMaterial(material_id, new_holder), prev_holder
+        )
+
+    def persist(receipt):
+        # 4. New holder and sequence from the MaterialTransferred log
+        event   = receipt_event(contract, "MaterialTransferred", receipt)
+        tx_hash = receipt.transactionHash.hex()
+
+        # 5. Drop the cached chain read before the sequence moves, so nobody
+        #    pairs the new sequence with the old holder.  Then log the
+        #    transfer step (point–line–point), so an ETag for the new
+        #    sequence never covers a transfer list without it
+        invalidate_chain_read(("material", material_id))
+        record = transfer_record(material_id, company_name, pt_from, pt_to, description,
+                                 tx_hash)
+        transfers_col.insert_one(record, session=consistency.session())
+
+        # 6. One sequence-guarded update that also returns the fresh record
+        material = materials_col.find_one_and_update(
+            *transfer_update(material_id, event, tx_hash),
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+            session=consistency.session()
+        )
+        feed.poke()
+        rollups.apply(rollups_col, rollups.transfer_ops(record), consistency.session())
+        return material or materials_col.find_one({"materialId": material_id}, {"_id": 0})
+
+    if wants_async():
+        return accepted("transfer_material", material_id, submit, persist)
+
     try:
-        tx_hash = contract.functions.transferMaterial(material_id, new_holder)\
-                          .transact({"from": prev_holder})
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+        receipt = receipts.wait(submit())
     except ContractLogicError as e:
         return jsonify({"error": "Transfer failed", "reason": str(e)}), 409
+    if receipt.status != 1:
+        return jsonify({"error": "Transfer failed", "reason": "transaction reverted"}), 409
 
-    # 4. Fetch updated on‑chain state
-    #    returns: (holder, sequence, description, status)
-    holder, seq, _, _ = contract.functions.getMaterial(material_id).call()
+    return jsonify(persist(receipt)), 200
 
-    # 5. Update the Mongo “materials” record
-    materials_col.update_one(
-        {"materialId": material_id},
-        {"$set": {
-            "currentHolder": holder,
-            "lastSequence": seq,
-            "txHash": receipt.transactionHash.hex()
-        }}
-    )
 
-    # 6. GeoJSON helpers
-    # Normalize inputs: full GeoJSON or {lat,lng}
+
+@api.route("/api/materials/<material_id>/transfers", methods=["GET"])
+@etag_from(material_sequence)
+def list_transfers(material_id):
     try:
-        pt_from = normalize_point(from_info)
-        pt_to   = normalize_point(to_info)
+        projection, drop, path = transfer_projection(requested_fields())
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
-
-    # Build the line + collection exactly as before
-    line = {
-        "type": "LineString",
-        "coordinates": [pt_from["coordinates"], pt_to["coordinates"]]
-    }
-    path = {
-        "type": "GeometryCollection",
-        "geometries": [pt_from, line, pt_to]
-    }
-
-    # 7. Log the transfer step (point–line–point)
-    transfers_col.insert_one({
-        "materialId":   material_id,
-        "companyName":  request.companyName,
-        "from":         pt_from,
-        "to":           pt_to,
-        "transferPath": path,
-        "timestamp":    int(time.time()),
-        "description":  data.get("description", ""),
-        "status":       "In Transit",
-        "txHash":       receipt.transactionHash.hex()
-    })
-
-    # 8. Return the fresh material record
-    materials_col.update_one(
-        {"materialId": material_id},
-        {"$set": {"status": "In Transit"}}
-    )
-
-    updated = materials_col.find_one({"materialId": material_id}, {"_id": 0})
-
-
-    return jsonify(updated), 200
-
-
-
-@app.route("/api/materials/<material_id>/transfers", methods=["GET"])
-def list_transfers(material_id):
-    if not materials_col.find_one({"materialId": material_id}):
+    if not replica("materials").find_one({"materialId": material_id}, {"_id": 1}):
         return jsonify({"error": "Not found"}), 404
-    history = list(transfers_col.find(
-        {"materialId": material_id},
-        {"_id": 0}
-    ))
+    history = [without(with_transfer_path(t) if path else t, drop)
+               for t in replica("transfers").find({"materialId": material_id}, projection)]
     return jsonify(history), 200
 
-@app.route("/api/materials/<material_id>/export/csv", methods=["GET"])
+@api.route("/api/materials/<material_id>/export/csv", methods=["GET"])
 def export_csv(material_id):
-    m = materials_col.find_one({"materialId": material_id}, {"_id": 0})
+    m = replica("materials").find_one({"materialId": material_id}, {"_id": 0})
     if not m:
         return jsonify({"error": "Not found"}), 404
 
@@ -365,183 +877,421 @@ def export_csv(material_id):
         headers={"Content-Disposition": f"attachment;filename={material_id}.csv"}
     ), 200
 
-@app.route("/api/materials/<material_id>/export/pdf", methods=["GET"])
+# Custody reports render in a process pool and are cached on disk by
+# (materialId, lastSequence); see reports.py.
+reports = Lazy(lambda: ReportRenderer(
+    ReportCache(os.getenv("REPORT_CACHE_DIR", "report_cache"),
+                max_bytes=int(os.getenv("REPORT_CACHE_MB", "512")) << 20),
+    workers=int(os.getenv("REPORT_WORKERS", "2")),
+    timeout=int(os.getenv("REPORT_TIMEOUT", "60"))
+))
+
+@api.route("/api/materials/<material_id>/export/pdf", methods=["GET"])
 def export_pdf(material_id):
-    m = materials_col.find_one({"materialId": material_id}, {"_id": 0})
+    m = replica("materials").find_one({"materialId": material_id}, {"_id": 0})
     if not m:
         return jsonify({"error": "Not found"}), 404
 
-    buffer = io.BytesIO()
-    c = pdf_canvas(buffer)
-    text = c.beginText(40, 800)
-    text.setFont("Helvetica-Bold", 14)
-    text.textLine(f"Material Report: {material_id}")
-    text.setFont("Helvetica", 12)
-    for line in [
-        f"Description   : {m['description']}",
-        f"Current Holder: {m['currentHolder']}",
-        f"Sequence      : {m['lastSequence']}",
-        f"Status        : {m['status']}",
-        f"Transaction   : {m.get('txHash','')}",
-        f"Metadata      : {json.dumps(m['metadata'])}"
-    ]:
-        text.textLine(line)
-    c.drawText(text)
-    c.showPage()
-    c.save()
-    buffer.seek(0)
+    # served from the on-disk cache unless lastSequence moved since the last render
+    try:
+        report = reports.open(m, lambda: list(replica("transfers").find(
+            {"materialId": material_id},
+            {"_id": 0, "transferPath": 0}
+        ).sort("timestamp", ASCENDING)))
+    except FutureTimeout:
+        return jsonify({"error": "report is still rendering, retry shortly"}), 503, \
+            {"Retry-After": "5"}
     return send_file(
-        buffer,
+        report,
         as_attachment=True,
         download_name=f"{material_id}.pdf",
         mimetype="application/pdf"
     ), 200
 
+# ─── Fleet Export ──────────────────────────────────────────────────────────────
+# Every material plus its transfer history, for audits.  Two index-ordered
+# cursors (materials by materialId, transfers by materialId+timestamp) are
+# merge-joined as they stream, so memory stays flat however many rows match.
+# a filtered export fetches transfers by materialId (material_ts_idx) for up
+# to this many materials; more than that and one pass over the window is cheaper
+EXPORT_MAX_IDS = int(os.getenv("EXPORT_MAX_IDS", "10000"))
+
+EXPORT_COLUMNS = ["record", "materialId", "description", "companyName", "status",
+                  "currentHolder", "lastSequence", "timestamp", "lng", "lat",
+                  "fromLng", "fromLat", "toLng", "toLat", "txHash", "metadata"]
+
+def coords(point):
+    lng, lat = (point or {}).get("coordinates") or (None, None)
+    return lng, lat
+
+def with_transfers(materials, transfers):
+    # both cursors are sorted by materialId; yields (material, [transfers])
+    pending = next(transfers, None)
+    for m in materials:
+        mid = m["materialId"]
+        while pending is not None and pending["materialId"] < mid:
+            pending = next(transfers, None)   # transfer of a filtered-out material
+        history = []
+        while pending is not None and pending["materialId"] == mid:
+            history.append(pending)
+            pending = next(transfers, None)
+        yield m, history
+
+def export_csv_chunks(pairs):
+    buf    = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for m, history in pairs:
+        writer.writerow([
+            "material", m["materialId"], m.get("description", ""), m.get("companyName", ""),
+            m.get("status", ""), m.get("currentHolder", ""), m.get("lastSequence", ""),
+            m.get("createdAt", ""), *coords(m.get("location")), "", "", "", "",
+            m.get("txHash", ""), json.dumps(m.get("metadata", {}))
+        ])
+        for t in history:
+            writer.writerow([
+                "transfer", t["materialId"], t.get("description", ""), t.get("companyName", ""),
+                t.get("status", ""), "", "", t.get("timestamp", ""), "", "",
+                *coords(t.get("from")), *coords(t.get("to")), t.get("txHash", ""), ""
+            ])
+        if buf.tell() >= STREAM_CHUNK_SIZE:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+def export_ndjson_chunks(pairs):
+    buf, size = [], 0
+    for m, history in pairs:
+        m["transfers"] = history
+        line = current_app.json.dumps(m) + "\n"
+        buf.append(line)
+        size += len(line)
+        if size >= STREAM_CHUNK_SIZE:
+            yield "".join(buf)
+            buf, size = [], 0
+    yield "".join(buf)
+
+def gzip_chunks(chunks):
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)   # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = z.compress(chunk.encode())
+        if data:
+            yield data
+    yield z.flush()
+
+@api.route("/api/materials/export/csv", methods=["GET"], defaults={"fmt": "csv"})
+@api.route("/api/materials/export/ndjson", methods=["GET"], defaults={"fmt": "ndjson"})
+def export_materials(fmt):
+    # Filters: ?companyName=&status= on materials, ?since=&until= (unix seconds)
+    # on transfer timestamps; materials created after `until` are left out.
+    query = {}
+    for field in ("status", "companyName"):
+        if request.args.get(field):
+            query[field] = request.args[field]
+    since = request.args.get("since", type=int)
+    until = request.args.get("until", type=int)
+    window = {}
+    if since is not None:
+        window["$gte"] = since
+    if until is not None:
+        window["$lte"] = until
+        query["createdAt"] = {"$lte": until}
+
+    materials = replica("materials").find(query, {"_id": 0})\
+                                    .sort("materialId", ASCENDING)\
+                                    .hint("materialId_1")\
+                                    .batch_size(1000)
+    transfer_query = {"timestamp": window} if window else {}
+    if query:
+        ids = [m["materialId"] for m in replica("materials")
+               .find(query, {"_id": 0, "materialId": 1}).limit(EXPORT_MAX_IDS + 1)]
+        if len(ids) <= EXPORT_MAX_IDS:
+            transfer_query["materialId"] = {"$in": ids}
+    transfers = replica("transfers").find(transfer_query, {"_id": 0, "transferPath": 0})\
+                                    .sort([("materialId", ASCENDING), ("timestamp", ASCENDING)])\
+                                    .hint("material_ts_idx")\
+                                    .batch_size(1000)
+    pairs = with_transfers(materials, transfers)
+
+    if fmt == "csv":
+        chunks, mimetype = export_csv_chunks(pairs), "text/csv"
+    else:
+        chunks, mimetype = export_ndjson_chunks(pairs), "application/x-ndjson"
+
+    headers = {"Content-Disposition": f"attachment;filename=materials.{fmt}",
+               "Vary": "Accept-Encoding"}
+    # q-values count: "gzip;q=0" is a refusal, not an offer
+    if compression.negotiate(request.headers.get("Accept-Encoding"), ("gzip",)):
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers), 200
+
 # ─── Hazardous‑Waste Endpoints ────────────────────────────────────────────────
-@app.route("/api/waste", methods=["POST"])
+@api.route("/api/waste", methods=["POST"])
 def create_waste():
     data = request.json or {}
     required = ["wasteId", "wasteType", "hazardClass", "quantity", "units"]
     if not all(k in data for k in required):
         return jsonify({"error": "Missing one of " + ", ".join(required)}), 400
-
-    # on‑chain call
+    if not all(isinstance(data[k], str) and data[k]
+               for k in ("wasteId", "wasteType", "hazardClass", "units")):
+        return jsonify({"error": "wasteId, wasteType, hazardClass and units must be "
+                                 "non-empty strings"}), 400
     try:
-        tx = waste_contract.functions.createWaste(
+        quantity = int(data["quantity"])
+    except (TypeError, ValueError):
+        quantity = -1
+    if quantity < 0:
+        return jsonify({"error": "quantity must be a non-negative integer"}), 400
+
+    # on-chain call (pool accounts need the GENERATOR role)
+    sender = signers.pick()
+    def submit():
+        return signers.send(waste_contract.functions.createWaste(
             data["wasteId"],
             data["wasteType"],
             data["hazardClass"],
-            int(data["quantity"]),
+            quantity,
             data["units"]
-        ).transact({"from": w3.eth.default_account})
-        w3.eth.wait_for_transaction_receipt(tx)
-    except Exception as e:
-        return jsonify({"error": "on‑chain create failed", "reason": str(e)}), 400
-
-    doc = {
-        "wasteId":       data["wasteId"],
-        "wasteType":     data["wasteType"],
-        "hazardClass":   data["hazardClass"],
-        "quantity":      int(data["quantity"]),
-        "units":         data["units"],
-        "currentHolder": w3.eth.default_account,
-        "status":        "Created",
-        "sequence":      1,
-        "createdAt":     int(time.time())
-    }
-
-    result = waste_col.insert_one(doc)
-    doc["_id"] = str(result.inserted_id)   # keep _id but as string
+        ), sender)
+
+    def persist(receipt):
+        doc = {
+            "wasteId":       data["wasteId"],
+            "wasteType":     data["wasteType"],
+            "hazardClass":   data["hazardClass"],
+            "quantity":      quantity,
+            "units":         data["units"],
+            "currentHolder": sender,
+            "status":        "Created",
+            "sequence":      1,
+            "createdAt":     int(time.time())
+        }
 
-    return jsonify(doc), 201
+        try:
+            result = waste_col.insert_one(doc, session=consistency.session())
+        except DuplicateKeyError:
+            # indexer.py recorded the Created event first (and its rollups);
+            # its copy is the same
+            return waste_col.find_one({"wasteId": doc["wasteId"]}, {"_id": 0})
+        rollups.apply(rollups_col, rollups.waste_created_ops(doc), consistency.session())
+        doc["_id"] = str(result.inserted_id)   # keep _id but as string
+        return doc
+
+    if wants_async():
+        return accepted("create_waste", data["wasteId"], submit, persist)
 
+    try:
+        receipt = receipts.wait(submit())
+    except Exception as e:
+        return jsonify({"error": "on‑chain create failed", "reason": str(e)}), 400
+    if receipt.status != 1:
+        return jsonify({"error": "on‑chain create failed",
+                        "reason": "transaction reverted"}), 400
+
+    return jsonify(persist(receipt)), 201
+
+
+# WasteChain's allowed moves: action -> statuses it can start from
+WASTE_TRANSITIONS = {
+    "transfer": ("Created", "Delivered"),
+    "deliver":  ("InTransit",),
+    "dispose":  ("Delivered",)
+}
+
+def check_waste_step(waste_id, action):
+    """(holder, None) if `action` is allowed now, else (None, error response).
+
+    WasteChain only lets the current holder move a record, so that's the
+    sender; a step the contract would refuse is turned away here instead of
+    after a gas estimate."""
+    w = waste_col.find_one({"wasteId": waste_id}, {"currentHolder": 1, "status": 1, "_id": 0})
+    if not w:
+        return None, (jsonify({"error": "Not found"}), 404)
+    if w.get("status") not in WASTE_TRANSITIONS[action]:
+        return None, (jsonify({"error": f"cannot {action} waste in status {w.get('status')}"}),
+                      409)
+    return w.get("currentHolder"), None
+
+def record_waste_step(waste_id, event, tx_hash, fields, extra=None):
+    # History rows are keyed by (txHash, event) and shared with indexer.py:
+    # whichever of the two records a step first also moves the waste record
+    # and its rollups, so one transaction never bumps the sequence twice.
+    # Returns the updated waste record, or None if the step had already been
+    # recorded.
+    key       = {"txHash": tx_hash, "event": event}
+    timestamp = int(time.time())
+    update    = {"$setOnInsert": {
+        "wasteId":   waste_id,
+        "event":     event,
+        "timestamp": timestamp,
+        "txHash":    tx_hash
+    }}
+    if extra:
+        update["$set"] = extra
+    session = consistency.session()
+    try:
+        res = history_col.update_one(key, update, upsert=True, session=session)
+    except DuplicateKeyError:
+        # lost the upsert race to the indexer; just attach our extra fields
+        if extra:
+            history_col.update_one(key, {"$set": extra}, session=session)
+        return None
+    if res.upserted_id is None:
+        return None
+    feed.poke()
+    # the record as it was, for the status the rollups move quantity out of
+    before = waste_col.find_one_and_update(
+        {"wasteId": waste_id},
+        {"$set": fields, "$inc": {"sequence": 1}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE,
+        session=session
+    )
+    if before is None:
+        return None
+    after = {**before, **fields, "sequence": before["sequence"] + 1}
+    rollups.apply(rollups_col, rollups.waste_step_ops(before, after, timestamp), session)
+    return after
 
-@app.route("/api/waste/<waste_id>/transfer", methods=["POST"])
+@api.route("/api/waste/<waste_id>/transfer", methods=["POST"])
 def transfer_waste(waste_id):
-    body       = request.json or {}
-    new_holder = body.get("newHolder")
-    from_geo   = body.get("from")
-    to_geo     = body.get("to")
-    if not new_holder or not from_geo or not to_geo:
+    body     = request.json or {}
+    from_geo = body.get("from")
+    to_geo   = body.get("to")
+    if not body.get("newHolder") or not from_geo or not to_geo:
         return jsonify({"error": "newHolder, from and to are required"}), 400
+    try:
+        new_holder = checksum_address(body["newHolder"])
+        # stored as GeoJSON so the waste_history 2dsphere indexes can use them
+        from_geo, to_geo = normalize_point(from_geo), normalize_point(to_geo)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    holder, error = check_waste_step(waste_id, "transfer")
+    if error:
+        return error
+
+    def submit():
+        return signers.send(
+            waste_contract.functions.transferWaste(waste_id, new_holder), holder
+        )
+
+    def persist(receipt):
+        # holder and status as the contract emitted them
+        moved  = receipt_event(waste_contract, "Transferred", receipt)
+        status = WASTE_STATUSES[receipt_event(waste_contract, "StatusChanged", receipt).status]
+        doc = record_waste_step(
+            waste_id, status, receipt.transactionHash.hex(),
+            {"currentHolder": moved.to, "status": status},
+            {"from": from_geo, "to": to_geo}
+        )
+        invalidate_chain_read(("waste", waste_id))
+        return doc or waste_col.find_one({"wasteId": waste_id}, {"_id": 0})
+
+    if wants_async():
+        return accepted("transfer_waste", waste_id, submit, persist)
 
     try:
-        tx = waste_contract.functions.transferWaste(waste_id, new_holder)\
-             .transact({"from": w3.eth.default_account})
-        receipt = w3.eth.wait_for_transaction_receipt(tx)
+        receipt = receipts.wait(submit())
     except Exception as e:
         return jsonify({"error":"transfer failed","reason":str(e)}), 409
+    if receipt.status != 1:
+        return jsonify({"error": "transfer failed", "reason": "transaction reverted"}), 409
 
-    waste_col.update_one(
-        {"wasteId": waste_id},
-        {"$set": {"currentHolder": new_holder, "status": "InTransit"},
-         "$inc": {"sequence": 1}}
-    )
-    history_col.insert_one({
-        "wasteId":   waste_id,
-        "from":      from_geo,
-        "to":        to_geo,
-        "timestamp": int(time.time()),
-        "txHash":    receipt.transactionHash.hex()
-    })
-    updated = waste_col.find_one({"wasteId": waste_id}, {"_id": 0})
-    return jsonify(updated), 200
+    return jsonify(persist(receipt)), 200
+
+def _waste_status_change(action, waste_id, fn):
+    # deliver/dispose share everything except the contract call
+    holder, error = check_waste_step(waste_id, action)
+    if error:
+        return error
+
+    def submit():
+        return signers.send(fn(waste_id), holder)
+
+    def persist(receipt):
+        status = WASTE_STATUSES[receipt_event(waste_contract, "StatusChanged", receipt).status]
+        record_waste_step(
+            waste_id, status, receipt.transactionHash.hex(), {"status": status}
+        )
+        invalidate_chain_read(("waste", waste_id))
+        return {"wasteId": waste_id, "status": status}
+
+    if wants_async():
+        return accepted(f"{action}_waste", waste_id, submit, persist)
 
-@app.route("/api/waste/<waste_id>/deliver", methods=["POST"])
-def deliver_waste(waste_id):
     try:
-        tx = waste_contract.functions.deliverWaste(waste_id)\
-             .transact({"from": w3.eth.default_account})
-        receipt = w3.eth.wait_for_transaction_receipt(tx)
+        receipt = receipts.wait(submit())
     except Exception as e:
-        return jsonify({"error":"deliver failed","reason":str(e)}), 409
+        return jsonify({"error": f"{action} failed", "reason": str(e)}), 409
+    if receipt.status != 1:
+        return jsonify({"error": f"{action} failed", "reason": "transaction reverted"}), 409
 
-    waste_col.update_one(
-        {"wasteId": waste_id},
-        {"$set": {"status": "Delivered"}, "$inc": {"sequence": 1}}
-    )
-    history_col.insert_one({
-        "wasteId":   waste_id,
-        "event":     "Delivered",
-        "timestamp": int(time.time()),
-        "txHash":    receipt.transactionHash.hex()
-    })
-    return jsonify({"wasteId": waste_id, "status": "Delivered"}), 200
+    return jsonify(persist(receipt)), 200
 
-@app.route("/api/waste/<waste_id>/dispose", methods=["POST"])
+@api.route("/api/waste/<waste_id>/deliver", methods=["POST"])
+def deliver_waste(waste_id):
+    return _waste_status_change("deliver", waste_id, waste_contract.functions.deliverWaste)
+
+@api.route("/api/waste/<waste_id>/dispose", methods=["POST"])
 def dispose_waste(waste_id):
-    try:
-        tx = waste_contract.functions.disposeWaste(waste_id)\
-             .transact({"from": w3.eth.default_account})
-        receipt = w3.eth.wait_for_transaction_receipt(tx)
-    except Exception as e:
-        return jsonify({"error":"dispose failed","reason":str(e)}), 409
+    return _waste_status_change("dispose", waste_id, waste_contract.functions.disposeWaste)
 
-    waste_col.update_one(
-        {"wasteId": waste_id},
-        {"$set": {"status": "Disposed"}, "$inc": {"sequence": 1}}
-    )
-    history_col.insert_one({
-        "wasteId":   waste_id,
-        "event":     "Disposed",
-        "timestamp": int(time.time()),
-        "txHash":    receipt.transactionHash.hex()
-    })
-    return jsonify({"wasteId": waste_id, "status": "Disposed"}), 200
+# what get_waste takes from the contract rather than the index
+WASTE_CHAIN_FIELDS = ("currentHolder", "status", "sequence")
 
-@app.route("/api/waste/<waste_id>", methods=["GET"])
+@api.route("/api/waste/<waste_id>", methods=["GET"])
+@etag_from(waste_sequence)
 def get_waste(waste_id):
-    m = waste_col.find_one({"wasteId": waste_id}, {"_id": 0})
-    if not m:
+    try:
+        fields = requested_fields()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    projection, drop = field_projection(fields, ("sequence",))
+    m = waste_col.find_one({"wasteId": waste_id}, projection)
+    if m is None:
         return jsonify({"error": "Not found"}), 404
+    if READ_FROM_INDEX or not any(wanted(fields, f) for f in WASTE_CHAIN_FIELDS):
+        return jsonify(without(m, drop)), 200
 
-    holder, status, wtype, hclass, qty, units, seq = \
-        waste_contract.functions.getWaste(waste_id).call()
-    m.update({
-        "currentHolder": holder,
-        "status":        status.name,
-        "sequence":      seq
-    })
-    return jsonify(m), 200
+    holder, status, wtype, hclass, qty, units, seq = read_waste(waste_id)
+    return jsonify(without(with_waste_state(m, fields, holder, status, seq), drop)), 200
+
+def with_waste_state(m, fields, holder, status, seq):
+    # the chain's holder/status/sequence over the indexed record, as requested;
+    # a cached read older than the record (a step stored since) is ignored
+    if seq < m.get("sequence", 0):
+        return m
+    chain = dict(zip(WASTE_CHAIN_FIELDS, (holder, WASTE_STATUSES[status], seq)))
+    m.update({k: v for k, v in chain.items() if wanted(fields, k)})
+    return m
 
 from flask import jsonify
 
-@app.route("/api/materials/<material_id>/featurecollection", methods=["GET"])
+# all feature_collection() reads from a transfer
+FEATURE_FIELDS = {"_id": 0, "from": 1, "to": 1, "timestamp": 1, "txHash": 1}
+
+@api.route("/api/materials/<material_id>/featurecollection", methods=["GET"])
+@etag_from(material_sequence)
 def material_featurecollection(material_id):
     # 1. Look up the material (for e.g. company metadata)
-    material = materials_col.find_one({"materialId": material_id}, {"_id": 0})
+    material = replica("materials").find_one({"materialId": material_id}, {"_id": 0})
     if not material:
         return jsonify({"error": "Material not found"}), 404
 
-    company = material.get("metadata", {}).get("company", "Unknown Company")
-
     # 2. Load its transfers in chronological order
-    transfers = list(transfers_col
-                     .find({"materialId": material_id})
+    transfers = list(replica("transfers")
+                     .find({"materialId": material_id}, FEATURE_FIELDS)
                      .sort("timestamp", 1))
 
+    return jsonify(feature_collection(material_id, material, transfers)), 200
+
+def feature_collection(material_id, material, transfers):
+    company = material.get("metadata", {}).get("company", "Unknown Company")
     if not transfers:
-        return jsonify({"type": "FeatureCollection", "features": []}), 200
+        return {"type": "FeatureCollection", "features": []}
 
     features = []
 
@@ -594,48 +1344,509 @@ def material_featurecollection(material_id):
         }
     })
 
-    # 5. Return the FeatureCollection
-    return jsonify({
+    # 5. The FeatureCollection
+    return {
         "type":     "FeatureCollection",
         "features": features
+    }
+
+# ─── Map Tiles ─────────────────────────────────────────────────────────────────
+# Routes for a whole map viewport in one request.  Transfers with an end in
+# view are selected through the from/to 2dsphere indexes, strung into one
+# route per material, simplified (Douglas–Peucker) to about MAP_SIMPLIFY_PX
+# pixels at the requested zoom and bucketed into z/x/y tiles.  Rendered tiles
+# are cached for MAP_TILE_TTL seconds.
+MAX_MAP_TILES   = int(os.getenv("MAX_MAP_TILES", "64"))
+MAX_MAP_ZOOM    = 22
+MAP_SIMPLIFY_PX = float(os.getenv("MAP_SIMPLIFY_PX", "1.0"))
+MAP_TILE_TTL    = int(os.getenv("MAP_TILE_TTL", "60"))
+
+tile_cache = Lazy(lambda: TileCache(
+    maxsize=int(os.getenv("MAP_TILE_CACHE_SIZE", "5000")),
+    ttl=MAP_TILE_TTL
+))
+
+def load_routes(bbox):
+    # {materialId: [[lng, lat], ...]} in time order, for transfers starting
+    # or ending inside bbox; a route is clipped to the transfers in view
+    area  = {"$geoWithin": {"$geometry": bbox_polygon(bbox)}}
+    steps = sorted(
+        (t["materialId"], t["timestamp"], t["from"]["coordinates"], t["to"]["coordinates"])
+        for t in replica("transfers").find(
+            {"$or": [{"from": area}, {"to": area}]},
+            {"_id": 0, "materialId": 1, "timestamp": 1, "from": 1, "to": 1}
+        )
+    )
+    routes = {}
+    for mid, _, frm, to in steps:
+        coords = routes.setdefault(mid, [])
+        if not coords or coords[-1] != frm:
+            coords.append(frm)
+        coords.append(to)
+    return routes
+
+def render_tiles(z, tiles):
+    # {(x, y): FeatureCollection}; one transfers query covers every tile
+    # that isn't cached yet
+    out, boxes = {}, {}
+    for xy in tiles:
+        fc = tile_cache.get((z,) + xy)
+        if fc is None:
+            boxes[xy] = tile_bbox(z, *xy)
+        else:
+            out[xy] = fc
+    if not boxes:
+        return out
+
+    features  = {xy: [] for xy in boxes}
+    tolerance = tolerance_for_zoom(z, MAP_SIMPLIFY_PX)
+    for mid, coords in load_routes(union_bbox(boxes.values())).items():
+        line   = simplify(coords, tolerance)
+        extent = line_bbox(line)
+        feature = {
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": line} if len(line) > 1
+                        else {"type": "Point", "coordinates": line[0]},
+            "properties": {
+                "materialId": mid,
+                "route_id":   f"route_{mid}",
+                "points":     len(coords)
+            }
+        }
+        for xy, box in boxes.items():
+            if overlaps(extent, box) and line_touches(line, box):
+                features[xy].append(feature)
+
+    for xy in boxes:
+        out[xy] = {"type": "FeatureCollection", "features": features[xy]}
+        tile_cache.put((z,) + xy, out[xy])
+    return out
+
+@api.route("/api/map", methods=["GET"])
+def get_map():
+    # ?bbox=west,south,east,north&zoom=<z> -> every tile covering the bbox
+    if "bbox" not in request.args or "zoom" not in request.args:
+        return jsonify({"error": "bbox=west,south,east,north and zoom are required"}), 400
+    try:
+        bbox = parse_bbox(request.args["bbox"])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    zoom = request.args.get("zoom", type=int)
+    if zoom is None or not (0 <= zoom <= MAX_MAP_ZOOM):
+        return jsonify({"error": f"zoom must be an integer from 0 to {MAX_MAP_ZOOM}"}), 400
+
+    tiles = tiles_for_bbox(bbox, zoom)
+    if len(tiles) > MAX_MAP_TILES:
+        return jsonify({"error": f"bbox covers {len(tiles)} tiles at zoom {zoom}; "
+                                 f"at most {MAX_MAP_TILES} per request"}), 400
+
+    rendered = render_tiles(zoom, tiles)
+    return jsonify({
+        "zoom":  zoom,
+        "tiles": [dict(rendered[xy], z=zoom, x=xy[0], y=xy[1]) for xy in tiles]
     }), 200
 
-@app.route("/api/transfers/log", methods=["GET"])
+@api.route("/api/map/tiles/<int:z>/<int:x>/<int:y>.geojson", methods=["GET"])
+def get_map_tile(z, x, y):
+    # one tile, for map libraries that fetch z/x/y themselves
+    if not (0 <= z <= MAX_MAP_ZOOM and 0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        return jsonify({"error": "Not found"}), 404
+    resp = jsonify(render_tiles(z, [(x, y)])[(x, y)])
+    resp.headers["Cache-Control"] = f"public, max-age={MAP_TILE_TTL}"
+    return resp, 200
+
+# ─── Geo Queries ───────────────────────────────────────────────────────────────
+# Server-side spatial filters, each backed by a 2dsphere index:
+#   materials.location                  -> location_2dsphere_idx
+#   transfers.from / transfers.to       -> transfers_{from,to}_2dsphere
+#   waste_history.from / .to            -> waste_history_{from,to}_2dsphere
+MAX_NEAR_KM = float(os.getenv("MAX_NEAR_KM", "20000"))
+
+def region_geometry():
+    # ?polygon=<GeoJSON Polygon or MultiPolygon> or ?bbox=west,south,east,north
+    if request.args.get("polygon"):
+        geometry = json.loads(request.args["polygon"])
+        if not isinstance(geometry, dict) or \
+                geometry.get("type") not in ("Polygon", "MultiPolygon"):
+            raise ValueError("polygon must be a GeoJSON Polygon or MultiPolygon")
+        return geometry
+    if request.args.get("bbox"):
+        return bbox_polygon(parse_bbox(request.args["bbox"]))   # same checks as get_map
+    raise ValueError("polygon or bbox is required")
+
+def either_end_within(geometry):
+    area = {"$geoWithin": {"$geometry": geometry}}
+    return {"$or": [{"from": area}, {"to": area}]}
+
+@api.route("/api/geo/materials/near", methods=["GET"])
+def materials_near():
+    # ?lng=&lat=&km= [&status=&companyName=&limit=], nearest first
+    try:
+        lng, lat = float(request.args["lng"]), float(request.args["lat"])
+        km       = float(request.args.get("km", 10))
+    except (KeyError, ValueError):
+        return jsonify({"error": "lng and lat are required; km must be a number"}), 400
+    if not (-180 <= lng <= 180 and -90 <= lat <= 90) or not (0 < km <= MAX_NEAR_KM):
+        return jsonify({"error": "lng/lat out of range or km not in (0, "
+                                 f"{MAX_NEAR_KM:g}]"}), 400
+
+    query = {}
+    for field in ("status", "companyName"):
+        if request.args.get(field):
+            query[field] = request.args[field]
+    pipeline = [
+        {"$geoNear": {
+            "near":          {"type": "Point", "coordinates": [lng, lat]},
+            "key":           "location",
+            "distanceField": "distanceKm",
+            "distanceMultiplier": 0.001,
+            "maxDistance":   km * 1000,
+            "spherical":     True,
+            "query":         query
+        }},
+        {"$limit": page_limit() or MAX_PAGE_SIZE},
+        {"$project": {"_id": 0}}
+    ]
+    return jsonify(list(replica("materials").aggregate(pipeline))), 200
+
+@api.route("/api/geo/transfers/within", methods=["GET"])
+def transfers_within():
+    # transfers that started or ended inside ?polygon= / ?bbox=,
+    # optionally in ?since=&until= (unix seconds); streamed unless ?limit=
+    try:
+        query = either_end_within(region_geometry())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    since = request.args.get("since", type=int)
+    until = request.args.get("until", type=int)
+    if since is not None or until is not None:
+        query["timestamp"] = {}
+        if since is not None:
+            query["timestamp"]["$gte"] = since
+        if until is not None:
+            query["timestamp"]["$lte"] = until
+
+    cursor = replica("transfers").find(query, {"_id": 0, "transferPath": 0})
+    limit  = page_limit()
+    if limit is None:
+        return stream_json(cursor, ndjson=wants_ndjson()), 200
+    return jsonify(list(cursor.limit(limit))), 200
+
+@api.route("/api/geo/waste/in-transit", methods=["GET"])
+def waste_in_transit():
+    # waste whose *current* leg starts or ends inside ?polygon= / ?bbox=
+    try:
+        query = either_end_within(region_geometry())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    query["event"] = "InTransit"
+
+    # 1) legs touching the region (geo indexes)
+    legs = {}
+    for h in replica("waste_history").find(query, {"_id": 0, "wasteId": 1, "txHash": 1}):
+        legs.setdefault(h["wasteId"], set()).add(h["txHash"])
+    if not legs:
+        return jsonify([]), 200
+
+    # 2) of those records, the ones still in transit
+    waste = {
+        w["wasteId"]: w
+        for w in replica("waste").find({"wasteId": {"$in": list(legs)}, "status": "InTransit"},
+                                       {"_id": 0})
+    }
+    if not waste:
+        return jsonify([]), 200
+
+    # 3) keep a record only if its latest leg is one of the matching ones
+    latest = replica("waste_history").aggregate([
+        {"$match": {"wasteId": {"$in": list(waste)}, "event": "InTransit"}},
+        {"$sort":  {"wasteId": 1, "timestamp": -1}},
+        {"$group": {"_id": "$wasteId", "leg": {"$first": "$$ROOT"}}}
+    ])
+    result = []
+    for row in latest:
+        leg = row["leg"]
+        if leg["txHash"] in legs[row["_id"]]:
+            doc = waste[row["_id"]]
+            doc["leg"] = {k: leg.get(k) for k in ("from", "to", "timestamp", "txHash")}
+            result.append(doc)
+    return jsonify(result), 200
+
+@api.route("/api/transfers/log", methods=["GET"])
 def get_transfer_log():
-    # 1) Fetch all transfers, sorted by time
-    transfers = list(transfers_col.find({}, {"_id": 0})
-                     .sort("timestamp", 1))
+    # One aggregation: time-ordered transfers (timestamp_id_idx), the owning
+    # company looked up server-side, txHash truncated in the projection.
+    # Filters: ?since=&until= (unix seconds), ?company=; paging: ?after=&limit=
+    match = {}
+    try:
+        since = request.args.get("since", type=int)
+        until = request.args.get("until", type=int)
+        if since is not None or until is not None:
+            match["timestamp"] = {}
+            if since is not None:
+                match["timestamp"]["$gte"] = since
+            if until is not None:
+                match["timestamp"]["$lte"] = until
+        after = request.args.get("after")
+        if after:
+            ts, oid = after.split(":", 1)
+            ts, oid = int(ts), ObjectId(oid)
+            match["$or"] = [
+                {"timestamp": {"$gt": ts}},
+                {"timestamp": ts, "_id": {"$gt": oid}}
+            ]
+    except (ValueError, InvalidId):
+        return jsonify({"error": "after must be a cursor returned in X-Next-Cursor"}), 400
+
+    company = request.args.get("company")
+    limit   = page_limit()
+
+    # 1) Transfers in time order, straight off the index
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"timestamp": 1, "_id": 1}}
+    ]
+    if company:
+        # only transfers stamped with this company, or unstamped ones that may
+        # inherit it from their material, need to go through the lookup
+        pipeline.append({"$match": {"companyName": {"$in": [company, None]}}})
+    elif limit:
+        pipeline.append({"$limit": limit})
+
+    # 2) Company who did the transfer, falling back to the material's company
+    pipeline += [
+        {"$lookup": {
+            "from":         materials_col.name,
+            "localField":   "materialId",
+            "foreignField": "materialId",
+            "pipeline":     [{"$project": {"_id": 0, "companyName": 1}}],
+            "as":           "material"
+        }},
+        {"$addFields": {
+            "company": {"$ifNull": [
+                "$companyName",
+                {"$cond": [
+                    {"$gt": [{"$size": "$material"}, 0]},
+                    {"$arrayElemAt": ["$material.companyName", 0]},
+                    "Unknown"
+                ]}
+            ]}
+        }}
+    ]
+    if company:
+        pipeline.append({"$match": {"company": company}})
+        if limit:
+            pipeline.append({"$limit": limit})
+
+    # 3) Shorten the txHash to 10 chars, default the note and stored status
+    project = {
+        "_id":           0,
+        "company":       1,
+        "transactionId": {"$substrCP": [{"$ifNull": ["$txHash", ""]}, 0, 10]},
+        "description":   {"$ifNull": ["$description", ""]},
+        "status":        {"$ifNull": ["$status", ""]}
+    }
+    if limit:
+        # keep the sort key around to build the next cursor
+        project.update({"_id": 1, "timestamp": 1})
+    pipeline.append({"$project": project})
+
+    cursor = replica("transfers").aggregate(pipeline)
+    if limit is None:
+        return stream_json(cursor, ndjson=wants_ndjson()), 200
+
+    log = list(cursor)
+    next_cursor = None
+    if len(log) == limit:
+        next_cursor = f"{log[-1]['timestamp']}:{log[-1]['_id']}"
+    for entry in log:
+        del entry["_id"], entry["timestamp"]
+    resp = jsonify(log)
+    if next_cursor:
+        resp.headers["X-Next-Cursor"] = next_cursor
+    return resp, 200
+
+# ─── Analytics ─────────────────────────────────────────────────────────────────
+# Management reports from the buckets in `rollups` (rollups.py), kept current
+# by the write routes and indexer.py: each reads a few small documents
+# however much history there is.  Routed to READ_PREFERENCE like the other
+# reports.
+MAX_ANALYTICS_DAYS = 366
+
+def day_range():
+    """(since, until) as YYYY-MM-DD from ?since=&until=, inclusive; the last
+    30 days by default.  ValueError on a bad date or range."""
+    now   = time.time()
+    since = request.args.get("since") or rollups.day_of(now - 29 * rollups.DAY)
+    until = request.args.get("until") or rollups.day_of(now)
+    try:
+        first, last = (datetime.strptime(d, "%Y-%m-%d") for d in (since, until))
+    except ValueError:
+        raise ValueError("since and until must be dates as YYYY-MM-DD") from None
+    if first > last:
+        raise ValueError("since must not be after until")
+    if (last - first).days >= MAX_ANALYTICS_DAYS:
+        raise ValueError(f"at most {MAX_ANALYTICS_DAYS} days per request")
+    return since, until
+
+def average(seconds, count):
+    return seconds / count if count else None
+
+@api.route("/api/analytics/transfers", methods=["GET"])
+def analytics_transfers():
+    # transfers per company per day; ?since=&until=, ?companyName=
+    try:
+        since, until = day_range()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    query = {"kind": rollups.TRANSFERS_DAILY, "day": {"$gte": since, "$lte": until}}
+    if request.args.get("companyName"):
+        query["companyName"] = request.args["companyName"]
+
+    days = list(replica("rollups").find(query, {"_id": 0, "day": 1, "companyName": 1, "count": 1})
+                                  .sort([("day", ASCENDING), ("companyName", ASCENDING)]))
+    by_company = {}
+    for d in days:
+        by_company[d["companyName"]] = by_company.get(d["companyName"], 0) + d["count"]
+    return jsonify({
+        "since":     since,
+        "until":     until,
+        "total":     sum(by_company.values()),
+        "byCompany": by_company,
+        "days":      days
+    }), 200
 
-    log = []
-    for t in transfers:
-        # 2) Company who did the transfer
-        company = t.get("companyName")
-        if not company:
-            mat = materials_col.find_one(
-                {"materialId": t["materialId"]},
-                {"companyName": 1, "_id": 0}
-            )
-            company = mat.get("companyName") if mat else "Unknown"
-
-        # 3) Shorten the txHash to 10 chars
-        txid = t.get("txHash", "")[:10]
-
-        # 4) Use the human‑written note or empty string
-        desc = t.get("description", "")
-
-        # 5) Use the stored status from that transfer record
-        status = t.get("status", "")
-
-        log.append({
-            "company":       company,
-            "transactionId": txid,
-            "description":   desc,
-            "status":        status
-        })
+@api.route("/api/analytics/waste", methods=["GET"])
+def analytics_waste():
+    # quantity and number of waste records now in each status, per
+    # hazardClass and units (quantities in different units aren't added up)
+    query = {"kind": rollups.WASTE_STATUS, "count": {"$gt": 0}}
+    if request.args.get("hazardClass"):
+        query["hazardClass"] = request.args["hazardClass"]
+    buckets = replica("rollups").find(
+        query,
+        {"_id": 0, "hazardClass": 1, "status": 1, "units": 1, "quantity": 1, "count": 1}
+    ).sort([("hazardClass", ASCENDING), ("status", ASCENDING), ("units", ASCENDING)])
+    return jsonify(list(buckets)), 200
+
+@api.route("/api/analytics/waste/disposal-time", methods=["GET"])
+def analytics_disposal_time():
+    # average seconds from Created to Disposed, overall and per hazardClass
+    rows = list(replica("rollups").find({"kind": rollups.WASTE_DISPOSAL},
+                                        {"_id": 0, "hazardClass": 1, "count": 1, "seconds": 1})
+                                  .sort("hazardClass", ASCENDING))
+    count   = sum(r["count"] for r in rows)
+    seconds = sum(r["seconds"] for r in rows)
+    return jsonify({
+        "count":          count,
+        "averageSeconds": average(seconds, count),
+        "byHazardClass":  [{"hazardClass":    r["hazardClass"],
+                            "count":          r["count"],
+                            "averageSeconds": average(r["seconds"], r["count"])} for r in rows]
+    }), 200
 
-    return jsonify(log), 200
+# ─── Live Feed ─────────────────────────────────────────────────────────────────
+# New transfers and waste steps as Server-Sent Events.  One tailer per process
+# (see feed.py) feeds every open stream; event ids are document ObjectIds, so
+# a reconnect with Last-Event-ID replays exactly what was missed, from Mongo.
+# Each open stream holds a server thread: run gunicorn with gthread workers.
+FEED_HEARTBEAT = float(os.getenv("FEED_HEARTBEAT", "15"))
+FEED_RETRY_MS  = int(os.getenv("FEED_RETRY_MS", "3000"))
+
+feed = Lazy(lambda: TransferFeed(
+    {"transfer": transfers_col, "waste": history_col},
+    poll_interval=float(os.getenv("FEED_POLL_INTERVAL", "1.0")),
+    change_stream=os.getenv("FEED_SOURCE", "poll") == "changestream"
+))
+
+def sse(event):
+    return f"id: {event['id']}\nevent: {event['type']}\n" \
+           f"data: {current_app.json.dumps(event['data'])}\n\n"
+
+@api.route("/api/transfers/stream", methods=["GET"])
+def stream_transfers():
+    # ?materialId= / ?company= -> transfers only; ?wasteId= -> waste steps only
+    filters = {"transfer": {}, "waste": {}}
+    if request.args.get("materialId"):
+        filters["transfer"]["materialId"] = request.args["materialId"]
+    if request.args.get("company"):
+        filters["transfer"]["companyName"] = request.args["company"]
+    if request.args.get("wasteId"):
+        filters["waste"]["wasteId"] = request.args["wasteId"]
+    if filters["transfer"] and filters["waste"]:
+        return jsonify({"error": "filter on materialId/company or on wasteId, not both"}), 400
+    if filters["transfer"]:
+        del filters["waste"]
+    elif filters["waste"]:
+        del filters["transfer"]
+
+    # EventSource sends Last-Event-ID itself; ?lastEventId= is for a first connect
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("lastEventId")
+    try:
+        after = ObjectId(last_id) if last_id else None
+    except InvalidId:
+        return jsonify({"error": "Last-Event-ID must be an id from this stream"}), 400
+
+    def matches(event):
+        query = filters.get(event["type"])
+        return query is not None and all(event["data"].get(k) == v for k, v in query.items())
 
+    # subscribe before replaying so nothing written in between is lost
+    sub = feed.subscribe()
 
+    def generate():
+        try:
+            yield f"retry: {FEED_RETRY_MS}\n\n"
+            replayed = set()
+            if after is not None:
+                for event in feed.replay(after, filters):
+                    replayed.add(event["id"])
+                    yield sse(event)
+            while not sub.closed:
+                event = sub.get(FEED_HEARTBEAT)
+                if event is None:
+                    yield ": keepalive\n\n"   # also notices clients that left
+                elif event["id"] not in replayed and matches(event):
+                    yield sse(event)
+        finally:
+            feed.unsubscribe(sub)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# ─── App Factory ───────────────────────────────────────────────────────────────
+def create_app(cors=True):
+    # cors=False when something in front (asgi.py) already handles CORS
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    if cors:
+        CORS(app, supports_credentials=True, expose_headers=[consistency.HEADER])
+
+    # Secret for JWT signing
+    app.config["SECRET_KEY"] = os.getenv("FLASK_SECRET", "super-secret-key")
+
+    app.register_blueprint(api)
+    metrics.init_app(app)   # phase timings per request, GET /metrics
+    compression.init_app(app)   # gzip/br by Accept-Encoding
+    if READ_PREFERENCE != "primary":
+        consistency.init_app(app, client)   # causal sessions, X-Consistency-Token
+
+    @app.cli.command("migrate")
+    def migrate_command():
+        """Apply data migrations and create the MongoDB indexes."""
+        run_migrations(db)
+
+    @app.cli.command("backfill-rollups")
+    def backfill_rollups_command():
+        """Recompute the analytics rollups from the existing data."""
+        rollups.run(db)
+
+    return app
+
+# Cheap now that nothing connects at import: `gunicorn app:app`,
+# `gunicorn 'app:create_app()'` and `flask --app app` all work.
+app = create_app()
 
 
 if __name__ == "__main__":
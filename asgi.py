@@ -0,0 +1,436 @@
+"""
+asgi.py
+
+ASGI serving mode: the same routes and payloads as app.py, with the hot
+read/transfer routes running natively on asyncio.
+
+    uvicorn asgi:app --workers 4
+
+Under gunicorn every request holds a thread for as long as it waits on
+Mongo or the node, so in-flight requests are capped by the thread count.
+Here the routes below await PyMongo's AsyncMongoClient and an AsyncWeb3
+(one pooled aiohttp session per process), so a single worker keeps
+hundreds of requests in flight:
+
+    GET  /api/materials/<material_id>                    (+ /status, /transfers,
+    GET  /api/materials/<material_id>/featurecollection     /featurecollection)
+    POST /api/materials/<material_id>/transfer           (sync mode)
+    GET  /api/waste/<waste_id>
+    GET  /api/jobs/<job_id>
+
+Everything else (and any other method on those paths) falls through to
+the Flask app over a WSGI bridge with WSGI_THREADS threads, so nothing is
+missing; those routes are just no more concurrent than under gunicorn.
+Native handlers reuse app.py's validation and document builders and
+encode with its JSON provider, so bodies, status codes and ETags match.
+READ_PREFERENCE routing and X-Consistency-Token work as in app.py: each
+native request runs in one causal AsyncClientSession.  ?fields= and
+gzip/br compression (compression.py) apply to native responses too.
+
+A transfer still signs and sends through the shared SignerPool (in a
+worker thread: nonces and keys stay in one place) and waits on the shared
+ReceiptWaiter, but as an awaited future rather than a blocked thread.
+
+Environment, on top of app.py's:
+    MONGO_POOL_SIZE   async Mongo connections per worker (default 100)
+    RPC_POOL_SIZE     concurrent HTTP connections to the node (default 100)
+    WSGI_THREADS      threads for the Flask fallback (default 16)
+
+benchmarks/asgi_vs_wsgi.py compares this against gunicorn.
+"""
+
+import asyncio
+import os
+import re
+from contextlib import asynccontextmanager
+from functools import wraps
+
+from a2wsgi import WSGIMiddleware
+from aiohttp import ClientSession, TCPConnector
+from pymongo import AsyncMongoClient, ReturnDocument
+from pymongo.errors import OperationFailure
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Match, Mount, Route
+from web3 import AsyncHTTPProvider, AsyncWeb3
+from web3.exceptions import ContractLogicError
+from werkzeug.http import parse_etags, quote_etag
+
+import app as wsgi
+import compression
+import consistency
+import metrics
+import rollups
+from abis import load_abi
+from chain_cache import AsyncChainCache
+from metrics import phase
+
+MONGO_POOL_SIZE = int(os.getenv("MONGO_POOL_SIZE", "100"))
+RPC_POOL_SIZE   = int(os.getenv("RPC_POOL_SIZE", "100"))
+WSGI_THREADS    = int(os.getenv("WSGI_THREADS", "16"))
+
+flask_app = wsgi.create_app(cors=False)   # CORS is handled once, below
+bridge    = WSGIMiddleware(flask_app, workers=WSGI_THREADS)
+
+
+# ─── Per-process Services ──────────────────────────────────────────────────────
+@asynccontextmanager
+async def lifespan(app):
+    mongo    = AsyncMongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"),
+                                maxPoolSize=MONGO_POOL_SIZE,
+                                event_listeners=[metrics.MongoListener()])
+    http     = ClientSession(connector=TCPConnector(limit=RPC_POOL_SIZE))
+    provider = AsyncHTTPProvider(os.getenv("HTTP_PROVIDER", "http://127.0.0.1:8545"))
+    await provider.cache_async_session(http)
+    w3 = AsyncWeb3(provider)
+    w3.middleware_onion.add(metrics.async_web3_middleware, "metrics")
+
+    state = app.state
+    state.mongo          = mongo
+    state.db             = mongo["chain_custody_db"]
+    state.replicas       = state.db.with_options(read_preference=wsgi.read_pref)
+    state.contract       = w3.eth.contract(address=wsgi.chain_address,
+                                           abi=load_abi("ChainCustody"))
+    state.waste_contract = w3.eth.contract(address=wsgi.waste_address,
+                                           abi=load_abi("WasteChain"))
+    state.chain_cache    = AsyncChainCache(
+        w3,
+        maxsize=int(os.getenv("CHAIN_CACHE_SIZE", "10000")),
+        block_poll_interval=float(os.getenv("CHAIN_CACHE_BLOCK_POLL", "1.0"))
+    )
+    # Flask routes mounted here (waste steps, jobs, batches) write too
+    wsgi.chain_cache_listeners.append(state.chain_cache.invalidate)
+    try:
+        yield
+    finally:
+        wsgi.chain_cache_listeners.remove(state.chain_cache.invalidate)
+        await http.close()
+        await mongo.close()
+
+
+# ─── Responses ─────────────────────────────────────────────────────────────────
+def json_response(obj, status=200, headers=None):
+    # byte-for-byte what jsonify() gives under gunicorn
+    with phase("serialize"):
+        body = flask_app.json.dumps_bytes(obj) + b"\n"
+    return Response(body, status, headers, media_type="application/json")
+
+def not_found(message="Not found"):
+    return json_response({"error": message}, 404)
+
+def bad_request(e):
+    return json_response({"error": str(e)}, 400)
+
+def compressed(f):
+    # compression.init_app()'s hook, for a native handler
+    @wraps(f)
+    async def wrapped(request):
+        resp = await f(request)
+        return compression.compress_response(
+            resp, compression.negotiate(request.headers.get("Accept-Encoding")))
+    return wrapped
+
+async def first(cursor):
+    docs = await cursor.limit(1).to_list(1)
+    return docs[0] if docs else None
+
+# ─── Causal Sessions ───────────────────────────────────────────────────────────
+# consistency.init_app()'s hooks, for a native handler
+def in_session(f):
+    @wraps(f)
+    async def wrapped(request):
+        token = request.headers.get(consistency.HEADER) or \
+            request.query_params.get(consistency.PARAM)
+        try:
+            times = consistency.decode_token(token) if token else None
+        except ValueError as e:
+            return json_response({"error": str(e)}, 400)
+        async with request.app.state.mongo.start_session(causal_consistency=True) as s:
+            if times:
+                s.advance_cluster_time(times[0])
+                s.advance_operation_time(times[1])
+            request.state.session = s
+            resp  = await f(request)
+            token = consistency.encode_token(s)
+        if token:
+            resp.headers[consistency.HEADER] = token
+        return resp
+    return wrapped
+
+def session(request):
+    # the request's causal session; None with READ_PREFERENCE=primary
+    return getattr(request.state, "session", None)
+
+# ─── Conditional GETs ──────────────────────────────────────────────────────────
+# Same ETags as app.py's etag_from: "<id>-<sequence>" from a covered query.
+async def covered_first(col, query, projection, index, session):
+    # app.covered_first: without the hint while the index isn't built yet
+    try:
+        return await first(col.find(query, projection, session=session).hint(index))
+    except OperationFailure:
+        return await first(col.find(query, projection, session=session))
+
+async def material_sequence(db, material_id, session):
+    return wsgi.material_version(await covered_first(
+        db.materials, {"materialId": material_id}, {"_id": 0, "lastSequence": 1, "revision": 1},
+        "materialId_lastSequence_revision_idx", session))
+
+async def waste_sequence(db, waste_id, session):
+    w = await covered_first(db.waste, {"wasteId": waste_id},
+                            {"_id": 0, "sequence": 1}, "wasteId_sequence_idx", session)
+    return w and w.get("sequence")
+
+def etag_from(sequence_of):
+    def decorator(f):
+        @wraps(f)
+        async def wrapped(request):
+            (key,) = request.path_params.values()
+            seq = await sequence_of(request.app.state.db, key, session(request))
+            if seq is None:
+                return await f(request)
+            etag = f"{key}-{seq}"
+            if parse_etags(request.headers.get("If-None-Match")).contains_weak(etag):
+                resp = Response(status_code=304)
+            else:
+                resp = await f(request)
+                if resp.status_code != 200:
+                    return resp
+            if "etag" not in resp.headers:   # set by a handler that found a newer version
+                resp.headers["ETag"] = quote_etag(etag)
+            resp.headers["Cache-Control"] = "no-cache"   # always revalidate
+            return resp
+        return wrapped
+    return decorator
+
+# ─── Materials ─────────────────────────────────────────────────────────────────
+@etag_from(material_sequence)
+async def get_material(request):
+    state       = request.app.state
+    material_id = request.path_params["material_id"]
+    try:
+        fields = wsgi.parse_fields(request.query_params.get("fields"))
+    except ValueError as e:
+        return bad_request(e)
+    projection, drop = wsgi.field_projection(
+        fields, () if wsgi.READ_FROM_INDEX else wsgi.MATERIAL_CHAIN_FIELDS)
+    m = await state.db.materials.find_one({"materialId": material_id}, projection)
+    if m is None:
+        return not_found()
+    if wsgi.READ_FROM_INDEX:
+        return json_response(m)
+
+    try:
+        holder, seq, _, _ = await state.chain_cache.get(
+            ("material", material_id),
+            lambda: state.contract.functions.getMaterial(material_id).call()
+        )
+    except ContractLogicError:
+        return json_response(wsgi.without(m, drop))     # Mongo record only
+
+    # as in app.get_material: only a newer chain state wins, and the
+    # write-back is sequence-guarded
+    if seq <= m.get("lastSequence", 0):
+        return json_response(wsgi.without(m, drop))
+    await state.db.materials.update_one(
+        {"materialId": material_id, "lastSequence": {"$lt": seq}},
+        {"$set": {"currentHolder": holder, "lastSequence": seq}},
+        session=session(request)
+    )
+    m.update({"currentHolder": holder, "lastSequence": seq})
+    etag = quote_etag(f"{material_id}-{wsgi.material_version(m)}")
+    return json_response(wsgi.without(m, drop), headers={"ETag": etag})
+
+@etag_from(material_sequence)
+async def get_status(request):
+    m = await request.app.state.db.materials.find_one(
+        {"materialId": request.path_params["material_id"]},
+        {"status": 1, "_id": 0}
+    )
+    if not m:
+        return not_found()
+    return json_response({"status": m["status"]})
+
+@etag_from(material_sequence)
+async def list_transfers(request):
+    db, s       = request.app.state.replicas, session(request)
+    material_id = request.path_params["material_id"]
+    try:
+        projection, drop, path = wsgi.transfer_projection(
+            wsgi.parse_fields(request.query_params.get("fields")))
+    except ValueError as e:
+        return bad_request(e)
+    if not await db.materials.find_one({"materialId": material_id}, {"_id": 1}, session=s):
+        return not_found()
+    history = await db.transfers.find({"materialId": material_id}, projection,
+                                      session=s).to_list(None)
+    return json_response([wsgi.without(wsgi.with_transfer_path(t) if path else t, drop)
+                          for t in history])
+
+@etag_from(material_sequence)
+async def material_featurecollection(request):
+    db, s       = request.app.state.replicas, session(request)
+    material_id = request.path_params["material_id"]
+    material = await db.materials.find_one({"materialId": material_id}, {"_id": 0}, session=s)
+    if not material:
+        return not_found("Material not found")
+    transfers = await db.transfers.find({"materialId": material_id}, wsgi.FEATURE_FIELDS,
+                                        session=s).sort("timestamp", 1).to_list(None)
+    return json_response(wsgi.feature_collection(material_id, material, transfers))
+
+async def transfer_material(request):
+    state       = request.app.state
+    material_id = request.path_params["material_id"]
+    company_name, error = wsgi.bearer_company(request.headers.get("Authorization", ""),
+                                              flask_app.config["SECRET_KEY"])
+    if error:
+        return json_response({"error": error}, 401)
+
+    # 1. Validate everything before the chain sees anything
+    try:
+        data = await request.json()
+    except ValueError:
+        return json_response({"error": "Request body must be JSON"}, 400)
+    try:
+        new_holder, pt_from, pt_to, description = wsgi.parse_transfer(
+            data if isinstance(data, dict) else {})
+    except ValueError as e:
+        return json_response({"error": str(e)}, 400)
+
+    # 2. Look up current holder
+    existing = await state.db.materials.find_one({"materialId": material_id},
+                                                 {"_id": 0, "currentHolder": 1})
+    if not existing:
+        return not_found()
+
+    # 3. On‑chain transfer; signing stays in the shared pool, the receipt is
+    #    awaited instead of blocking a thread
+    try:
+        tx_hash = await run_in_threadpool(
+            wsgi.signers.send,
+            wsgi.contract.functions.transferMaterial(material_id, new_holder),
+            existing["currentHolder"]
+        )
+        with phase("receipt_wait"):
+            receipt = await asyncio.wrap_future(wsgi.receipts.submit(tx_hash))
+    except ContractLogicError as e:
+        return json_response({"error": "Transfer failed", "reason": str(e)}, 409)
+    if receipt.status != 1:
+        return json_response({"error": "Transfer failed", "reason": "transaction reverted"}, 409)
+
+    # 4. Same writes, in the same order, as app.transfer_material's persist()
+    event   = wsgi.receipt_event(wsgi.contract, "MaterialTransferred", receipt)
+    tx_hash = receipt.transactionHash.hex()
+    wsgi.invalidate_chain_read(("material", material_id))     # ours too, via the listener
+    record  = wsgi.transfer_record(material_id, company_name, pt_from, pt_to, description,
+                                   tx_hash)
+    await state.db.transfers.insert_one(record, session=session(request))
+    material = await state.db.materials.find_one_and_update(
+        *wsgi.transfer_update(material_id, event, tx_hash),
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+        session=session(request)
+    )
+    wsgi.feed.poke()
+    await rollups.apply_async(state.db.rollups, rollups.transfer_ops(record), session(request))
+    if material is None:
+        material = await state.db.materials.find_one({"materialId": material_id}, {"_id": 0},
+                                                     session=session(request))
+    return json_response(material)
+
+def wants_async(request):
+    # app.wants_async() for a Starlette request
+    if "respond-async" in request.headers.get("Prefer", ""):
+        return True
+    flag = request.query_params.get("async")
+    if flag is not None:
+        return flag.lower() in ("1", "true", "yes")
+    return wsgi.ASYNC_WRITES
+
+class SyncWritesOnly:
+    """ASGI app: serve a write natively unless the client asked for async
+    mode, whose job queue lives in the Flask app."""
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope, receive)
+        if wants_async(request):
+            await bridge(scope, receive, send)
+            return
+        response = await self.endpoint(request)
+        await response(scope, receive, send)
+
+# ─── Waste / Jobs ──────────────────────────────────────────────────────────────
+@etag_from(waste_sequence)
+async def get_waste(request):
+    state    = request.app.state
+    waste_id = request.path_params["waste_id"]
+    try:
+        fields = wsgi.parse_fields(request.query_params.get("fields"))
+    except ValueError as e:
+        return bad_request(e)
+    projection, drop = wsgi.field_projection(fields, ("sequence",))
+    m = await state.db.waste.find_one({"wasteId": waste_id}, projection)
+    if m is None:
+        return not_found()
+    if wsgi.READ_FROM_INDEX or not any(wsgi.wanted(fields, f) for f in wsgi.WASTE_CHAIN_FIELDS):
+        return json_response(wsgi.without(m, drop))
+
+    holder, status, wtype, hclass, qty, units, seq = await state.chain_cache.get(
+        ("waste", waste_id),
+        lambda: state.waste_contract.functions.getWaste(waste_id).call()
+    )
+    return json_response(wsgi.without(wsgi.with_waste_state(m, fields, holder, status, seq),
+                                      drop))
+
+async def get_job(request):
+    job = await request.app.state.db.jobs.find_one({"_id": request.path_params["job_id"]},
+                                                   {"expiresAt": 0, "owner": 0},
+                                                   session=session(request))
+    if not job:
+        return not_found()
+    job["jobId"] = job.pop("_id")
+    return json_response(job)
+
+# ─── App ───────────────────────────────────────────────────────────────────────
+class NativeRoute(Route):
+    # another method on the same path is Flask's to answer (POST
+    # /api/materials/batch, OPTIONS, ...), not a 405 from here
+    def matches(self, scope):
+        match, child_scope = super().matches(scope)
+        if match is Match.PARTIAL:
+            return Match.NONE, {}
+        return match, child_scope
+
+def native(rule, endpoint, method="GET", wrap=None):
+    # `rule` in Flask syntax, so /metrics labels match the gunicorn server's
+    endpoint = compressed(endpoint)
+    if wsgi.READ_PREFERENCE != "primary":
+        endpoint = in_session(endpoint)
+    handler = metrics.timed(rule, method)(endpoint)
+    return NativeRoute(re.sub(r"<(\w+)>", r"{\1}", rule),
+                       wrap(handler) if wrap else handler, methods=[method])
+
+routes = [
+    native("/api/materials/<material_id>",                   get_material),
+    native("/api/materials/<material_id>/status",            get_status),
+    native("/api/materials/<material_id>/transfers",         list_transfers),
+    native("/api/materials/<material_id>/featurecollection", material_featurecollection),
+    native("/api/materials/<material_id>/transfer",          transfer_material, "POST",
+           wrap=SyncWritesOnly),
+    native("/api/waste/<waste_id>",                          get_waste),
+    native("/api/jobs/<job_id>",                             get_job),
+    Mount("/", app=bridge),
+]
+
+app = Starlette(
+    routes=routes,
+    lifespan=lifespan,
+    middleware=[Middleware(CORSMiddleware, allow_origin_regex=".*", allow_credentials=True,
+                           allow_methods=["*"], allow_headers=["*"],
+                           expose_headers=[consistency.HEADER])]
+)
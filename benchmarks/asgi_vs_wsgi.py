@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+
+"""
+benchmarks/asgi_vs_wsgi.py
+
+The same traffic against the sync server (gunicorn, gthread workers) and
+the ASGI server (uvicorn asgi:app), at rising numbers of in-flight
+requests.
+
+    npx hardhat node &                                   # or any dev node
+    python benchmarks/asgi_vs_wsgi.py                    # temp mongod
+    python benchmarks/asgi_vs_wsgi.py --concurrency 32,128,512 --out asgi.json
+    python benchmarks/asgi_vs_wsgi.py --mongo mongodb://scratch:27017 --workers 4
+
+Both servers run as real processes against the same MongoDB and node,
+with fresh contracts deployed from the Hardhat artifacts:
+
+    --mongo ephemeral   a mongod from $PATH on a temp dbpath (default)
+    --mongo <uri>       an existing server; the app always uses its
+                        chain_custody_db database, so point this at a
+                        scratch server
+    --node <url>        JSON-RPC node whose unlocked accounts can sign
+                        (Hardhat, anvil); default http://127.0.0.1:8545
+
+Each server gets --workers processes (gunicorn also --threads threads
+each).  The database is seeded once over HTTP; then for every concurrency
+level one asyncio client keeps that many requests in flight for
+--duration seconds, mostly the reads asgi.py serves natively plus a
+share of transfers (--writes) and one Flask-bridged route for reference.
+The client is a single process; if it pegs a core, the numbers measure
+the client, so keep an eye on it at the highest levels.
+
+Output (--out, or stdout) is JSON, one entry per server and level, in
+benchmarks/load.py's format:
+
+    {"meta": {...}, "runs": [{"server": "wsgi", "concurrency": 32,
+                              "total": {...}, "endpoints": {...}}, ...]}
+
+with a summary table on stderr.  Needs gunicorn, uvicorn and httpx.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import platform
+import random
+import secrets
+import shutil
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from load import ROOT, State, _free_port, aggregate, deploy_contracts, fmt, git_revision, \
+    new_material, point, start_mongo
+from migrations import migrate
+
+SERVERS = ("wsgi", "asgi")
+
+
+# ─── Servers ───────────────────────────────────────────────────────────────────
+def server_command(kind, port, workers, threads):
+    if kind == "wsgi":
+        return ["gunicorn", "-k", "gthread", "-w", str(workers), "--threads", str(threads),
+                "-b", f"127.0.0.1:{port}", "--log-level", "warning", "app:app"]
+    return ["uvicorn", "asgi:app", "--workers", str(workers), "--host", "127.0.0.1",
+            "--port", str(port), "--log-level", "warning", "--no-access-log"]
+
+
+def start_server(kind, env, workers, threads):
+    """Start `kind` and return (process, base URL) once it answers."""
+    import httpx
+
+    port = _free_port()
+    proc = subprocess.Popen(server_command(kind, port, workers, threads), cwd=ROOT, env=env)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f"{kind} server exited with {proc.returncode}")
+        try:
+            httpx.get(base + "/api/users", timeout=1).raise_for_status()
+            return proc, base
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.terminate()
+    sys.exit(f"{kind} server did not come up on {base}")
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# ─── Traffic ───────────────────────────────────────────────────────────────────
+def seed(base, state, rng, materials, transfers):
+    import httpx
+
+    with httpx.Client(base_url=base, headers=state.auth, timeout=120) as c:
+        for start in range(0, materials, 100):
+            items = [new_material(state, rng) for _ in range(min(100, materials - start))]
+            for result in c.post("/api/materials/batch", json=items).json().get("results", []):
+                if result["status"] == "created":
+                    state.materials.append(result["materialId"])
+                    state.idle.add(result["materialId"])
+        for mid in state.materials[:transfers]:
+            c.post(f"/api/materials/{mid}/transfer", json={
+                "newHolder": rng.choice(state.accounts), "from": point(rng), "to": point(rng)
+            })
+
+
+# Each run(client, state, rng) is a coroutine returning the HTTP status;
+# templates are the Flask rules, as in load.py.
+Scenario = namedtuple("Scenario", "method rule variant weight write ok run")
+
+async def get_material(c, s, r):
+    mid  = r.choice(s.materials)
+    resp = await c.get(f"/api/materials/{mid}")
+    if resp.headers.get("ETag"):
+        s.etags[mid] = resp.headers["ETag"]
+    return resp.status_code
+
+async def revalidate_material(c, s, r):
+    if not s.etags:
+        return await get_material(c, s, r)
+    mid, etag = r.choice(list(s.etags.items()))
+    return (await c.get(f"/api/materials/{mid}", headers={"If-None-Match": etag})).status_code
+
+def material_get(suffix):
+    async def run(c, s, r):
+        return (await c.get(f"/api/materials/{r.choice(s.materials)}/{suffix}")).status_code
+    return run
+
+async def transfer_material(c, s, r):
+    mid = s.checkout(s.idle)
+    if mid is None:
+        return await get_material(c, s, r)   # every material is mid-transfer
+    try:
+        resp = await c.post(f"/api/materials/{mid}/transfer", headers=s.auth, json={
+            "newHolder": r.choice(s.accounts), "from": point(r), "to": point(r),
+            "description": "bench leg"
+        })
+        return resp.status_code
+    finally:
+        s.checkin(s.idle, mid)
+
+async def list_page(c, s, r):
+    # served by Flask through the bridge under asgi.py
+    return (await c.get("/api/materials?limit=50")).status_code
+
+SCENARIOS = [
+    Scenario("GET",  "/api/materials/<material_id>",                   "",             30, False,
+             {200},      get_material),
+    Scenario("GET",  "/api/materials/<material_id>",                   "If-None-Match", 15, False,
+             {200, 304}, revalidate_material),
+    Scenario("GET",  "/api/materials/<material_id>/status",            "",             10, False,
+             {200},      material_get("status")),
+    Scenario("GET",  "/api/materials/<material_id>/transfers",         "",             10, False,
+             {200},      material_get("transfers")),
+    Scenario("GET",  "/api/materials/<material_id>/featurecollection", "",             10, False,
+             {200},      material_get("featurecollection")),
+    Scenario("POST", "/api/materials/<material_id>/transfer",          "",              5, True,
+             {200},      transfer_material),
+    Scenario("GET",  "/api/materials",                                 "limit",         5, False,
+             {200},      list_page),
+]
+
+def label(sc):
+    return f"{sc.method} {sc.rule}" + (f" [{sc.variant}]" if sc.variant else "")
+
+
+async def run_level(base, state, concurrency, duration, warmup, weights, rng_seed):
+    import httpx
+
+    samples = []
+    limits  = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=300) as client:
+        loop  = asyncio.get_running_loop()
+        start = loop.time() + warmup
+        stop  = start + duration
+
+        async def worker(i):
+            rng = random.Random(rng_seed + i)
+            while True:
+                t = loop.time()
+                if t >= stop:
+                    return
+                sc = rng.choices(SCENARIOS, weights)[0]
+                try:
+                    status = await sc.run(client, state, rng)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                if t >= start:
+                    samples.append((label(sc), loop.time() - t, status, status in sc.ok))
+
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return samples
+
+
+# ─── Reporting ─────────────────────────────────────────────────────────────────
+def print_table(result, out=sys.stderr):
+    print(f"{'server':<6} {'in flight':>9} {'reqs':>7} {'err':>5} {'rps':>9} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}", file=out)
+    for run in result["runs"]:
+        s = run["total"]
+        print(f"{run['server']:<6} {run['concurrency']:>9} {s['requests']:>7} {s['errors']:>5} "
+              f"{s['rps']:>9.1f} {fmt(s['p50_ms'])} {fmt(s['p95_ms'])} {fmt(s['p99_ms'])}",
+              file=out)
+
+
+# ─── Main ──────────────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Compare the gunicorn and uvicorn servers")
+    parser.add_argument("--mongo", default="ephemeral",
+                        help="ephemeral (temp mongod) or a MongoDB URI")
+    parser.add_argument("--node", default="http://127.0.0.1:8545", help="JSON-RPC URL")
+    parser.add_argument("--servers", default=",".join(SERVERS))
+    parser.add_argument("--workers", type=int, default=1, help="processes per server")
+    parser.add_argument("--threads", type=int, default=32, help="gunicorn threads per worker")
+    parser.add_argument("--concurrency", default="16,64,256",
+                        help="comma-separated in-flight request levels")
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=3, help="unmeasured seconds first")
+    parser.add_argument("--writes", type=float, default=1.0,
+                        help="multiplier on the transfer weight (0 = read-only)")
+    parser.add_argument("--materials", type=int, default=500, help="materials to seed")
+    parser.add_argument("--transfers", type=int, default=200, help="seeded transfers")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the JSON result here instead of stdout")
+    args = parser.parse_args()
+
+    servers = [s for s in args.servers.split(",") if s]
+    levels  = [int(n) for n in args.concurrency.split(",") if n]
+    if set(servers) - set(SERVERS):
+        sys.exit(f"--servers takes {', '.join(SERVERS)}")
+    for kind in servers:
+        exe = server_command(kind, 0, 1, 1)[0]
+        if not shutil.which(exe):
+            sys.exit(f"{exe} is not on PATH: pip install {exe}")
+    if importlib.util.find_spec("httpx") is None:
+        sys.exit("httpx is missing: pip install httpx")
+    if args.mongo == "memory":
+        sys.exit("the servers run out of process; use --mongo ephemeral or a URI")
+
+    from web3 import Web3
+    w3 = Web3(Web3.HTTPProvider(args.node))
+    if not w3.is_connected():
+        sys.exit(f"no JSON-RPC node at {args.node} (try `npx hardhat node`)")
+    w3.eth.default_account = w3.eth.accounts[0]
+    chain, waste = deploy_contracts(w3)
+
+    mongo = start_mongo(args.mongo)
+    migrate(mongo["chain_custody_db"])
+    uri = args.mongo
+    if args.mongo == "ephemeral":
+        uri = "mongodb://%s:%d" % mongo.address
+
+    secret = secrets.token_hex(32)
+    env = dict(os.environ,
+               MONGODB_URI=uri,
+               HTTP_PROVIDER=args.node,
+               CONTRACT_ADDRESS=chain.address,
+               WASTE_CONTRACT_ADDRESS=waste.address,
+               FLASK_SECRET=secret)
+
+    import jwt
+    state = State(f"{int(time.time()):x}", w3.eth.accounts)
+    token = jwt.encode({"companyName": "Acme"}, secret, algorithm="HS256")
+    state.auth = {"Authorization": f"Bearer {token}"}
+    weights = [sc.weight * (args.writes if sc.write else 1) for sc in SCENARIOS]
+
+    runs = []
+    for kind in servers:
+        proc, base = start_server(kind, env, args.workers, args.threads)
+        try:
+            if not state.materials:
+                t = time.perf_counter()
+                seed(base, state, random.Random(args.seed), args.materials, args.transfers)
+                print(f"seeded {len(state.materials)} materials "
+                      f"in {time.perf_counter() - t:.1f} s", file=sys.stderr)
+            for level in levels:
+                samples = asyncio.run(run_level(base, state, level, args.duration, args.warmup,
+                                                weights, args.seed * 1000))
+                endpoints, total = aggregate(samples, args.duration)
+                runs.append({"server": kind, "concurrency": level,
+                             "total": total, "endpoints": endpoints})
+                print(f"{kind} @ {level}: {total['rps']:.1f} rps, p95 {fmt(total['p95_ms'], 0)} ms",
+                      file=sys.stderr)
+        finally:
+            stop_server(proc)
+
+    result = {
+        "meta": {
+            "commit":    git_revision(),
+            "timestamp": int(time.time()),
+            "python":    platform.python_version(),
+            "mongo":     "ephemeral" if args.mongo == "ephemeral" else "server",
+            "workers":   args.workers,
+            "threads":   args.threads,
+            "duration":  args.duration,
+            "warmup":    args.warmup,
+            "writes":    args.writes,
+            "seed":      args.seed,
+            "seeded":    {"materials": args.materials, "transfers": args.transfers}
+        },
+        "runs": runs
+    }
+
+    print_table(result)
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
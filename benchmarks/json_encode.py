@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+"""
+benchmarks/json_encode.py
+
+Encode throughput of the stdlib JSON provider against FastJSONProvider on
+realistic transfer documents (nested GeoJSON points and path, ObjectId,
+HexBytes tx hash), the shape /api/transfers/log and
+/api/materials/<id>/transfers return.
+
+    python benchmarks/json_encode.py                 # 10k docs, 20 rounds
+    python benchmarks/json_encode.py --docs 100000 --rounds 5
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from hexbytes import HexBytes
+
+import json_provider
+from json_provider import FastJSONProvider
+
+
+class StdlibProvider(DefaultJSONProvider):
+    # what every response used before: Flask's encoder plus our type hooks
+    default = staticmethod(json_provider.default)
+
+
+def point(rng):
+    return {"type": "Point", "coordinates": [rng.uniform(-180, 180), rng.uniform(-85, 85)]}
+
+
+def transfer_docs(n, seed=1):
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n):
+        frm, to = point(rng), point(rng)
+        docs.append({
+            "_id":          ObjectId(),
+            "materialId":   f"MAT-{i // 8:06d}",
+            "companyName":  rng.choice(["Acme", "Globex", "Initech", "Umbrella"]),
+            "from":         frm,
+            "to":           to,
+            "transferPath": {"type": "LineString",
+                             "coordinates": [frm["coordinates"], to["coordinates"]]},
+            "timestamp":    1_700_000_000 + i * 37,
+            "description":  "Lithium cells, pallet %d" % rng.randint(1, 500),
+            "status":       "In Transit",
+            "txHash":       HexBytes(rng.randbytes(32))
+        })
+    return docs
+
+
+def bench(provider, docs, rounds):
+    times = []
+    size  = 0
+    for _ in range(rounds):
+        t = time.perf_counter()
+        size = len(provider.response(docs).get_data())
+        times.append(time.perf_counter() - t)
+    return statistics.median(times), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON response encoding")
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    app  = Flask(__name__)
+    docs = transfer_docs(args.docs)
+    providers = [("stdlib", StdlibProvider(app)), ("fast", FastJSONProvider(app))]
+    if json_provider.orjson is None:
+        print("orjson is not installed; 'fast' falls back to the stdlib encoder")
+
+    with app.app_context():
+        baseline = None
+        for name, provider in providers:
+            seconds, size = bench(provider, docs, args.rounds)
+            baseline = baseline or seconds
+            print(f"{name:<7} {seconds * 1000:9.2f} ms  {args.docs / seconds:12,.0f} docs/s  "
+                  f"{size / seconds / 2**20:8.1f} MB/s  x{baseline / seconds:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,636 @@
+#!/usr/bin/env python3
+
+"""
+benchmarks/load.py
+
+Mixed read/write load against every API route, with no MongoDB or chain
+node to set up.
+
+    python benchmarks/load.py                              # 30 s, 8 clients
+    python benchmarks/load.py --concurrency 32 --duration 60 --out head.json
+    python benchmarks/load.py --mongo ephemeral            # throwaway mongod
+    python benchmarks/load.py --mongo mongodb://localhost:27017
+    python benchmarks/load.py --compare base.json head.json --fail-over 10
+
+The app runs in-process (Flask test client, one per client thread) against
+stand-ins:
+
+    --mongo memory      mongomock (default); routes that need server-only
+                        features ($geoWithin, $geoNear, $lookup pipelines)
+                        are skipped and listed under meta.skipped
+    --mongo ephemeral   a mongod from $PATH on a temp dbpath, removed after
+    --mongo <uri>       an existing server; uses and then drops the
+                        chain_custody_bench database
+
+and an in-process EVM (eth-tester / py-evm) with ChainCustody and
+WasteChain deployed from the Hardhat artifacts.  py-evm isn't thread-safe,
+so chain calls are serialized; write latencies are relative numbers for
+comparing commits, not a prediction for Hardhat or a real network.
+
+The database is seeded through the API first, then each client picks
+routes at random by weight (--writes scales the write share).  Results go
+to --out (stdout by default) as JSON:
+
+    {"meta": {...}, "total": {...},
+     "endpoints": {"GET /api/materials/<material_id>":
+                   {"requests", "errors", "statuses", "rps",
+                    "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"}, ...}}
+
+and a summary table to stderr.  Needs `pip install mongomock
+"eth-tester[py-evm]"`.
+"""
+
+import argparse
+import atexit
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from abis import ARTIFACTS
+from geo import tiles_for_bbox
+from migrations import migrate
+
+BENCH_DB = "chain_custody_bench"
+REGION   = (-10.0, 35.0, 30.0, 60.0)   # west, south, east, north (Europe)
+PASSWORD = "bench-password"
+
+
+# ─── Stand-in services ─────────────────────────────────────────────────────────
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_mongo(kind):
+    """A MongoClient-like object for `kind` (memory, ephemeral or a URI)."""
+    if kind == "memory":
+        import mongomock
+        return mongomock.MongoClient()
+
+    from pymongo import MongoClient
+    if kind != "ephemeral":
+        client = MongoClient(kind)
+        atexit.register(client.drop_database, BENCH_DB)
+        return client
+
+    mongod = shutil.which("mongod")
+    if not mongod:
+        sys.exit("--mongo ephemeral needs mongod on PATH")
+    dbpath = tempfile.mkdtemp(prefix="bench-mongo-")
+    port   = _free_port()
+    proc   = subprocess.Popen([mongod, "--dbpath", dbpath, "--port", str(port),
+                               "--bind_ip", "127.0.0.1"],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def stop():
+        proc.terminate()
+        proc.wait(30)
+        shutil.rmtree(dbpath, ignore_errors=True)
+    atexit.register(stop)
+
+    client = MongoClient(f"mongodb://127.0.0.1:{port}/?serverSelectionTimeoutMS=30000")
+    client.admin.command("ping")   # waits for mongod to come up
+    return client
+
+
+def start_chain():
+    """Web3 on an in-process EVM with both contracts deployed and the
+    default account holding every WasteChain role."""
+    from web3 import Web3, EthereumTesterProvider
+
+    class SerialTesterProvider(EthereumTesterProvider):
+        # request threads, the receipt poller and the chain cache all call in
+        def __init__(self):
+            super().__init__()
+            self._lock = threading.Lock()
+
+        def make_request(self, method, params):
+            with self._lock:
+                return super().make_request(method, params)
+
+    w3 = Web3(SerialTesterProvider())
+    w3.eth.default_account = w3.eth.accounts[0]
+    return (w3, *deploy_contracts(w3))
+
+
+def deploy_contracts(w3):
+    """Fresh ChainCustody and WasteChain from the Hardhat artifacts, with
+    w3's default account holding every WasteChain role."""
+    admin = w3.eth.default_account
+
+    def deploy(name, *args):
+        with open(os.path.join(ROOT, ARTIFACTS[name])) as f:
+            artifact = json.load(f)
+        factory = w3.eth.contract(abi=artifact["abi"], bytecode=artifact["bytecode"])
+        tx      = factory.constructor(*args).transact({"from": admin})
+        address = w3.eth.wait_for_transaction_receipt(tx).contractAddress
+        return w3.eth.contract(address=address, abi=artifact["abi"])
+
+    chain = deploy("ChainCustody")
+    waste = deploy("WasteChain", admin)
+    for role in ("registerGenerator", "registerTransporter", "registerDisposer"):
+        tx = getattr(waste.functions, role)(admin).transact({"from": admin})
+        w3.eth.wait_for_transaction_receipt(tx)
+    return chain, waste
+
+
+def wire_app(mongo, w3, chain, waste):
+    """Import the app and point its lazy handles at the stand-ins."""
+    import app as api
+    api.client._lazy_override(lambda: mongo)
+    api.db._lazy_override(lambda: mongo[BENCH_DB])
+    api.w3._lazy_override(lambda: w3)
+    api.contract._lazy_override(lambda: chain)
+    api.waste_contract._lazy_override(lambda: waste)
+    migrate(api.db)
+    return api
+
+
+# ─── Traffic ───────────────────────────────────────────────────────────────────
+class State:
+    """Ids the scenarios work on.  Records being written are checked out so
+    two clients never race to move the same material or waste record."""
+
+    def __init__(self, tag, accounts):
+        self.tag       = tag
+        self.accounts  = accounts
+        self.materials = []                      # every material, for reads
+        self.idle      = set()                   # materials free to transfer
+        self.waste     = defaultdict(set)        # status -> wasteIds
+        self.wasted    = []                      # every waste record, for reads
+        self.etags     = {}
+        self.jobs      = deque(maxlen=1000)
+        self.companies = []
+        self.auth      = {}                      # Authorization header
+        self._ids      = itertools.count()
+        self._lock     = threading.Lock()
+
+    def new_id(self, prefix):
+        return f"{prefix}-{self.tag}-{next(self._ids):07d}"
+
+    def checkout(self, pool):
+        with self._lock:
+            return pool.pop() if pool else None
+
+    def checkin(self, pool, item):
+        with self._lock:
+            pool.add(item)
+
+
+def point(rng):
+    west, south, east, north = REGION
+    return {"lat": round(rng.uniform(south, north), 5), "lng": round(rng.uniform(west, east), 5)}
+
+
+def new_material(state, rng):
+    return {"materialId": state.new_id("MAT"), "description": "Lithium cells",
+            "metadata": {"company": "Acme", "pallets": rng.randint(1, 40)},
+            "location": point(rng)}
+
+
+def sub_bbox(rng, span):
+    west, south, east, north = REGION
+    x, y = rng.uniform(west, east - span), rng.uniform(south, north - span)
+    return f"{x:.4f},{y:.4f},{x + span:.4f},{y + span:.4f}"
+
+
+def drain(resp):
+    # streamed routes do their work while the body is read
+    resp.get_data()
+    resp.close()
+    return resp.status_code
+
+
+# Each run(client, state, rng) returns the HTTP status; `ok` is the set of
+# statuses that aren't counted as errors, including those of the create a
+# scenario falls back to when it has nothing to work on yet.  Templates
+# match app.url_map rules.
+Scenario = namedtuple("Scenario", "method rule variant weight write server_only ok run")
+
+def _get(path, **kw):
+    return lambda c, s, r: drain(c.get(path(s, r) if callable(path) else path, **kw))
+
+
+def get_material(c, s, r):
+    mid  = r.choice(s.materials)
+    resp = c.get(f"/api/materials/{mid}")
+    if resp.headers.get("ETag"):
+        s.etags[mid] = resp.headers["ETag"]
+    return drain(resp)
+
+
+def revalidate_material(c, s, r):
+    if not s.etags:
+        return get_material(c, s, r)
+    mid, etag = r.choice(list(s.etags.items()))
+    return drain(c.get(f"/api/materials/{mid}", headers={"If-None-Match": etag}))
+
+
+def create_material(c, s, r):
+    body = new_material(s, r)
+    resp = c.post("/api/materials", json=body, headers=s.auth)
+    if resp.status_code == 201:
+        s.materials.append(body["materialId"])
+        s.checkin(s.idle, body["materialId"])
+    return drain(resp)
+
+
+def create_material_async(c, s, r):
+    resp = c.post("/api/materials?async=1", json=new_material(s, r), headers=s.auth)
+    if resp.status_code == 202:
+        s.jobs.append(resp.get_json()["jobId"])
+    return drain(resp)
+
+
+def create_batch(c, s, r, size=10):
+    items = [new_material(s, r) for _ in range(size)]
+    resp  = c.post("/api/materials/batch", json=items, headers=s.auth)
+    for result in resp.get_json().get("results", []):
+        if result["status"] == "created":
+            s.materials.append(result["materialId"])
+            s.checkin(s.idle, result["materialId"])
+    return drain(resp)
+
+
+def transfer_material(c, s, r):
+    mid = s.checkout(s.idle)
+    if mid is None:
+        return create_material(c, s, r)
+    try:
+        return drain(c.post(f"/api/materials/{mid}/transfer", headers=s.auth, json={
+            "newHolder": r.choice(s.accounts), "from": point(r), "to": point(r),
+            "description": "bench leg"
+        }))
+    finally:
+        s.checkin(s.idle, mid)
+
+
+def get_job(c, s, r):
+    if not s.jobs:
+        return create_material_async(c, s, r)
+    return drain(c.get(f"/api/jobs/{r.choice(s.jobs)}"))
+
+
+def register_company(c, s, r):
+    name = s.new_id("Company")
+    resp = c.post("/api/companies/register", json={"companyName": name, "password": PASSWORD})
+    if resp.status_code == 201:
+        s.companies.append(name)
+    return drain(resp)
+
+
+def login_company(c, s, r):
+    if not s.companies:
+        return register_company(c, s, r)
+    return drain(c.post("/api/companies/login",
+                        json={"companyName": r.choice(s.companies), "password": PASSWORD}))
+
+
+def create_waste(c, s, r):
+    wid  = s.new_id("WST")
+    resp = c.post("/api/waste", json={"wasteId": wid, "wasteType": "Solvent",
+                                      "hazardClass": "3", "quantity": r.randint(1, 900),
+                                      "units": "kg"})
+    if resp.status_code == 201:
+        s.wasted.append(wid)
+        s.checkin(s.waste["Created"], wid)
+    return drain(resp)
+
+
+def waste_step(action, source, target):
+    def run(c, s, r):
+        wid = s.checkout(s.waste[source])
+        if wid is None:
+            return create_waste(c, s, r)
+        body = {"newHolder": s.accounts[0], "from": point(r), "to": point(r)} \
+            if action == "transfer" else None
+        resp = c.post(f"/api/waste/{wid}/{action}", json=body)
+        s.checkin(s.waste[target if resp.status_code == 200 else source], wid)
+        return drain(resp)
+    return run
+
+
+def open_stream(c, s, r):
+    # hang up after the first chunk: what opening a stream costs, not how
+    # long clients stay connected
+    resp = c.get(f"/api/transfers/stream?materialId={r.choice(s.materials)}", buffered=False)
+    next(iter(resp.response), None)
+    resp.close()
+    return resp.status_code
+
+
+def random_tile(s, r, z=7):
+    x, y = r.choice(tiles_for_bbox(REGION, z))
+    return f"/api/map/tiles/{z}/{x}/{y}.geojson"
+
+
+R, W = False, True
+SCENARIOS = [
+    Scenario("GET",  "/api/materials", "", 8, R, False, {200},
+             _get("/api/materials?limit=50")),
+    Scenario("GET",  "/api/materials/<material_id>", "", 20, R, False, {200}, get_material),
+    Scenario("GET",  "/api/materials/<material_id>", "304", 8, R, False, {200, 304},
+             revalidate_material),
+    Scenario("GET",  "/api/materials/<material_id>/status", "", 5, R, False, {200},
+             _get(lambda s, r: f"/api/materials/{r.choice(s.materials)}/status")),
+    Scenario("GET",  "/api/materials/<material_id>/transfers", "", 8, R, False, {200},
+             _get(lambda s, r: f"/api/materials/{r.choice(s.materials)}/transfers")),
+    Scenario("GET",  "/api/materials/<material_id>/featurecollection", "", 8, R, False, {200},
+             _get(lambda s, r: f"/api/materials/{r.choice(s.materials)}/featurecollection")),
+    Scenario("GET",  "/api/materials/<material_id>/export/csv", "", 3, R, False, {200},
+             _get(lambda s, r: f"/api/materials/{r.choice(s.materials)}/export/csv")),
+    Scenario("GET",  "/api/materials/<material_id>/export/pdf", "", 1, R, False, {200, 503},
+             _get(lambda s, r: f"/api/materials/{r.choice(s.materials)}/export/pdf")),
+    Scenario("GET",  "/api/materials/export/csv", "", 1, R, False, {200},
+             _get("/api/materials/export/csv")),
+    Scenario("GET",  "/api/materials/export/ndjson", "", 1, R, False, {200},
+             _get("/api/materials/export/ndjson", headers={"Accept-Encoding": "gzip"})),
+    Scenario("GET",  "/api/waste/<waste_id>", "", 5, R, False, {200},
+             _get(lambda s, r: f"/api/waste/{r.choice(s.wasted)}")),
+    Scenario("GET",  "/api/jobs/<job_id>", "", 2, R, False, {200, 202}, get_job),
+    Scenario("GET",  "/api/users", "", 1, R, False, {200}, _get("/api/users")),
+    Scenario("GET",  "/api/map", "", 3, R, True, {200},
+             _get(lambda s, r: f"/api/map?bbox={sub_bbox(r, 4)}&zoom=7")),
+    Scenario("GET",  "/api/map/tiles/<int:z>/<int:x>/<int:y>.geojson", "", 3, R, True, {200},
+             _get(random_tile)),
+    Scenario("GET",  "/api/geo/materials/near", "", 3, R, True, {200},
+             _get(lambda s, r: "/api/geo/materials/near?lng={lng}&lat={lat}&km=200&limit=50"
+                               .format(**point(r)))),
+    Scenario("GET",  "/api/geo/transfers/within", "", 2, R, True, {200},
+             _get(lambda s, r: f"/api/geo/transfers/within?bbox={sub_bbox(r, 5)}&limit=100")),
+    Scenario("GET",  "/api/geo/waste/in-transit", "", 2, R, True, {200},
+             _get(lambda s, r: f"/api/geo/waste/in-transit?bbox={sub_bbox(r, 10)}")),
+    Scenario("GET",  "/api/transfers/log", "", 3, R, True, {200},
+             _get("/api/transfers/log?limit=100")),
+    Scenario("GET",  "/api/transfers/stream", "", 1, R, False, {200}, open_stream),
+    Scenario("GET",  "/api/analytics/transfers", "", 2, R, False, {200},
+             _get("/api/analytics/transfers")),
+    Scenario("GET",  "/api/analytics/waste", "", 1, R, False, {200},
+             _get("/api/analytics/waste?hazardClass=3")),
+    Scenario("GET",  "/api/analytics/waste/disposal-time", "", 1, R, False, {200},
+             _get("/api/analytics/waste/disposal-time")),
+    Scenario("POST", "/api/companies/login", "", 1, R, False, {200, 201}, login_company),
+    Scenario("POST", "/api/companies/register", "", 0.5, W, False, {201}, register_company),
+    Scenario("POST", "/api/materials", "", 4, W, False, {201}, create_material),
+    Scenario("POST", "/api/materials", "async", 1, W, False, {202}, create_material_async),
+    Scenario("POST", "/api/materials/batch", "", 1, W, False, {201}, create_batch),
+    Scenario("POST", "/api/materials/<material_id>/transfer", "", 6, W, False, {200, 201},
+             transfer_material),
+    Scenario("POST", "/api/waste", "", 2, W, False, {201}, create_waste),
+    Scenario("POST", "/api/waste/<waste_id>/transfer", "", 2, W, False, {200, 201},
+             waste_step("transfer", "Created", "InTransit")),
+    Scenario("POST", "/api/waste/<waste_id>/deliver", "", 1, W, False, {200, 201},
+             waste_step("deliver", "InTransit", "Delivered")),
+    Scenario("POST", "/api/waste/<waste_id>/dispose", "", 1, W, False, {200, 201},
+             waste_step("dispose", "Delivered", "Disposed"))
+]
+
+
+def label(sc):
+    name = f"{sc.method} {sc.rule}"
+    return f"{name} ({sc.variant})" if sc.variant else name
+
+
+def uncovered_routes(flask_app):
+    covered = {(sc.method, sc.rule) for sc in SCENARIOS}
+    return sorted(
+        f"{method} {rule.rule}"
+        for rule in flask_app.url_map.iter_rules() if rule.rule.startswith("/api/")
+        for method in rule.methods - {"HEAD", "OPTIONS"}
+        if (method, rule.rule) not in covered
+    )
+
+
+def seed(client, state, rng, materials, transfers, waste):
+    for start in range(0, materials, 100):
+        create_batch(client, state, rng, size=min(100, materials - start))
+    for _ in range(len(state.materials) * transfers):
+        transfer_material(client, state, rng)
+    for _ in range(waste):
+        create_waste(client, state, rng)
+    for _ in range(waste // 2):
+        waste_step("transfer", "Created", "InTransit")(client, state, rng)
+    register_company(client, state, rng)
+
+
+def run_client(flask_app, state, scenarios, weights, rng_seed, start, stop, samples):
+    client = flask_app.test_client()
+    rng    = random.Random(rng_seed)
+    while True:
+        t = time.perf_counter()
+        if t >= stop:
+            return
+        sc = rng.choices(scenarios, weights)[0]
+        try:
+            status = sc.run(client, state, rng)
+        except Exception as e:
+            status = type(e).__name__   # the client side broke, not the app
+        elapsed = time.perf_counter() - t
+        if t >= start:
+            samples.append((label(sc), elapsed, status, status in sc.ok))
+
+
+# ─── Reporting ─────────────────────────────────────────────────────────────────
+def percentile(ordered, p):
+    # nearest rank
+    if not ordered:
+        return None
+    k = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[k]
+
+
+def summarize(latencies, statuses, errors, window):
+    ordered = sorted(latencies)
+    ms      = lambda v: None if v is None else round(v * 1000, 3)
+    return {
+        "requests": len(ordered),
+        "errors":   errors,
+        "statuses": dict(sorted(statuses.items())),
+        "rps":      round(len(ordered) / window, 2),
+        "mean_ms":  ms(sum(ordered) / len(ordered)) if ordered else None,
+        "p50_ms":   ms(percentile(ordered, 50)),
+        "p95_ms":   ms(percentile(ordered, 95)),
+        "p99_ms":   ms(percentile(ordered, 99)),
+        "max_ms":   ms(ordered[-1]) if ordered else None
+    }
+
+
+def aggregate(samples, window):
+    groups = defaultdict(lambda: ([], defaultdict(int), [0]))
+    every  = ([], defaultdict(int), [0])
+    for name, elapsed, status, ok in samples:
+        for latencies, statuses, errors in (groups[name], every):
+            latencies.append(elapsed)
+            statuses[str(status)] += 1
+            errors[0] += not ok
+    endpoints = {name: summarize(lat, st, err[0], window)
+                 for name, (lat, st, err) in sorted(groups.items())}
+    return endpoints, summarize(every[0], every[1], every[2][0], window)
+
+
+def git_revision():
+    try:
+        rev   = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return rev + ("-dirty" if dirty else "")
+
+
+def fmt(v, width=9):
+    return f"{'-':>{width}}" if v is None else f"{v:>{width}.1f}"
+
+
+def print_table(result, out=sys.stderr):
+    print(f"{'endpoint':<62} {'reqs':>6} {'err':>4} {'rps':>8} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}", file=out)
+    rows = list(result["endpoints"].items()) + [("total", result["total"])]
+    for name, s in rows:
+        print(f"{name:<62} {s['requests']:>6} {s['errors']:>4} {s['rps']:>8.1f} "
+              f"{fmt(s['p50_ms'])} {fmt(s['p95_ms'])} {fmt(s['p99_ms'])}", file=out)
+    for name in result["meta"]["skipped"]:
+        print(f"{name:<62} skipped (needs a real MongoDB)", file=out)
+
+
+def compare(base_path, head_path, fail_over=None):
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(head_path) as f:
+        head = json.load(f)
+    print(f"{base['meta'].get('commit')} -> {head['meta'].get('commit')}")
+    print(f"{'endpoint':<62} {'p50':>16} {'p95':>16} {'p99':>16} {'rps':>16}")
+
+    def change(old, new):
+        if old is None or new is None:
+            return f"{'-':>16}", None
+        pct = (new - old) / old * 100 if old else 0.0
+        return f"{new:>8.1f} {pct:>+6.1f}%", pct
+
+    regressed = []
+    for name in sorted(set(base["endpoints"]) | set(head["endpoints"])):
+        old, new = base["endpoints"].get(name, {}), head["endpoints"].get(name, {})
+        cells = []
+        for key in ("p50_ms", "p95_ms", "p99_ms", "rps"):
+            cell, pct = change(old.get(key), new.get(key))
+            cells.append(cell)
+            if key == "p95_ms" and pct is not None and fail_over is not None and pct > fail_over:
+                regressed.append(name)
+        print(f"{name:<62} {' '.join(cells)}")
+    if regressed:
+        print(f"\np95 up more than {fail_over:g}%: " + ", ".join(regressed))
+        return 1
+    return 0
+
+
+# ─── Main ──────────────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Load-test every API route in-process")
+    parser.add_argument("--mongo", default="memory",
+                        help="memory (mongomock), ephemeral (temp mongod) or a MongoDB URI")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="unmeasured seconds first")
+    parser.add_argument("--writes", type=float, default=1.0,
+                        help="multiplier on the write routes' weights (0 = read-only)")
+    parser.add_argument("--materials", type=int, default=100, help="materials to seed")
+    parser.add_argument("--transfers", type=int, default=1, help="transfers per seeded material")
+    parser.add_argument("--waste", type=int, default=20, help="waste records to seed")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the JSON result here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"),
+                        help="diff two result files instead of running")
+    parser.add_argument("--fail-over", type=float,
+                        help="with --compare, exit 1 if any p95 rises more than this %%")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(compare(*args.compare, fail_over=args.fail_over))
+
+    # the app reads these when its handles are first built; keep writes snappy
+    # and keep cached reports from an earlier run out of the numbers
+    os.environ.setdefault("RECEIPT_POLL_INTERVAL", "0.02")
+    os.environ.setdefault("CHAIN_CACHE_BLOCK_POLL", "0.1")
+    os.environ.setdefault("REPORT_CACHE_DIR", tempfile.mkdtemp(prefix="bench-reports-"))
+    atexit.register(shutil.rmtree, os.environ["REPORT_CACHE_DIR"], True)
+    os.chdir(ROOT)
+
+    try:
+        mongo            = start_mongo(args.mongo)
+        w3, chain, waste = start_chain()
+    except ImportError as e:
+        sys.exit(f"{e.name} is missing: pip install mongomock 'eth-tester[py-evm]'")
+    api   = wire_app(mongo, w3, chain, waste)
+    state = State(f"{int(time.time()):x}", w3.eth.accounts)
+    token = api.jwt.encode({"companyName": "Acme"}, api.app.config["SECRET_KEY"],
+                           algorithm="HS256")
+    state.auth = {"Authorization": f"Bearer {token}"}
+
+    for name in uncovered_routes(api.app):
+        print(f"warning: no scenario for {name}", file=sys.stderr)
+    skipped   = [label(sc) for sc in SCENARIOS if sc.server_only and args.mongo == "memory"]
+    scenarios = [sc for sc in SCENARIOS if label(sc) not in skipped]
+    weights   = [sc.weight * (args.writes if sc.write else 1) for sc in scenarios]
+
+    t = time.perf_counter()
+    seed(api.app.test_client(), state, random.Random(args.seed),
+         args.materials, args.transfers, args.waste)
+    print(f"seeded {len(state.materials)} materials, {len(state.wasted)} waste records "
+          f"in {time.perf_counter() - t:.1f} s", file=sys.stderr)
+
+    samples = []   # list.append is atomic; no lock needed
+    start   = time.perf_counter() + args.warmup
+    stop    = start + args.duration
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        for i in range(args.concurrency):
+            pool.submit(run_client, api.app, state, scenarios, weights,
+                        args.seed * 1000 + i, start, stop, samples)
+
+    endpoints, total = aggregate(samples, args.duration)
+    result = {
+        "meta": {
+            "commit":      git_revision(),
+            "timestamp":   int(time.time()),
+            "python":      platform.python_version(),
+            "mongo":       "memory" if args.mongo == "memory" else
+                           "ephemeral" if args.mongo == "ephemeral" else "server",
+            "concurrency": args.concurrency,
+            "duration":    args.duration,
+            "warmup":      args.warmup,
+            "writes":      args.writes,
+            "seed":        args.seed,
+            "seeded":      {"materials": args.materials, "transfers": args.transfers,
+                            "waste": args.waste},
+            "skipped":     skipped
+        },
+        "total":     total,
+        "endpoints": endpoints
+    }
+
+    print_table(result)
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
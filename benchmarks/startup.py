@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+"""
+benchmarks/startup.py
+
+How long it takes before the API can serve anything.
+
+    python benchmarks/startup.py            # 10 cold imports
+    python benchmarks/startup.py --runs 30
+
+Each run imports `app` in a fresh interpreter, pointed at a MongoDB and an
+RPC node that don't exist, so the number is pure import + create_app()
+cost and shows that startup no longer needs either service.  It also
+times loading the ABIs from the cached abi/ copies against parsing the
+full Hardhat artifacts.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from abis import ARTIFACTS, load_abi
+
+IMPORT_SNIPPET = """
+import time
+t = time.perf_counter()
+import app
+print(time.perf_counter() - t)
+"""
+
+# nothing listens on these; an import that tries to connect fails or hangs
+OFFLINE_ENV = {
+    "MONGODB_URI":   "mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=2000",
+    "HTTP_PROVIDER": "http://127.0.0.1:1"
+}
+
+
+def cold_import(runs):
+    env = dict(os.environ, **OFFLINE_ENV)
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=env,
+                             capture_output=True, text=True, timeout=120)
+        if out.returncode != 0:
+            print(out.stderr.strip().splitlines()[-1])
+            sys.exit("import app failed without MongoDB / RPC node")
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return times
+
+
+def abi_load(runs):
+    os.chdir(ROOT)
+    artifact, cached = [], []
+    for _ in range(runs):
+        t = time.perf_counter()
+        for path in ARTIFACTS.values():
+            with open(path) as f:
+                json.load(f)["abi"]
+        artifact.append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        for name in ARTIFACTS:
+            load_abi(name)
+        cached.append(time.perf_counter() - t)
+    return artifact, cached
+
+
+def report(label, times):
+    ms = [t * 1000 for t in times]
+    print(f"{label:<28} median {statistics.median(ms):8.2f} ms   "
+          f"min {min(ms):8.2f} ms   max {max(ms):8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API startup time")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    report("import app (services down)", cold_import(args.runs))
+    artifact, cached = abi_load(args.runs * 10)
+    report("ABIs from artifacts", artifact)
+    report("ABIs from abi/ cache", cached)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+"""
+benchmarks/transfer_schema.py
+
+What dropping the stored transferPath saves, and what rebuilding it on read
+costs, for /api/materials/<id>/transfers.
+
+    python benchmarks/transfer_schema.py                  # 10k transfers, 20 rounds
+    python benchmarks/transfer_schema.py --docs 100000 --rounds 5
+
+Compares BSON bytes per transfer document in the old (from, to and a
+GeometryCollection repeating both) and compact (from and to only) shapes,
+then the time from the BSON the driver receives to the response body:
+decode and encode for stored paths, decode, with_transfer_path() and encode
+for compact ones.  No MongoDB needed; for the sizes of a real collection,
+`python migrations.py` prints them before and after the migration.
+"""
+
+import argparse
+import gc
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import bson
+from bson import ObjectId
+from flask import Flask
+
+from app import with_transfer_path
+from json_provider import FastJSONProvider
+
+
+def point(rng):
+    return {"type": "Point",
+            "coordinates": [round(rng.uniform(-180, 180), 5), round(rng.uniform(-85, 85), 5)]}
+
+
+def compact_docs(n, seed=1):
+    # as app.transfer_record() writes them
+    rng = random.Random(seed)
+    return [{
+        "_id":         ObjectId(),
+        "materialId":  f"MAT-{i // 8:06d}",
+        "companyName": rng.choice(["Acme", "Globex", "Initech", "Umbrella"]),
+        "from":        point(rng),
+        "to":          point(rng),
+        "timestamp":   1_700_000_000 + i * 37,
+        "description": "Lithium cells, pallet %d" % rng.randint(1, 500),
+        "status":      "In Transit",
+        "txHash":      "0x" + rng.randbytes(32).hex()
+    } for i in range(n)]
+
+
+def bench(fn, rounds):
+    times = []
+    for _ in range(rounds):
+        gc.collect()
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the compact transfer schema")
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    # what list_transfers gets from the driver ({"_id": 0} projection), as BSON
+    compact = compact_docs(args.docs)
+    for d in compact:
+        del d["_id"]
+    old_bson = b"".join(bson.encode(with_transfer_path(dict(d))) for d in compact)
+    new_bson = b"".join(bson.encode(d) for d in compact)
+    print(f"stored   old {len(old_bson) / args.docs:7.1f} B/doc   "
+          f"compact {len(new_bson) / args.docs:7.1f} B/doc   "
+          f"{(len(new_bson) - len(old_bson)) / len(old_bson) * 100:+.1f}%")
+
+    app      = Flask(__name__)
+    provider = FastJSONProvider(app)
+
+    def stored():
+        return provider.response(bson.decode_all(old_bson)).get_data()
+
+    def rebuilt():
+        return provider.response([with_transfer_path(t)
+                                  for t in bson.decode_all(new_bson)]).get_data()
+
+    gc.freeze()   # keep the imports' heap out of every collection we time
+    with app.app_context():
+        same  = stored() == rebuilt()
+        t_old = bench(stored, args.rounds)
+        t_new = bench(rebuilt, args.rounds)
+    print(f"response stored path {t_old * 1000:8.2f} ms   rebuilt {t_new * 1000:8.2f} ms   "
+          f"{(t_new - t_old) / t_old * 100:+.1f}%   identical body: {same}")
+
+
+if __name__ == "__main__":
+    main()
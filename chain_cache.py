@@ -0,0 +1,107 @@
+"""
+chain_cache.py
+
+Read-through cache for contract view calls (getMaterial / getWaste).
+
+Entries are only valid for the block they were read at: the cache checks
+the head block at most once every `block_poll_interval` seconds and drops
+everything when it has moved.  Routes that send a transaction invalidate
+the affected key themselves so their own writes are visible immediately.
+Size is bounded; the least recently used entry is evicted first.
+
+AsyncChainCache is the same cache for an AsyncWeb3 (asgi.py): the head
+check and the loader are awaited instead of called.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class ChainCache:
+    def __init__(self, w3, maxsize=10000, block_poll_interval=1.0):
+        self.w3                  = w3
+        self.maxsize             = maxsize
+        self.block_poll_interval = block_poll_interval
+
+        self._entries       = OrderedDict()
+        self._lock          = threading.Lock()
+        self._generation    = 0      # bumped on every clear/invalidate
+        self._block         = None
+        self._block_checked = 0.0
+
+        self.hits   = 0
+        self.misses = 0
+
+    def get(self, key, loader):
+        """Return the cached value for `key`, calling `loader()` on a miss.
+
+        Exceptions from the loader (e.g. ContractLogicError for an unknown id)
+        propagate and are not cached.
+        """
+        self._check_block()
+        hit, value, generation = self._lookup(key)
+        if hit:
+            return value
+        value = loader()
+        self._store(key, value, generation)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def _lookup(self, key):
+        # (hit, value, generation to pass to _store on a miss)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key], None
+            self.misses += 1
+            return False, None, self._generation
+
+    def _store(self, key, value, generation):
+        with self._lock:
+            # a block or our own write landed while we were loading: the value
+            # may already be stale, so hand it back without caching it
+            if generation == self._generation:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+    def _block_due(self):
+        now = time.monotonic()
+        if now - self._block_checked < self.block_poll_interval:
+            return False
+        self._block_checked = now
+        return True
+
+    def _new_block(self, block):
+        if block != self._block:
+            self._block = block
+            self.clear()
+
+    def _check_block(self):
+        if self._block_due():
+            self._new_block(self.w3.eth.block_number)
+
+
+class AsyncChainCache(ChainCache):
+    async def get(self, key, loader):
+        """Like ChainCache.get; `loader()` returns an awaitable."""
+        if self._block_due():
+            self._new_block(await self.w3.eth.block_number)
+        hit, value, generation = self._lookup(key)
+        if hit:
+            return value
+        value = await loader()
+        self._store(key, value, generation)
+        return value
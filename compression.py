@@ -0,0 +1,149 @@
+"""
+compression.py
+
+Content-Encoding by Accept-Encoding: brotli when the client takes it and
+the brotli module is installed, gzip otherwise.
+
+    compression.init_app(app)                                  # Flask after_request hook
+    coding = compression.negotiate(request.headers.get("Accept-Encoding"))
+    resp   = compression.compress_response(resp, coding)       # Starlette response
+
+Only text-like bodies (JSON, NDJSON, CSV) are compressed, and only from
+COMPRESS_MIN_SIZE bytes (default 1024): below that the headers and the
+CPU cost more than the bytes saved.  A streamed body's size isn't known
+up front, so it is always compressed, a chunk at a time and flushed after
+each one, so the client still gets data as it is produced.  Left alone:
+responses that already carry a Content-Encoding (the gzipped fleet
+exports), Server-Sent Events (compressing would buffer events), PDFs
+and 206s.
+
+A compressed body is a different representation from the identity one,
+so its strong ETag ("MAT1-4") becomes weak (W/"MAT1-4"), as nginx does;
+If-None-Match compares weakly, so either form revalidates.  Every
+compressible response carries Vary: Accept-Encoding.  Compression time
+counts as the "serialize" phase in /metrics.
+"""
+
+import os
+import zlib
+
+from flask import request
+from werkzeug.http import parse_accept_header
+
+from metrics import phase
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_SIZE       = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL     = 6
+BROTLI_QUALITY = 5      # dynamic bodies: most of the ratio of 11, a fraction of the CPU
+
+COMPRESSIBLE = frozenset({
+    "application/json", "application/geo+json", "application/x-ndjson",
+    "text/csv", "text/plain", "text/html",
+})
+
+# preferred first: best_match() picks the earliest on equal quality
+CODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding, codings=CODINGS):
+    """The coding of `codings` to use for an Accept-Encoding header value,
+    or None; q=0 refuses a coding."""
+    if not accept_encoding:
+        return None
+    return parse_accept_header(accept_encoding).best_match(codings)
+
+def compress(body, coding):
+    with phase("serialize"):
+        if coding == "br":
+            return brotli.compress(body, quality=BROTLI_QUALITY)
+        return zlib.compress(body, GZIP_LEVEL, wbits=31)   # wbits=31 -> gzip container
+
+def compress_chunks(chunks, coding):
+    # flushed after every chunk, so each one reaches the client as it's produced
+    if coding == "br":
+        z = brotli.Compressor(quality=BROTLI_QUALITY)
+        step, finish = (lambda c: z.process(c) + z.flush()), z.finish
+    else:
+        z = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        step, finish = (lambda c: z.compress(c) + z.flush(zlib.Z_SYNC_FLUSH)), z.flush
+    for chunk in chunks:
+        data = step(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield finish()
+
+def weak(etag):
+    # header value -> weak form; None and already-weak tags pass through
+    if etag and not etag.startswith("W/"):
+        return "W/" + etag
+    return etag
+
+def vary(headers):
+    # add Accept-Encoding to Vary, keeping whatever is there
+    current = headers.get("Vary")
+    if not current:
+        headers["Vary"] = "Accept-Encoding"
+    elif "accept-encoding" not in current.lower():
+        headers["Vary"] = current + ", Accept-Encoding"
+
+
+# ─── Flask integration ─────────────────────────────────────────────────────────
+def _compress(response):
+    if response.status_code == 304:
+        # the ETag and Vary a 200 would have had, so the client's stored ones stay current
+        if "ETag" in response.headers:
+            vary(response.headers)
+            if negotiate(request.headers.get("Accept-Encoding")):
+                response.headers["ETag"] = weak(response.headers["ETag"])
+        return response
+    if response.mimetype not in COMPRESSIBLE or "Content-Encoding" in response.headers \
+            or response.status_code == 206 or response.direct_passthrough:
+        return response
+
+    vary(response.headers)
+    coding = negotiate(request.headers.get("Accept-Encoding"))
+    if coding is None:
+        return response
+    if response.is_streamed:
+        response.response = compress_chunks(response.response, coding)
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body) < MIN_SIZE:
+            return response
+        response.set_data(compress(body, coding))
+    response.headers["Content-Encoding"] = coding
+    if "ETag" in response.headers:
+        response.headers["ETag"] = weak(response.headers["ETag"])
+    return response
+
+def init_app(app):
+    app.after_request(_compress)
+
+
+# ─── Starlette integration ─────────────────────────────────────────────────────
+def compress_response(resp, coding):
+    """_compress() for a buffered Starlette response (the native routes)."""
+    if resp.status_code == 304:
+        if "etag" in resp.headers:
+            vary(resp.headers)
+            if coding:
+                resp.headers["ETag"] = weak(resp.headers["etag"])
+        return resp
+    if resp.media_type not in COMPRESSIBLE or "content-encoding" in resp.headers:
+        return resp
+
+    vary(resp.headers)
+    if coding is None or len(resp.body) < MIN_SIZE:
+        return resp
+    resp.body = compress(resp.body, coding)
+    resp.headers["Content-Length"]   = str(len(resp.body))
+    resp.headers["Content-Encoding"] = coding
+    if "etag" in resp.headers:
+        resp.headers["ETag"] = weak(resp.headers["etag"])
+    return resp
@@ -0,0 +1,159 @@
+"""
+consistency.py
+
+Reads on secondaries without losing read-your-writes.
+
+    replicas = db.with_options(read_preference=read_preference("secondaryPreferred"))
+    consistency.init_app(app, client)            # per-request causal sessions
+    consistency.bind(replicas["transfers"]).find(...)
+    materials_col.insert_one(doc, session=consistency.session())
+
+Each request that touches Mongo through bind() / session() runs in one
+causally consistent session.  Its responses carry the session's cluster
+and operation time as an opaque X-Consistency-Token; a client that sends
+that token back (same header, or ?consistencyToken= where it can't set
+headers) gets a session advanced to it, so a secondary answering the read
+first waits until it has applied everything the token covers.  Clients
+that send nothing read whatever the secondary has, up to
+maxStalenessSeconds behind.
+
+Within one request the session also orders its own reads: an ETag
+sequence read on the primary followed by a body read on a secondary never
+returns a body older than the ETag.
+
+Without init_app() (READ_PREFERENCE=primary) session() is None and bind()
+returns the collection unchanged: no sessions, no tokens.  Writes made by
+background job threads have no request and so no token; a client polling
+GET /api/jobs/<id> gets one with the finished job instead.
+"""
+
+import base64
+import binascii
+
+import bson
+from bson.errors import BSONError
+from flask import current_app, g, has_request_context, jsonify, request
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, \
+    SecondaryPreferred
+
+HEADER = "X-Consistency-Token"
+PARAM  = "consistencyToken"
+
+READ_PREFERENCES = {
+    "primary":            Primary,
+    "primaryPreferred":   PrimaryPreferred,
+    "secondary":          Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest":            Nearest,
+}
+
+# Collection methods that take a session; bind() passes it to these
+SESSION_METHODS = frozenset({
+    "find", "find_one", "aggregate", "count_documents", "distinct",
+    "insert_one", "insert_many", "update_one", "update_many", "bulk_write",
+    "find_one_and_update", "delete_one", "delete_many",
+})
+
+
+def read_preference(name, max_staleness=-1):
+    """A read preference from its mode name; max_staleness in seconds
+    (-1 = no limit, and ignored for primary)."""
+    try:
+        mode = READ_PREFERENCES[name]
+    except KeyError:
+        raise ValueError(f"unknown read preference {name!r}; "
+                         f"use one of {', '.join(READ_PREFERENCES)}") from None
+    return mode() if mode is Primary else mode(max_staleness=max_staleness)
+
+
+# ─── Tokens ────────────────────────────────────────────────────────────────────
+def encode_token(session):
+    if session.operation_time is None:
+        return None     # standalone server, or nothing done in the session yet
+    raw = bson.encode({"c": session.cluster_time, "o": session.operation_time})
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_token(token):
+    """(cluster time, operation time); ValueError if it isn't a token.
+    The cluster time is signed by the server, so a forged one is rejected
+    by Mongo rather than trusted."""
+    try:
+        doc = bson.decode(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if not isinstance(doc["c"], dict) or not isinstance(doc["o"], bson.Timestamp):
+            raise ValueError
+        return doc["c"], doc["o"]
+    except (BSONError, binascii.Error, KeyError, ValueError):
+        raise ValueError("invalid consistency token") from None
+
+def request_token():
+    return request.headers.get(HEADER) or request.args.get(PARAM)
+
+
+# ─── Per-request session ───────────────────────────────────────────────────────
+def session():
+    """This request's causally consistent session, started on first use;
+    None outside a request or when init_app() wasn't called."""
+    if not has_request_context():
+        return None
+    client = current_app.extensions.get("consistency")
+    if client is None:
+        return None
+    s = g.get("mongo_session")
+    if s is None:
+        s = g.mongo_session = client.start_session(causal_consistency=True)
+        token = request_token()
+        if token:
+            # _check_token() has already vetted it
+            cluster_time, operation_time = decode_token(token)
+            s.advance_cluster_time(cluster_time)
+            s.advance_operation_time(operation_time)
+    return s
+
+
+class SessionCollection:
+    """A collection whose calls all run in one session."""
+    __slots__ = ("_col", "_session")
+
+    def __init__(self, col, session):
+        self._col     = col
+        self._session = session
+
+    def __getattr__(self, name):
+        attr = getattr(self._col, name)
+        if name not in SESSION_METHODS:
+            return attr
+        return lambda *args, **kwargs: attr(*args, session=self._session, **kwargs)
+
+def bind(col):
+    s = session()
+    return col if s is None else SessionCollection(col, s)
+
+
+# ─── Flask integration ─────────────────────────────────────────────────────────
+def _check_token():
+    # a bad token is the client's mistake; say so before any handler runs
+    token = request_token()
+    if token:
+        try:
+            decode_token(token)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+def _add_token(response):
+    s = g.get("mongo_session")
+    if s is not None:
+        token = encode_token(s)
+        if token:
+            response.headers[HEADER] = token
+    return response
+
+def _end_session(exc):
+    s = g.pop("mongo_session", None)
+    if s is not None:
+        s.end_session()
+
+def init_app(app, client):
+    app.extensions["consistency"] = client
+    app.before_request(_check_token)
+    app.after_request(_add_token)
+    app.teardown_request(_end_session)
@@ -0,0 +1,168 @@
+"""
+feed.py
+
+Live transfer / waste-history events for GET /api/transfers/stream.
+
+One thread per process follows the `transfers` and `waste_history`
+collections and fans new documents out to every subscriber, so a room of
+dashboards costs one tailing query (or one change stream), not one log
+rebuild per screen per poll.
+
+    feed = TransferFeed({"transfer": db["transfers"], "waste": db["waste_history"]})
+    sub  = feed.subscribe()
+    ev   = sub.get(timeout=15)        # {"id", "type", "data"} or None
+    for ev in feed.replay(ObjectId(last_event_id), {"transfer": {}}): ...
+    feed.unsubscribe(sub)
+
+Event ids are the documents' ObjectIds, so a client reconnecting with
+Last-Event-ID is caught up from Mongo itself (`_id > id`, on the default
+_id index) whichever worker it lands on, and whether the events were
+written by this process, another worker or indexer.py.
+
+Sources:
+  * polling (default): every poll_interval, or as soon as poke() is called
+    by a route that just wrote, re-read the last `lag` seconds by _id and
+    publish what hasn't been seen.  The overlap catches documents another
+    process inserted with a slightly older ObjectId.
+  * change_stream=True: a change stream on inserts into both collections
+    (needs a replica set), resumed with its token after errors.
+"""
+
+import heapq
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+
+PROJECTION = {"transferPath": 0}
+
+
+def to_event(kind, doc):
+    oid = doc.pop("_id")
+    doc.pop("transferPath", None)
+    return {"id": str(oid), "oid": oid, "type": kind, "data": doc}
+
+
+class Subscription:
+    def __init__(self, maxsize):
+        self.closed = False     # set when the client fell too far behind
+        self._q     = queue.Queue(maxsize)
+
+    def get(self, timeout):
+        try:
+            return self._q.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class TransferFeed:
+    def __init__(self, sources, poll_interval=1.0, lag=5, change_stream=False,
+                 queue_size=1000):
+        self.sources       = sources        # event type -> collection
+        self.poll_interval = poll_interval
+        self.lag           = lag
+        self.change_stream = change_stream
+        self.queue_size    = queue_size
+
+        self._subs    = set()
+        self._lock    = threading.Lock()
+        self._wake    = threading.Event()
+        self._seen    = set()               # ObjectIds published in the lag window
+        self._start   = None                # nothing older than this goes live
+        self._started = False
+
+    # ── public API ────────────────────────────────────────────────────────────
+    def subscribe(self):
+        sub = Subscription(self.queue_size)
+        with self._lock:
+            self._subs.add(sub)
+            if not self._started:
+                self._start = ObjectId()
+                target = self._watch if self.change_stream else self._poll_loop
+                threading.Thread(target=target, name="transfer-feed", daemon=True).start()
+                self._started = True
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subs.discard(sub)
+
+    def poke(self):
+        """Something was just written; poll now instead of at the next tick."""
+        self._wake.set()
+
+    def replay(self, after, filters, batch_size=1000):
+        """Events with _id > after, oldest first, merged across the sources.
+
+        filters: event type -> extra query for that source; types missing
+        from it are skipped."""
+        def events(kind, col):
+            cursor = col.find(dict(filters[kind], _id={"$gt": after}), PROJECTION)\
+                        .sort("_id", 1).batch_size(batch_size)
+            for doc in cursor:
+                yield to_event(kind, doc)
+
+        return heapq.merge(*(events(kind, col) for kind, col in self.sources.items()
+                             if kind in filters), key=lambda ev: ev["oid"])
+
+    # ── fan-out ───────────────────────────────────────────────────────────────
+    def _publish(self, event):
+        with self._lock:
+            subs = list(self._subs)
+        for sub in subs:
+            try:
+                sub._q.put_nowait(event)
+            except queue.Full:
+                # a stalled client; it reconnects and replays from its last id
+                sub.closed = True
+                self.unsubscribe(sub)
+
+    # ── polling source ────────────────────────────────────────────────────────
+    def _poll_loop(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self._poll()
+            except PyMongoError as e:
+                print(f"Transfer feed: {e}", flush=True)
+                time.sleep(self.poll_interval)
+
+    def _poll(self):
+        floor = ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(seconds=self.lag))
+        self._seen = {oid for oid in self._seen if oid >= floor}
+        with self._lock:
+            if not self._subs:
+                # nobody listening; don't publish a backlog to the next client
+                self._start = ObjectId()
+                return
+        since  = max(floor, self._start)
+        events = []
+        for kind, col in self.sources.items():
+            for doc in col.find({"_id": {"$gte": since}}, PROJECTION).sort("_id", 1):
+                if doc["_id"] not in self._seen:
+                    self._seen.add(doc["_id"])
+                    events.append(to_event(kind, doc))
+        events.sort(key=lambda ev: ev["oid"])
+        for event in events:
+            self._publish(event)
+
+    # ── change stream source ──────────────────────────────────────────────────
+    def _watch(self):
+        kinds = {col.name: kind for kind, col in self.sources.items()}
+        db    = next(iter(self.sources.values())).database
+        match = [{"$match": {"operationType": "insert", "ns.coll": {"$in": list(kinds)}}}]
+        token = None
+        while True:
+            try:
+                with db.watch(match, resume_after=token) as stream:
+                    for change in stream:
+                        token = stream.resume_token
+                        kind  = kinds[change["ns"]["coll"]]
+                        self._publish(to_event(kind, change["fullDocument"]))
+            except PyMongoError as e:
+                print(f"Transfer feed: {e}", flush=True)
+                time.sleep(self.poll_interval)
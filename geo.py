@@ -0,0 +1,167 @@
+"""
+geo.py
+
+Map helpers: slippy-map tile math, Douglas–Peucker line simplification and
+a small TTL cache for rendered tiles.
+
+Coordinates are GeoJSON order, [lng, lat].  Tiles use the usual web
+mercator z/x/y scheme, so the output lines up with any OSM-style base map.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+MAX_LAT  = 85.0511287798   # web mercator cuts off here
+TILE_PX  = 256
+
+
+# ─── Tile math ─────────────────────────────────────────────────────────────────
+def lng_to_x(lng, z):
+    return int((lng + 180.0) / 360.0 * (1 << z))
+
+def lat_to_y(lat, z):
+    lat = max(-MAX_LAT, min(MAX_LAT, lat))
+    r   = math.radians(lat)
+    return int((1.0 - math.asinh(math.tan(r)) / math.pi) / 2.0 * (1 << z))
+
+def tile_bbox(z, x, y):
+    """(west, south, east, north) of a tile, in degrees."""
+    n = 1 << z
+    def lat(yy):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * yy / n))))
+    return (x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y))
+
+def parse_bbox(value):
+    """"west,south,east,north" -> a tuple of floats; ValueError unless all
+    four are finite, in range and min <= max."""
+    try:
+        west, south, east, north = (float(v) for v in value.split(","))
+    except ValueError:
+        raise ValueError("bbox must be west,south,east,north")
+    if not all(math.isfinite(v) for v in (west, south, east, north)):
+        raise ValueError("bbox values must be finite numbers")
+    if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+        raise ValueError("bbox must have -180 <= west <= east <= 180 "
+                         "and -90 <= south <= north <= 90")
+    return west, south, east, north
+
+def tiles_for_bbox(bbox, z):
+    """Every (x, y) tile at zoom z that overlaps bbox=(west, south, east, north)."""
+    west, south, east, north = bbox
+    top = (1 << z) - 1
+    x0, x1 = max(0, lng_to_x(west, z)), min(top, lng_to_x(east, z))
+    y0, y1 = max(0, lat_to_y(north, z)), min(top, lat_to_y(south, z))
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+def union_bbox(boxes):
+    boxes = list(boxes)
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+# 2dsphere treats polygon edges as great circles and, by default, takes the
+# smaller of the two regions a ring encloses.  The strict-winding CRS makes a
+# counter-clockwise ring mean "the inside", so world-sized boxes at low zoom
+# work; densifying the edges keeps them close to lines of latitude.
+STRICT_WINDING = {"type": "name",
+                  "properties": {"name": "urn:x-mongodb:crs:strictwinding:EPSG:4326"}}
+EDGE_STEP = 10.0   # degrees between extra vertices
+
+def _steps(a, b):
+    n = max(1, math.ceil(abs(b - a) / EDGE_STEP))
+    return [a + (b - a) * i / n for i in range(n)]
+
+def bbox_polygon(bbox):
+    """GeoJSON Polygon for a bbox, for $geoWithin against a 2dsphere index."""
+    west, south, east, north = bbox
+    ring  = [[x, south] for x in _steps(west, east)]
+    ring += [[east, y] for y in _steps(south, north)]
+    ring += [[x, north] for x in _steps(east, west)]
+    ring += [[west, y] for y in _steps(north, south)]
+    ring.append([west, south])
+    return {"type": "Polygon", "coordinates": [ring], "crs": STRICT_WINDING}
+
+def line_bbox(coords):
+    lngs = [c[0] for c in coords]
+    lats = [c[1] for c in coords]
+    return (min(lngs), min(lats), max(lngs), max(lats))
+
+def overlaps(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+def line_touches(coords, bbox):
+    # segment-by-segment bounding-box test; cheap and errs on the side of
+    # including a route in a neighbouring tile
+    if len(coords) == 1:
+        return overlaps(line_bbox(coords), bbox)
+    return any(overlaps(line_bbox(coords[i:i + 2]), bbox) for i in range(len(coords) - 1))
+
+
+# ─── Simplification ────────────────────────────────────────────────────────────
+def tolerance_for_zoom(z, pixels=1.0):
+    """Degrees of longitude covered by `pixels` screen pixels at zoom z."""
+    return pixels * 360.0 / (TILE_PX * (1 << z))
+
+def _segment_distance(p, a, b):
+    (px, py), (ax, ay), (bx, by) = p, a, b
+    dx, dy = bx - ax, by - ay
+    if dx == 0 and dy == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+def simplify(coords, tolerance):
+    """Douglas–Peucker; keeps both endpoints.  Iterative, so long routes
+    can't hit the recursion limit."""
+    if len(coords) <= 2 or tolerance <= 0:
+        return list(coords)
+    keep  = [False] * len(coords)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(coords) - 1)]
+    while stack:
+        first, last = stack.pop()
+        worst, index = 0.0, None
+        for i in range(first + 1, last):
+            d = _segment_distance(coords[i], coords[first], coords[last])
+            if d > worst:
+                worst, index = d, i
+        if index is not None and worst > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [c for c, k in zip(coords, keep) if k]
+
+
+# ─── Tile cache ────────────────────────────────────────────────────────────────
+class TileCache:
+    """LRU of rendered tiles that also expires entries after `ttl` seconds,
+    so new transfers show up on the map without explicit invalidation."""
+
+    def __init__(self, maxsize=5000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl     = ttl
+        self._data   = OrderedDict()   # key -> (expires, value)
+        self._lock   = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return None
+            if hit[0] < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return hit[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+
+"""
+indexer.py
+
+Keep MongoDB in sync with the ChainCustody and WasteChain contracts by
+reading their event logs, instead of learning about chain state only from
+the route that sent a transaction.
+
+    python indexer.py            # follow the chain forever
+    python indexer.py --once     # catch up to the head and exit
+
+Logs for both contracts are fetched together with ranged eth_getLogs calls
+and applied with bulk writes.  The last indexed block is stored in the
+`indexer_state` collection after every range, so a restart resumes where
+it left off.  Every write is idempotent (sequence-guarded for materials,
+keyed by (txHash, event) for waste history), so replaying a range after a
+crash — or racing the API routes that write the same records — never
+double-counts.  The analytics rollups (rollups.py) move with the records
+this run actually inserted, the same rule the routes follow.
+
+Indexed `string` event arguments only carry the keccak hash of the id, so
+ids (and descriptions / waste details) are recovered by decoding the
+input of the transaction that emitted the log.
+"""
+
+import argparse
+import os
+import time
+
+from eth_utils import event_abi_to_log_topic
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from web3 import Web3
+
+import rollups
+from abis import load_abi
+
+CHECKPOINT_ID = "chain_events"
+
+WASTE_STATUSES = ["Created", "InTransit", "Delivered", "Disposed"]
+
+MATERIAL_EVENTS = ["MaterialInitialized", "MaterialTransferred"]
+WASTE_EVENTS    = ["Created", "Transferred", "StatusChanged"]
+
+
+def load_contract(w3, name, address):
+    return w3.eth.contract(address=address, abi=load_abi(name))
+
+
+class Indexer:
+    def __init__(self, w3, db, contract, waste_contract,
+                 start_block=0, batch_blocks=2000, confirmations=0):
+        self.w3             = w3
+        self.contract       = contract
+        self.waste_contract = waste_contract
+        self.start_block    = start_block
+        self.batch_blocks   = batch_blocks
+        self.confirmations  = confirmations
+
+        self.materials_col = db["materials"]
+        self.waste_col     = db["waste"]
+        self.history_col   = db["waste_history"]
+        self.rollups_col   = db["rollups"]
+        self.state_col     = db["indexer_state"]
+
+        # topic0 -> (contract, event)
+        self._events = {}
+        for c, names in ((contract, MATERIAL_EVENTS), (waste_contract, WASTE_EVENTS)):
+            for name in names:
+                event = c.events[name]()
+                self._events[event_abi_to_log_topic(event.abi)] = (c, event)
+
+        self._tx_args   = {}   # tx hash -> decoded function arguments
+        self._block_ts  = {}   # block number -> timestamp
+
+    # ── checkpoint ────────────────────────────────────────────────────────────
+    def checkpoint(self):
+        state = self.state_col.find_one({"_id": CHECKPOINT_ID})
+        return state["lastBlock"] if state else self.start_block - 1
+
+    def save_checkpoint(self, block):
+        self.state_col.update_one(
+            {"_id": CHECKPOINT_ID},
+            {"$set": {"lastBlock": block, "updatedAt": int(time.time())}},
+            upsert=True
+        )
+
+    # ── main loop ─────────────────────────────────────────────────────────────
+    def run_once(self):
+        """Index every confirmed block past the checkpoint; returns blocks done."""
+        head  = self.w3.eth.block_number - self.confirmations
+        start = self.checkpoint() + 1
+        done  = 0
+        step  = self.batch_blocks
+        while start <= head:
+            end = min(start + step - 1, head)
+            try:
+                logs = self.w3.eth.get_logs({
+                    "address":   [self.contract.address, self.waste_contract.address],
+                    "fromBlock": start,
+                    "toBlock":   end
+                })
+            except ValueError:
+                # providers cap the size of a getLogs response; retry smaller
+                if step == 1:
+                    raise
+                step = max(1, step // 2)
+                continue
+            self.apply(logs)
+            self.save_checkpoint(end)
+            done  += end - start + 1
+            start  = end + 1
+            step   = self.batch_blocks
+            self._tx_args.clear()
+            self._block_ts.clear()
+        return done
+
+    def follow(self, poll_interval):
+        while True:
+            n = self.run_once()
+            if n:
+                print(f"Indexed {n} blocks, checkpoint at {self.checkpoint()}", flush=True)
+            time.sleep(poll_interval)
+
+    # ── applying logs ─────────────────────────────────────────────────────────
+    def apply(self, logs):
+        material_ops = []
+        history_ops  = []
+        history_info = []  # per history op: (wasteId, $set for the waste doc, timestamp)
+        waste_ops    = []
+        waste_docs   = []  # per waste op: the document it inserts
+        new_holders  = {}  # tx hash -> holder from a Transferred log
+
+        for raw in logs:
+            topic = bytes(raw["topics"][0]) if raw["topics"] else None
+            if topic not in self._events:
+                continue
+            c, event = self._events[topic]
+            log  = event.process_log(raw)
+            args = self._tx_arguments(c, log.transactionHash)
+            if args is None:
+                continue
+            tx_hash = log.transactionHash.hex()
+            name    = log.event
+
+            if name == "MaterialInitialized":
+                material_ops.append(UpdateOne(
+                    {"materialId": args["_id"]},
+                    {"$setOnInsert": {
+                        "materialId":    args["_id"],
+                        "description":   args["_description"],
+                        "metadata":      {},
+                        "currentHolder": log.args.holder,
+                        "lastSequence":  1,
+                        "status":        "Created",
+                        "createdAt":     self._timestamp(log.blockNumber),
+                        "txHash":        tx_hash
+                    }},
+                    upsert=True
+                ))
+            elif name == "MaterialTransferred":
+                seq = log.args.sequence
+                material_ops.append(UpdateOne(
+                    {"materialId": args["_id"], "lastSequence": {"$lt": seq}},
+                    {"$set": {
+                        "currentHolder": log.args.to,
+                        "lastSequence":  seq,
+                        "status":        "In Transit",
+                        "txHash":        tx_hash
+                    }}
+                ))
+            elif name == "Created":
+                doc = {
+                    "wasteId":       args["wasteId"],
+                    "wasteType":     args["wasteType"],
+                    "hazardClass":   args["hazardClass"],
+                    "quantity":      args["quantity"],
+                    "units":         args["units"],
+                    "currentHolder": log.args.generator,
+                    "status":        "Created",
+                    "sequence":      1,
+                    "createdAt":     self._timestamp(log.blockNumber)
+                }
+                waste_ops.append(UpdateOne({"wasteId": args["wasteId"]},
+                                           {"$setOnInsert": doc}, upsert=True))
+                waste_docs.append(doc)
+            elif name == "Transferred":
+                # applied with the StatusChanged that follows it in the same tx
+                new_holders[tx_hash] = log.args.to
+            elif name == "StatusChanged":
+                status = WASTE_STATUSES[log.args.status]
+                fields = {"status": status}
+                if tx_hash in new_holders:
+                    fields["currentHolder"] = new_holders[tx_hash]
+                history_ops.append(UpdateOne(
+                    {"txHash": tx_hash, "event": status},
+                    {"$setOnInsert": {
+                        "wasteId":     args["wasteId"],
+                        "event":       status,
+                        "timestamp":   self._timestamp(log.blockNumber),
+                        "txHash":      tx_hash,
+                        "blockNumber": log.blockNumber
+                    }},
+                    upsert=True
+                ))
+                history_info.append((args["wasteId"], fields,
+                                     self._timestamp(log.blockNumber)))
+
+        self._bulk(self.materials_col, material_ops)
+        rollup_ops = [op for i in sorted(self._bulk(self.waste_col, waste_ops))
+                      for op in rollups.waste_created_ops(waste_docs[i])]
+
+        # only history rows this run actually inserted move the waste record,
+        # so a replay (or a route that already wrote the step) is a no-op.
+        # One at a time, in order: the rollups need the status each step
+        # moves the waste out of.
+        inserted = self._bulk(self.history_col, history_ops)
+        for i, (waste_id, fields, timestamp) in enumerate(history_info):
+            if i not in inserted:
+                continue
+            before = self.waste_col.find_one_and_update(
+                {"wasteId": waste_id}, {"$set": fields, "$inc": {"sequence": 1}},
+                projection={"_id": 0}, return_document=ReturnDocument.BEFORE
+            )
+            if before is not None:
+                rollup_ops += rollups.waste_step_ops(before, {**before, **fields}, timestamp)
+        if rollup_ops:
+            # best-effort, like the routes: the records are already written
+            # and won't be replayed; `python rollups.py` repairs a miss
+            try:
+                self.rollups_col.bulk_write([UpdateOne(key, update, upsert=True)
+                                             for key, update in rollup_ops], ordered=False)
+            except PyMongoError as e:
+                print(f"Rollups: {e}", flush=True)
+
+    def _bulk(self, col, ops):
+        # Ordered, because a transfer must land after the create it follows.
+        # Returns the indexes of ops that upserted a new document.
+        upserted = set()
+        start    = 0
+        while start < len(ops):
+            try:
+                result = col.bulk_write(ops[start:], ordered=True)
+            except BulkWriteError as e:
+                # a duplicate key means an API route inserted the same record
+                # between our filter and our upsert; skip that op and carry on
+                err = e.details["writeErrors"][0]
+                if err["code"] != 11000:
+                    raise
+                upserted |= {start + u["index"] for u in e.details.get("upserted", [])}
+                start += err["index"] + 1
+                continue
+            upserted |= {start + i for i in result.upserted_ids}
+            break
+        return upserted
+
+    def _tx_arguments(self, c, tx_hash):
+        if tx_hash not in self._tx_args:
+            tx = self.w3.eth.get_transaction(tx_hash)
+            try:
+                _, params = c.decode_function_input(tx.get("input") or tx.get("data"))
+            except ValueError:
+                # emitted through some other contract; the id can't be recovered
+                print(f"Skipping log from undecodable tx {tx_hash.hex()}", flush=True)
+                params = None
+            self._tx_args[tx_hash] = params
+        return self._tx_args[tx_hash]
+
+    def _timestamp(self, block_number):
+        if block_number not in self._block_ts:
+            self._block_ts[block_number] = self.w3.eth.get_block(block_number).timestamp
+        return self._block_ts[block_number]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index contract events into MongoDB")
+    parser.add_argument("--once", action="store_true",
+                        help="catch up to the current head and exit")
+    parser.add_argument("--from-block", type=int,
+                        help="reset the checkpoint and start from this block")
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    db     = client["chain_custody_db"]
+    w3     = Web3(Web3.HTTPProvider(os.getenv("HTTP_PROVIDER", "http://127.0.0.1:8545")))
+
+    indexer = Indexer(
+        w3, db,
+        load_contract(w3, "ChainCustody", os.getenv("CONTRACT_ADDRESS")),
+        load_contract(w3, "WasteChain", os.getenv("WASTE_CONTRACT_ADDRESS")),
+        start_block=int(os.getenv("INDEXER_START_BLOCK", "0")),
+        batch_blocks=int(os.getenv("INDEXER_BATCH_BLOCKS", "2000")),
+        confirmations=int(os.getenv("INDEXER_CONFIRMATIONS", "0"))
+    )
+    if args.from_block is not None:
+        indexer.save_checkpoint(args.from_block - 1)
+
+    if args.once:
+        n = indexer.run_once()
+        print(f"Indexed {n} blocks, checkpoint at {indexer.checkpoint()}")
+    else:
+        indexer.follow(float(os.getenv("INDEXER_POLL_INTERVAL", "2")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+jobs.py
+
+Background pipeline for on-chain writes.
+
+A route validates its input, hands two callables to JobQueue.enqueue()
+and answers 202 straight away:
+
+    submit()         -> sends the transaction, returns its hash
+    persist(receipt) -> does the Mongo writes, returns the final document
+
+A pool of submitter threads sends transactions (nonces come from the
+signer pool, so they can run concurrently).  Receipts are awaited by the
+shared ReceiptWaiter rather than one thread per job; when a receipt is
+confirmed the job moves to a pool of confirmer threads that run persist().
+Job state lives in the `jobs` collection so any worker can answer
+GET /api/jobs/<id>.
+
+The queues themselves live in the worker's memory, so a worker that stops
+(restart, crash) leaves its jobs pending for good.  Each JobQueue stamps
+its jobs with an owner id and refreshes their updatedAt every `heartbeat`
+seconds; from the moment a queue starts, it also settles other owners'
+jobs that have gone `stale_after` seconds without one:
+
+    no txHash           -> failed (never sent, as far as anyone recorded)
+    receipt, status 1   -> mined, with no result: persist() died with the
+                           worker, indexer.py writes the record instead
+    receipt, status 0   -> failed, reverted
+    no receipt          -> failed if the node has dropped the transaction,
+                           otherwise looked at again on the next round
+"""
+
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from web3.exceptions import TimeExhausted, TransactionNotFound
+
+PENDING = "pending"
+MINED   = "mined"
+FAILED  = "failed"
+
+
+class JobQueue:
+    def __init__(self, receipts, jobs_col, submitters=1, confirmers=4, ttl_hours=24,
+                 heartbeat=30):
+        self.receipts    = receipts
+        self.jobs_col    = jobs_col
+        self.submitters  = submitters
+        self.confirmers  = confirmers
+        self.ttl         = timedelta(hours=ttl_hours)
+        self.heartbeat   = heartbeat
+        self.stale_after = 3 * heartbeat
+        self.owner       = uuid.uuid4().hex      # this process's queue
+
+        self._submit_q  = queue.Queue()
+        self._confirm_q = queue.Queue()
+        self._lock      = threading.Lock()
+        self._started   = False
+
+    # ── public API ────────────────────────────────────────────────────────────
+    def enqueue(self, kind, subject, submit, persist):
+        job_id = uuid.uuid4().hex
+        now    = int(time.time())
+        self.jobs_col.insert_one({
+            "_id":       job_id,
+            "kind":      kind,
+            "subject":   subject,
+            "owner":     self.owner,
+            "status":    PENDING,
+            "txHash":    None,
+            "result":    None,
+            "error":     None,
+            "createdAt": now,
+            "updatedAt": now,
+            "expiresAt": datetime.utcnow() + self.ttl
+        })
+        self._start()
+        self._submit_q.put((job_id, submit, persist))
+        return job_id
+
+    def queued(self):
+        """(jobs waiting to be sent, mined jobs waiting to be persisted)"""
+        return self._submit_q.qsize(), self._confirm_q.qsize()
+
+    def get(self, job_id, session=None):
+        self._start()     # a worker polled for jobs also settles abandoned ones
+        job = self.jobs_col.find_one({"_id": job_id}, {"expiresAt": 0, "owner": 0},
+                                     session=session)
+        if job:
+            job["jobId"] = job.pop("_id")
+        return job
+
+    def recover(self):
+        """Settle the pending jobs of owners that stopped heartbeating;
+        returns how many were settled."""
+        now     = int(time.time())
+        settled = 0
+        for job in self.jobs_col.find({"status": PENDING, "owner": {"$ne": self.owner},
+                                       "updatedAt": {"$lt": now - self.stale_after}}):
+            fields = self._settle(job)
+            if fields is None:
+                continue
+            fields["updatedAt"] = now
+            # unchanged since we read it, so a second sweeper (or an owner
+            # that was only slow) can't be overwritten
+            settled += self.jobs_col.update_one(
+                {"_id": job["_id"], "status": PENDING, "updatedAt": job["updatedAt"]},
+                {"$set": fields}
+            ).modified_count
+        return settled
+
+    # ── workers ───────────────────────────────────────────────────────────────
+    def _start(self):
+        with self._lock:
+            if self._started:
+                return
+            for i in range(self.submitters):
+                threading.Thread(target=self._submitter, name=f"job-submitter-{i}",
+                                 daemon=True).start()
+            for i in range(self.confirmers):
+                threading.Thread(target=self._confirmer, name=f"job-confirmer-{i}",
+                                 daemon=True).start()
+            threading.Thread(target=self._keeper, name="job-keeper", daemon=True).start()
+            self._started = True
+
+    def _submitter(self):
+        while True:
+            job_id, submit, persist = self._submit_q.get()
+            try:
+                tx_hash = submit()
+            except Exception as e:
+                self._update(job_id, status=FAILED, error=str(e))
+                continue
+            self._update(job_id, txHash=tx_hash.hex())
+            self.receipts.submit(tx_hash).add_done_callback(
+                lambda future, job_id=job_id, persist=persist:
+                    self._confirm_q.put((job_id, future, persist))
+            )
+
+    def _confirmer(self):
+        while True:
+            job_id, future, persist = self._confirm_q.get()
+            try:
+                receipt = future.result()
+            except TimeExhausted as e:
+                self._update(job_id, status=FAILED, error=str(e))
+                continue
+            try:
+                if receipt.status != 1:
+                    self._update(job_id, status=FAILED, error="transaction reverted")
+                    continue
+                result = persist(receipt)
+            except Exception as e:
+                self._update(job_id, status=FAILED, error=str(e))
+                continue
+            self._update(job_id, status=MINED, result=result)
+
+    def _keeper(self):
+        while True:
+            try:
+                self.jobs_col.update_many({"owner": self.owner, "status": PENDING},
+                                          {"$set": {"updatedAt": int(time.time())}})
+                self.recover()
+            except Exception as e:
+                print(f"Jobs: {e}", flush=True)   # Mongo or node away; next round
+            time.sleep(self.heartbeat)
+
+    def _settle(self, job):
+        # final fields for an abandoned job, or None to look again later
+        if not job.get("txHash"):
+            return {"status": FAILED, "error": "worker stopped before sending the transaction"}
+        w3 = self.receipts.w3
+        try:
+            receipt = w3.eth.get_transaction_receipt(job["txHash"])
+        except TransactionNotFound:
+            try:
+                w3.eth.get_transaction(job["txHash"])
+            except TransactionNotFound:
+                return {"status": FAILED,
+                        "error": "worker stopped and the node dropped the transaction"}
+            return None                                 # still waiting to be mined
+        if receipt.status != 1:
+            return {"status": FAILED, "error": "transaction reverted"}
+        return {"status": MINED, "error": None}
+
+    def _update(self, job_id, **fields):
+        fields["updatedAt"] = int(time.time())
+        self.jobs_col.update_one({"_id": job_id}, {"$set": fields})
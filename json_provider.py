@@ -0,0 +1,85 @@
+"""
+json_provider.py
+
+Flask JSON provider that encodes with orjson when it is installed.
+
+Responses here are mostly long arrays of nested GeoJSON, where the stdlib
+encoder is a real share of request time (see benchmarks/json_encode.py).
+Output matches Flask's default provider: same key order (sorted), same
+handling of dates, decimals, UUIDs and dataclasses, plus the types this
+app produces:
+
+    ObjectId          -> "665f..."          (str)
+    HexBytes / bytes  -> "0xabc..."         (0x-prefixed hex)
+    Enum              -> its value
+
+Without orjson, or for a value orjson can't take (integers wider than 64
+bits, e.g. raw uint256 chain values), it falls back to the stdlib encoder
+with the same conversions, so swapping encoders never changes the values
+in a payload (only non-ASCII escaping differs).
+"""
+
+import json
+from enum import Enum
+
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+from metrics import phase
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def default(o):
+    if isinstance(o, ObjectId):
+        return str(o)
+    if isinstance(o, (bytes, bytearray)):
+        return "0x" + bytes(o).hex()
+    if isinstance(o, Enum):
+        return o.value
+    return DefaultJSONProvider.default(o)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    default = staticmethod(default)
+
+    def _orjson_options(self, indent=False):
+        # datetimes go through default() so they render as HTTP dates, like Flask's
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps_bytes(self, obj, indent=False):
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, default=default, option=self._orjson_options(indent))
+            except (orjson.JSONEncodeError, TypeError):
+                pass   # fall through to the stdlib for what orjson can't take
+        return json.dumps(
+            obj, default=default, sort_keys=self.sort_keys, ensure_ascii=self.ensure_ascii,
+            **({"indent": 2} if indent else {"separators": (",", ":")})
+        ).encode()
+
+    def dumps(self, obj, **kwargs):
+        with phase("serialize"):
+            if orjson is None or kwargs:
+                return super().dumps(obj, **kwargs)
+            return self.dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj    = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        with phase("serialize"):
+            body = self.dumps_bytes(obj, indent) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -0,0 +1,66 @@
+"""
+lazy.py
+
+Module-level handles that connect on first use instead of at import.
+
+    client = Lazy(lambda: MongoClient(uri))
+    client.admin.command("ping")      # the MongoClient is built here
+
+The wrapped object is built once per process: a proxy first touched in a
+gunicorn master and then used in a forked worker builds a fresh object in
+the worker, so sockets, locks and background threads are never shared
+across a fork.  The proxy's own attributes are all `_lazy_*` so they never
+shadow the wrapped object's.
+"""
+
+import os
+import threading
+
+
+class Lazy:
+    __slots__ = ("_lazy_factory", "_lazy_obj", "_lazy_pid", "_lazy_lock")
+
+    def __init__(self, factory):
+        object.__setattr__(self, "_lazy_factory", factory)
+        object.__setattr__(self, "_lazy_obj", None)
+        object.__setattr__(self, "_lazy_pid", None)
+        object.__setattr__(self, "_lazy_lock", threading.Lock())
+
+    def _lazy_get(self):
+        """The wrapped object for this process, building it if needed."""
+        pid = os.getpid()
+        if self._lazy_pid != pid:
+            with self._lazy_lock:
+                if self._lazy_pid != pid:
+                    object.__setattr__(self, "_lazy_obj", self._lazy_factory())
+                    object.__setattr__(self, "_lazy_pid", pid)
+        return self._lazy_obj
+
+    def _lazy_reset(self):
+        with self._lazy_lock:
+            object.__setattr__(self, "_lazy_obj", None)
+            object.__setattr__(self, "_lazy_pid", None)
+
+    def _lazy_built(self):
+        """True once the wrapped object exists in this process."""
+        return self._lazy_pid == os.getpid()
+
+    def _lazy_override(self, factory):
+        """Build from `factory` from now on (benchmarks pointing the app at
+        stand-in services); takes effect on the next use."""
+        object.__setattr__(self, "_lazy_factory", factory)
+        self._lazy_reset()
+
+    def __getattr__(self, name):
+        return getattr(self._lazy_get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._lazy_get(), name, value)
+
+    def __getitem__(self, key):
+        return self._lazy_get()[key]
+
+    def __repr__(self):
+        if self._lazy_pid != os.getpid():
+            return f"<Lazy (not built) {self._lazy_factory!r}>"
+        return f"<Lazy {self._lazy_obj!r}>"
@@ -0,0 +1,220 @@
+"""
+metrics.py
+
+Where each request's time goes, and a Prometheus endpoint at GET /metrics.
+
+    metrics.init_app(app)                                      # hooks + /metrics
+    MongoClient(uri, event_listeners=[metrics.MongoListener()])
+    w3.middleware_onion.add(metrics.web3_middleware, "metrics")
+    aw3.middleware_onion.add(metrics.async_web3_middleware, "metrics")   # AsyncWeb3
+    with metrics.phase("receipt_wait"):
+        ...
+
+Every request carries a Timings in a context variable.  The Mongo command
+listener and the web3 middleware run in the thread that makes the call, so
+they charge their time to the current request; an explicit phase() block
+owns everything inside it (the RPCs SignerPool.send makes count as
+tx_submit, not rpc).  Phases, each a per-route histogram:
+
+    mongo          MongoDB commands (find, getMore, insert, ...)
+    rpc            JSON-RPC outside a transaction send (eth_call, ...)
+    tx_submit      SignerPool.send: nonce lock, gas estimate, sign, send
+    receipt_wait   blocked on ReceiptWaiter
+    serialize      JSON encoding (json_provider.py)
+    other          the rest: Flask, validation, Python between calls
+    total          until the response is closed, so streamed bodies count
+
+Calls made outside a request (receipt poller, job workers, chain cache)
+are counted under route="background".  SLOW_REQUEST_MS=<ms> prints one
+line with the breakdown for every request at least that slow:
+
+    slow request: POST /api/materials/<material_id>/transfer 200 1840.2 ms
+      mongo=12.1ms/6 rpc=3.0ms/2 tx_submit=20.4ms receipt_wait=1790.3ms ...
+
+The native async routes in asgi.py are wrapped in @metrics.timed(rule,
+method) and report under the same route labels; their Mongo/RPC time is
+charged through the same hooks, since a context variable follows the task.
+
+Metrics are per process; with several gunicorn workers, scrape each one.
+"""
+
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+
+from flask import Response, request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, \
+    generate_latest
+from pymongo import monitoring
+
+PHASES          = ("mongo", "rpc", "tx_submit", "receipt_wait", "serialize")
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))   # 0 = off
+
+LATENCY_BUCKETS    = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+ROUND_TRIP_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+REQUESTS       = Counter("http_requests", "Requests served",
+                         ["route", "method", "status"])
+PHASE_SECONDS  = Histogram("http_request_phase_seconds", "Time per request spent in each phase",
+                           ["route", "method", "phase"], buckets=LATENCY_BUCKETS)
+ROUND_TRIPS    = Histogram("http_request_round_trips", "Mongo commands / RPC calls per request",
+                           ["route", "method", "kind"], buckets=ROUND_TRIP_BUCKETS)
+RPC_CALLS      = Counter("web3_rpc_calls", "JSON-RPC calls made through web3",
+                         ["route", "rpc_method"])
+MONGO_COMMANDS = Counter("mongo_commands", "MongoDB commands sent",
+                         ["route", "command"])
+
+
+# ─── Per-request timings ───────────────────────────────────────────────────────
+class Timings:
+    __slots__ = ("route", "method", "start", "seconds", "calls", "active")
+
+    def __init__(self, route, method):
+        self.route   = route
+        self.method  = method
+        self.start   = perf_counter()
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.calls   = {"mongo": 0, "rpc": 0}
+        self.active  = None   # the phase() block we're in, if any
+
+    def charge(self, phase, seconds):
+        # calls inside an explicit phase belong to it
+        if self.active is None:
+            self.seconds[phase] += seconds
+
+_current = ContextVar("request_timings", default=None)
+
+def _route():
+    t = _current.get()
+    return t.route if t else "background"
+
+@contextmanager
+def phase(name):
+    t = _current.get()
+    if t is None or t.active is not None:
+        yield   # outside a request, or nested in a phase that owns the time
+        return
+    t.active = name
+    start    = perf_counter()
+    try:
+        yield
+    finally:
+        t.active = None
+        t.seconds[name] += perf_counter() - start
+
+
+# ─── MongoDB / web3 hooks ──────────────────────────────────────────────────────
+class MongoListener(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    def _record(self, event):
+        t = _current.get()
+        MONGO_COMMANDS.labels(t.route if t else "background", event.command_name).inc()
+        if t is not None:
+            t.calls["mongo"] += 1
+            t.charge("mongo", event.duration_micros / 1e6)
+
+def web3_middleware(make_request, w3):
+    def middleware(method, params):
+        t = _current.get()
+        RPC_CALLS.labels(t.route if t else "background", method).inc()
+        if t is None:
+            return make_request(method, params)
+        t.calls["rpc"] += 1
+        start = perf_counter()
+        try:
+            return make_request(method, params)
+        finally:
+            t.charge("rpc", perf_counter() - start)
+    return middleware
+
+async def async_web3_middleware(make_request, w3):
+    async def middleware(method, params):
+        t = _current.get()
+        RPC_CALLS.labels(t.route if t else "background", method).inc()
+        if t is None:
+            return await make_request(method, params)
+        t.calls["rpc"] += 1
+        start = perf_counter()
+        try:
+            return await make_request(method, params)
+        finally:
+            t.charge("rpc", perf_counter() - start)
+    return middleware
+
+def gauge(name, documentation, value):
+    """A gauge read at scrape time; value() returns a number."""
+    Gauge(name, documentation).set_function(value)
+
+
+# ─── Flask integration ─────────────────────────────────────────────────────────
+def _start():
+    rule = request.url_rule
+    _current.set(Timings(rule.rule if rule else "unmatched", request.method))
+
+def _after(response):
+    t = _current.get()
+    if t is not None:
+        status = response.status_code
+        response.call_on_close(lambda: _finish(t, status))
+    return response
+
+def _teardown(exc):
+    _current.set(None)
+
+def _finish(t, status):
+    total = perf_counter() - t.start
+    other = max(0.0, total - sum(t.seconds.values()))
+    REQUESTS.labels(t.route, t.method, str(status)).inc()
+    for name, seconds in t.seconds.items():
+        PHASE_SECONDS.labels(t.route, t.method, name).observe(seconds)
+    PHASE_SECONDS.labels(t.route, t.method, "other").observe(other)
+    PHASE_SECONDS.labels(t.route, t.method, "total").observe(total)
+    for kind, n in t.calls.items():
+        ROUND_TRIPS.labels(t.route, t.method, kind).observe(n)
+
+    if SLOW_REQUEST_MS and total * 1000 >= SLOW_REQUEST_MS:
+        parts = [f"{name}={seconds * 1000:.1f}ms" +
+                 (f"/{t.calls[name]}" if name in t.calls else "")
+                 for name, seconds in t.seconds.items()]
+        print(f"slow request: {t.method} {t.route} {status} {total * 1000:.1f} ms  "
+              + " ".join(parts) + f" other={other * 1000:.1f}ms", flush=True)
+
+def metrics_view():
+    return Response(generate_latest(REGISTRY), content_type=CONTENT_TYPE_LATEST)
+
+# ─── ASGI integration ──────────────────────────────────────────────────────────
+def timed(rule, method):
+    """Decorator for an async endpoint taking a Starlette request; `rule`
+    is the Flask-style route so both servers report the same labels."""
+    def decorator(f):
+        @wraps(f)
+        async def wrapped(request):
+            t     = Timings(rule, method)
+            token = _current.set(t)
+            try:
+                response = await f(request)
+            except Exception:
+                _finish(t, 500)
+                raise
+            finally:
+                _current.reset(token)
+            _finish(t, response.status_code)
+            return response
+        return wrapped
+    return decorator
+
+def init_app(app):
+    app.before_request(_start)
+    app.after_request(_after)
+    app.teardown_request(_teardown)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
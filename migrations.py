@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+"""
+migrations.py
+
+Every MongoDB index the API, indexer.py and reconcile.py rely on, in one
+place, plus the data fixes some of them depend on.  The app no longer
+builds indexes when it is imported; run one of
+
+    flask --app app migrate
+    python migrations.py
+
+after deploying a change here.  Data migrations are idempotent and
+create_index is a no-op for an index that already exists with the same
+spec, so running it again is harmless.  Both print the size of every
+collection and its indexes before and after.
+"""
+
+import os
+
+from pymongo import MongoClient, ASCENDING, GEOSPHERE, UpdateOne
+from pymongo.errors import OperationFailure
+
+# collection -> [(keys, options), ...]
+INDEXES = {
+    "materials": [
+        ([("materialId", ASCENDING)], {"name": "materialId_1", "unique": True}),
+        # covered lookups of the ETag version (app.etag_from)
+        ([("materialId", ASCENDING), ("lastSequence", ASCENDING), ("revision", ASCENDING)],
+         {"name": "materialId_lastSequence_revision_idx"}),
+        ([("location", GEOSPHERE)],   {"name": "location_2dsphere_idx"})
+    ],
+    "transfers": [
+        ([("materialId", ASCENDING), ("timestamp", ASCENDING)], {"name": "material_ts_idx"}),
+        ([("timestamp", ASCENDING), ("_id", ASCENDING)],        {"name": "timestamp_id_idx"}),
+        # map tiles select transfers by either end
+        ([("from", GEOSPHERE)], {"name": "transfers_from_2dsphere"}),
+        ([("to", GEOSPHERE)],   {"name": "transfers_to_2dsphere"})
+    ],
+    "waste": [
+        ([("wasteId", ASCENDING)], {"name": "wasteId_1", "unique": True}),
+        ([("wasteId", ASCENDING), ("sequence", ASCENDING)], {"name": "wasteId_sequence_idx"})
+    ],
+    "waste_history": [
+        ([("wasteId", ASCENDING), ("timestamp", ASCENDING)], {"name": "waste_history_ts_idx"}),
+        ([("from", GEOSPHERE)], {"name": "waste_history_from_2dsphere"}),
+        ([("to", GEOSPHERE)],   {"name": "waste_history_to_2dsphere"}),
+        # one row per (transaction, event); shared key for app.py and indexer.py
+        ([("txHash", ASCENDING), ("event", ASCENDING)],
+         {"name": "txHash_event_1", "unique": True})
+    ],
+    "jobs": [
+        # async write jobs expire a day after they are queued
+        ([("expiresAt", ASCENDING)], {"name": "jobs_expire_idx", "expireAfterSeconds": 0})
+    ],
+    "companies": [
+        ([("companyName", ASCENDING)], {"name": "companyName_1", "unique": True})
+    ],
+    # one document per analytics bucket (rollups.py); unique so concurrent
+    # upserts of a new bucket can't create it twice
+    "rollups": [
+        ([("kind", ASCENDING), ("day", ASCENDING), ("companyName", ASCENDING)],
+         {"name": "rollup_transfers_daily_idx", "unique": True,
+          "partialFilterExpression": {"kind": "transfers_daily"}}),
+        ([("kind", ASCENDING), ("hazardClass", ASCENDING), ("status", ASCENDING),
+          ("units", ASCENDING)],
+         {"name": "rollup_waste_status_idx", "unique": True,
+          "partialFilterExpression": {"kind": "waste_status"}}),
+        ([("kind", ASCENDING), ("hazardClass", ASCENDING)],
+         {"name": "rollup_waste_disposal_idx", "unique": True,
+          "partialFilterExpression": {"kind": "waste_disposal"}})
+    ]
+}
+
+
+# collection -> names of indexes INDEXES used to have, dropped once their
+# replacement exists
+RETIRED_INDEXES = {
+    "materials": ["materialId_lastSequence_idx"],   # now with revision
+}
+
+
+def ensure_indexes(db):
+    """Create every index in INDEXES, then drop RETIRED_INDEXES; returns
+    {collection: [index names]}."""
+    created = {}
+    for col, specs in INDEXES.items():
+        for keys, options in specs:
+            db[col].create_index(keys, **options)
+            created.setdefault(col, []).append(options["name"])
+    for col, names in RETIRED_INDEXES.items():
+        existing = db[col].index_information()
+        for name in names:
+            if name in existing:
+                db[col].drop_index(name)
+    return created
+
+
+def _point(value):
+    # value as a GeoJSON Point a 2dsphere index accepts (app.normalize_point's
+    # rules), or None
+    if isinstance(value, dict) and value.get("type") == "Point":
+        coords = value.get("coordinates")
+    elif isinstance(value, dict) and "lat" in value and "lng" in value:
+        coords = [value["lng"], value["lat"]]
+    else:
+        return None
+    if not isinstance(coords, list) or len(coords) != 2 \
+            or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in coords) \
+            or not (-180 <= coords[0] <= 180 and -90 <= coords[1] <= 90):
+        return None
+    return {"type": "Point", "coordinates": coords}
+
+
+def normalize_waste_points(db):
+    """waste_history from/to used to be stored exactly as the client sent
+    them, usually {lat, lng}; rewrite those as GeoJSON Points.  One that
+    can't be converted is moved to invalidPoints.<from|to>, so it is kept
+    but no longer stops the 2dsphere index from building."""
+    col, ops, fixed = db["waste_history"], [], 0
+    legs = {"$or": [{"from": {"$exists": True}}, {"to": {"$exists": True}}]}
+    for h in col.find(legs, {"from": 1, "to": 1}):
+        update = {}
+        for k in ("from", "to"):
+            if k not in h:
+                continue
+            point = _point(h[k])
+            if point is None:
+                update.setdefault("$set", {})[f"invalidPoints.{k}"] = h[k]
+                update.setdefault("$unset", {})[k] = ""
+            elif point != h[k]:
+                update.setdefault("$set", {})[k] = point
+        if update:
+            ops.append(UpdateOne({"_id": h["_id"]}, update))
+        if len(ops) == 1000:
+            fixed += col.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        fixed += col.bulk_write(ops, ordered=False).modified_count
+    return fixed
+
+
+def backfill_waste_events(db):
+    """waste_history transfer legs used to be stored without an `event`
+    (deliver and dispose rows always had one); mark them InTransit, which
+    is what waste_in_transit() looks for."""
+    col    = db["waste_history"]
+    legacy = {"event": {"$exists": False}}
+    # indexer.py may have stored the same leg since, under the (txHash, event)
+    # key the backfilled row would collide with; that copy is kept
+    indexed = col.distinct("txHash", {"event": "InTransit",
+                                      "txHash": {"$in": col.distinct("txHash", legacy)}})
+    removed = col.delete_many({**legacy, "txHash": {"$in": indexed}}).deleted_count \
+        if indexed else 0
+    return removed + col.update_many(legacy, {"$set": {"event": "InTransit"}}).modified_count
+
+
+def drop_transfer_paths(db):
+    """transfers used to store a transferPath GeometryCollection repeating
+    from and to; the API now rebuilds it on read (app.with_transfer_path)."""
+    return db["transfers"].update_many({"transferPath": {"$exists": True}},
+                                       {"$unset": {"transferPath": ""}}).modified_count
+
+
+# idempotent data fixes, run before the indexes that depend on them
+DATA_MIGRATIONS = [normalize_waste_points, backfill_waste_events, drop_transfer_paths]
+
+
+def migrate(db):
+    """Run every data migration, then ensure_indexes (a 2dsphere build fails
+    on documents it can't parse, so the data has to be fixed first)."""
+    fixed = {m.__name__: m(db) for m in DATA_MIGRATIONS}
+    return fixed, ensure_indexes(db)
+
+
+def print_report(fixed, created):
+    for name, count in fixed.items():
+        print(f"{name}: {count} documents updated")
+    for col, names in created.items():
+        print(f"{col}: {', '.join(names)}")
+
+
+# ─── Size report ───────────────────────────────────────────────────────────────
+SIZE_FIELDS = ("count", "avgObjSize", "size", "storageSize", "totalIndexSize")
+
+def collection_sizes(db):
+    """{collection: storage stats} for the collections in INDEXES; sizes in
+    bytes, `size` uncompressed, the rest as stored on disk."""
+    sizes = {}
+    for col in INDEXES:
+        try:
+            stats = next(db[col].aggregate([{"$collStats": {"storageStats": {}}}]))
+        except (OperationFailure, StopIteration):
+            continue   # not created yet
+        storage = stats["storageStats"]
+        sizes[col] = {k: storage.get(k, 0) for k in SIZE_FIELDS}
+        sizes[col]["indexSizes"] = dict(storage.get("indexSizes", {}))
+    return sizes
+
+def print_sizes(before, after):
+    def mb(n):
+        return f"{n / 2**20:10.2f} MB"
+
+    for col in after:
+        old, new = before.get(col), after[col]
+        if old is None:
+            continue
+        print(f"{col}: {old['count']} -> {new['count']} documents, "
+              f"avg {old['avgObjSize']} -> {new['avgObjSize']} bytes")
+        rows = [(k, old[k], new[k]) for k in ("size", "storageSize", "totalIndexSize")]
+        rows += [(f"  {name}", old["indexSizes"].get(name, 0), n)
+                 for name, n in new["indexSizes"].items()]
+        for name, a, b in rows:
+            pct = f"{(b - a) / a * 100:+6.1f}%" if a else "      "
+            print(f"  {name:<34} {mb(a)} -> {mb(b)}  {pct}")
+    # WiredTiger keeps freed pages for reuse rather than giving them back
+    print("storageSize shrinks only after `compact`; size and avgObjSize show the "
+          "saving straight away")
+
+def run(db):
+    """migrate() with the size report; what `flask migrate` and this script do."""
+    before = collection_sizes(db)
+    print_report(*migrate(db))
+    print_sizes(before, collection_sizes(db))
+
+
+def main():
+    client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    run(client["chain_custody_db"])
+
+
+if __name__ == "__main__":
+    main()
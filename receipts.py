@@ -0,0 +1,165 @@
+"""
+receipts.py
+
+One shared confirmer for every transaction the process is waiting on.
+
+w3.eth.wait_for_transaction_receipt() runs its own polling loop per call,
+so 50 concurrent writes mean 50 loops hammering eth_getTransactionReceipt.
+ReceiptWaiter instead runs a single thread that watches the block head and,
+each time it moves, fetches the receipts of *all* pending hashes in one
+batched JSON-RPC request.  Callers get a Future per hash:
+
+    receipt  = receipts.wait(tx_hash)            # block until confirmed
+    future   = receipts.submit(tx_hash)          # or take the Future
+    receipts = receipts.wait_all(tx_hashes)      # {hash: receipt}, misses omitted
+
+A receipt only resolves once it is `confirmations` blocks deep.  Until then
+it is re-fetched on every new head, so a receipt that disappears in a
+reorg simply goes back to waiting.  Hashes that are not confirmed within
+their timeout fail with TimeExhausted and are reported to `on_dropped`.
+"""
+
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from hexbytes import HexBytes
+from web3._utils.method_formatters import receipt_formatter
+from web3.datastructures import AttributeDict
+from web3.exceptions import TimeExhausted, TransactionNotFound
+
+from metrics import phase
+from rpc_batch import RPCError, batch_call
+
+
+class ReceiptWaiter:
+    def __init__(self, w3, confirmations=0, timeout=120, poll_interval=0.5, on_dropped=None):
+        self.w3            = w3
+        self.confirmations = confirmations
+        self.timeout       = timeout
+        self.poll_interval = poll_interval
+        self.on_dropped    = on_dropped   # called with a tx hash that timed out
+
+        self._pending   = {}      # tx hash -> [(deadline, future), ...]
+        self._fresh     = set()   # hashes added since the last fetch
+        self._cond      = threading.Condition()
+        self._last_head = None
+        self._started   = False
+
+    # ── public API ────────────────────────────────────────────────────────────
+    def submit(self, tx_hash, timeout=None):
+        tx_hash  = HexBytes(tx_hash)
+        future   = Future()
+        deadline = time.time() + (self.timeout if timeout is None else timeout)
+        with self._cond:
+            self._pending.setdefault(tx_hash, []).append((deadline, future))
+            self._fresh.add(tx_hash)
+            if not self._started:
+                threading.Thread(target=self._run, name="receipt-waiter", daemon=True).start()
+                self._started = True
+            self._cond.notify()
+        return future
+
+    def wait(self, tx_hash, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        future  = self.submit(tx_hash, timeout)
+        try:
+            # the waiter thread expires the future itself; the slack only
+            # matters if that thread is wedged on a hung node call
+            with phase("receipt_wait"):
+                return future.result(timeout + 10 * self.poll_interval)
+        except FutureTimeout:
+            raise TimeExhausted(f"Transaction {HexBytes(tx_hash).hex()} was not confirmed in time")
+
+    def wait_all(self, tx_hashes, timeout=None):
+        """Wait for many hashes at once; ones that time out are left out."""
+        futures  = [(tx_hash, self.submit(tx_hash, timeout)) for tx_hash in tx_hashes]
+        receipts = {}
+        with phase("receipt_wait"):
+            for tx_hash, future in futures:
+                try:
+                    receipts[tx_hash] = future.result()
+                except TimeExhausted:
+                    continue
+        return receipts
+
+    def pending(self):
+        """Number of transaction hashes still waiting for a receipt."""
+        with self._cond:
+            return len(self._pending)
+
+    # ── waiter thread ─────────────────────────────────────────────────────────
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            try:
+                self._poll()
+            except Exception as e:
+                # node hiccup; timeouts below still fire, so nobody hangs
+                print(f"Receipt waiter: {e}", flush=True)
+            self._expire()
+            time.sleep(self.poll_interval)
+
+    def _poll(self):
+        head = self.w3.eth.block_number
+        with self._cond:
+            if head != self._last_head:
+                hashes = list(self._pending)
+            else:
+                # nothing new was mined, but a hash submitted late may already
+                # sit in the current head
+                hashes = [h for h in self._fresh if h in self._pending]
+        found = self._fetch(hashes) if hashes else {}
+        with self._cond:
+            self._fresh -= set(hashes)
+        self._last_head = head
+
+        for tx_hash, receipt in found.items():
+            if receipt.blockNumber + self.confirmations > head:
+                continue
+            with self._cond:
+                waiting = self._pending.pop(tx_hash, [])
+            for _, future in waiting:
+                future.set_result(receipt)
+
+    def _fetch(self, hashes):
+        if not getattr(self.w3.provider, "endpoint_uri", None):
+            # no HTTP endpoint to batch against (e.g. the in-process tester)
+            receipts = {}
+            for tx_hash in hashes:
+                try:
+                    receipts[tx_hash] = self.w3.eth.get_transaction_receipt(tx_hash)
+                except TransactionNotFound:
+                    continue
+            return receipts
+
+        results = batch_call(self.w3, [
+            ("eth_getTransactionReceipt", [tx_hash.hex()]) for tx_hash in hashes
+        ])
+        return {
+            tx_hash: AttributeDict.recursive(receipt_formatter(result))
+            for tx_hash, result in zip(hashes, results)
+            if result and not isinstance(result, RPCError)
+        }
+
+    def _expire(self):
+        now     = time.time()
+        expired = []
+        with self._cond:
+            for tx_hash, waiting in list(self._pending.items()):
+                keep = [(d, f) for d, f in waiting if d > now]
+                expired += [(tx_hash, f) for d, f in waiting if d <= now]
+                if keep:
+                    self._pending[tx_hash] = keep
+                else:
+                    del self._pending[tx_hash]
+            dropped = {tx_hash for tx_hash, _ in expired} - set(self._pending)
+        for tx_hash, future in expired:
+            future.set_exception(TimeExhausted(
+                f"Transaction {tx_hash.hex()} was not confirmed in time"
+            ))
+        if self.on_dropped:
+            for tx_hash in dropped:
+                self.on_dropped(tx_hash)
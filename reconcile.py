@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+"""
+reconcile.py
+
+Find and fix drift between the ChainCustody contract and the `materials`
+collection in bulk.
+
+    python reconcile.py                  # compare and fix
+    python reconcile.py --dry-run        # only report
+    python reconcile.py --chunk 1000 --workers 8
+
+Ids are enumerated with listMaterials(); getMaterial() is then fetched for
+`--chunk` ids at a time in a single batched JSON-RPC request, compared with
+a projected `$in` cursor over the same ids, and every difference in a chunk
+is fixed with one bulk_write.  Chunks run on a small thread pool, so the
+node, Mongo and the decoder stay busy at the same time.
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from eth_abi import decode
+from eth_utils import to_checksum_address
+from pymongo import MongoClient, UpdateOne
+from web3 import Web3
+
+from abis import load_abi
+from rpc_batch import RPCError, batch_call
+
+
+def chunks(seq, size):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+class Reconciler:
+    def __init__(self, w3, materials_col, contract, dry_run=False):
+        self.w3            = w3
+        self.materials_col = materials_col
+        self.contract      = contract
+        self.dry_run       = dry_run
+
+        fn_abi = next(e for e in contract.abi
+                      if e.get("type") == "function" and e["name"] == "getMaterial")
+        self._output_types = [o["type"] for o in fn_abi["outputs"]]
+
+    def fetch_chain(self, ids):
+        # one HTTP round trip for the whole chunk of getMaterial calls
+        calls = [
+            ("eth_call", [{
+                "to":   self.contract.address,
+                "data": self.contract.encodeABI(fn_name="getMaterial", args=[mid])
+            }, "latest"])
+            for mid in ids
+        ]
+        state = {}
+        for mid, result in zip(ids, batch_call(self.w3, calls)):
+            if isinstance(result, RPCError):
+                continue
+            holder, seq, _, description = decode(self._output_types, bytes.fromhex(result[2:]))
+            state[mid] = (to_checksum_address(holder), seq, description)
+        return state
+
+    def reconcile_chunk(self, ids):
+        chain = self.fetch_chain(ids)
+        stored = {
+            m["materialId"]: m
+            for m in self.materials_col.find(
+                {"materialId": {"$in": ids}},
+                {"_id": 0, "materialId": 1, "currentHolder": 1, "lastSequence": 1}
+            )
+        }
+
+        ops   = []
+        stats = {"checked": len(ids), "missing": 0, "drifted": 0, "unreadable": 0}
+        for mid in ids:
+            if mid not in chain:
+                stats["unreadable"] += 1
+                continue
+            holder, seq, description = chain[mid]
+            m = stored.get(mid)
+            if m is None:
+                stats["missing"] += 1
+                ops.append(UpdateOne(
+                    {"materialId": mid},
+                    {"$setOnInsert": {
+                        "materialId":    mid,
+                        "description":   description,
+                        "metadata":      {},
+                        "currentHolder": holder,
+                        "lastSequence":  seq,
+                        "status":        "Created" if seq <= 1 else "In Transit",
+                        "createdAt":     int(time.time())
+                    }},
+                    upsert=True
+                ))
+            elif m.get("currentHolder") != holder or m.get("lastSequence") != seq:
+                stats["drifted"] += 1
+                # never move a record backwards if a route updated it meanwhile
+                ops.append(UpdateOne(
+                    {"materialId": mid, "lastSequence": {"$lte": seq}},
+                    {"$set": {"currentHolder": holder, "lastSequence": seq}}
+                ))
+
+        if ops and not self.dry_run:
+            self.materials_col.bulk_write(ops, ordered=False)
+        return stats
+
+    def run(self, chunk_size=500, workers=4):
+        started = time.time()
+        ids = self.contract.functions.listMaterials().call()
+        print(f"{len(ids)} materials on chain", flush=True)
+
+        totals = {"checked": 0, "missing": 0, "drifted": 0, "unreadable": 0}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for stats in pool.map(self.reconcile_chunk, chunks(ids, chunk_size)):
+                for k, v in stats.items():
+                    totals[k] += v
+                if totals["checked"] % (chunk_size * 20) < chunk_size:
+                    rate = totals["checked"] / max(time.time() - started, 1e-9)
+                    print(f"  {totals['checked']}/{len(ids)} checked ({rate:.0f}/s)", flush=True)
+
+        # records Mongo has but the contract doesn't know about can't be fixed
+        # from the chain side; just count them
+        on_chain = set(ids)
+        totals["orphaned"] = sum(
+            1 for m in self.materials_col.find({}, {"_id": 0, "materialId": 1})
+            if m["materialId"] not in on_chain
+        )
+
+        elapsed = time.time() - started
+        totals["seconds"]   = round(elapsed, 2)
+        totals["perSecond"] = round(totals["checked"] / elapsed, 1) if elapsed else None
+        totals["fixed"]     = 0 if self.dry_run else totals["missing"] + totals["drifted"]
+        return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile materials with ChainCustody")
+    parser.add_argument("--chunk", type=int, default=500,
+                        help="getMaterial calls per JSON-RPC batch")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="chunks processed concurrently")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="report drift without writing to Mongo")
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    db     = client["chain_custody_db"]
+    w3     = Web3(Web3.HTTPProvider(os.getenv("HTTP_PROVIDER", "http://127.0.0.1:8545")))
+
+    contract = w3.eth.contract(address=os.getenv("CONTRACT_ADDRESS"), abi=load_abi("ChainCustody"))
+
+    report = Reconciler(w3, db["materials"], contract, dry_run=args.dry_run)\
+        .run(chunk_size=args.chunk, workers=args.workers)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
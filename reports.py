@@ -0,0 +1,215 @@
+"""
+reports.py
+
+Custody report PDFs: rendered in a process pool, cached on disk.
+
+A report is fully determined by the material record and its transfers,
+and both only change when the material's lastSequence moves on (or its
+revision, when app.merge_indexed_material adds API-side fields), so
+finished PDFs are stored under a hash of (materialId, lastSequence[,
+revision]).  A
+repeat download of an unchanged material is a file open; a miss is laid
+out by a worker process so ReportLab's CPU time never blocks a Flask
+thread for more than the wait.
+
+    renderer = ReportRenderer(ReportCache("report_cache", max_bytes=512 << 20))
+    f = renderer.open(material, lambda: list_of_transfers)   # binary file
+"""
+
+import hashlib
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape
+
+
+# ─── Rendering (runs in the worker processes) ──────────────────────────────────
+def _fmt_ts(ts):
+    if ts in (None, ""):
+        return ""
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+def _fmt_point(p):
+    coords = (p or {}).get("coordinates")
+    return f"{coords[1]:.5f}, {coords[0]:.5f}" if coords else ""
+
+def render_report(material, transfers):
+    """Build the PDF for one material; returns the document bytes."""
+    # imported here so the API process never pays for ReportLab
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    styles = getSampleStyleSheet()
+    mid    = material["materialId"]
+
+    def footer(canvas, doc):
+        canvas.saveState()
+        canvas.setFont("Helvetica", 8)
+        canvas.drawString(40, 20, f"Material {mid} · sequence {material.get('lastSequence', '')}")
+        canvas.drawRightString(A4[0] - 40, 20, f"Page {doc.page}")
+        canvas.restoreState()
+
+    story = [
+        Paragraph(escape(f"Material Report: {mid}"), styles["Title"]),
+        Table([
+            ["Description",    material.get("description", "")],
+            ["Company",        material.get("companyName", "")],
+            ["Current Holder", material.get("currentHolder", "")],
+            ["Sequence",       str(material.get("lastSequence", ""))],
+            ["Status",         material.get("status", "")],
+            ["Created",        _fmt_ts(material.get("createdAt"))],
+            ["Location",       _fmt_point(material.get("location"))],
+            ["Transaction",    material.get("txHash", "")],
+            ["Metadata",       Paragraph(escape(repr(material.get("metadata", {}))), styles["Code"])]
+        ], colWidths=[100, 415], style=TableStyle([
+            ("FONTNAME", (0, 0), (0, -1), "Helvetica-Bold"),
+            ("FONTSIZE", (0, 0), (-1, -1), 9),
+            ("VALIGN",   (0, 0), (-1, -1), "TOP")
+        ])),
+        Spacer(1, 18),
+        Paragraph(f"Custody Timeline ({len(transfers)} transfers)", styles["Heading2"])
+    ]
+
+    if transfers:
+        rows = [["#", "Time (UTC)", "From (lat, lng)", "To (lat, lng)", "Company", "Tx"]]
+        for i, t in enumerate(transfers, 1):
+            tx = t.get("txHash", "")
+            rows.append([str(i), _fmt_ts(t.get("timestamp")), _fmt_point(t.get("from")),
+                         _fmt_point(t.get("to")), t.get("companyName", "") or "",
+                         tx[:10] + "…" if len(tx) > 10 else tx])
+        # repeatRows keeps the header on every page the table spills onto
+        story.append(Table(rows, repeatRows=1, colWidths=[25, 95, 110, 110, 95, 80],
+                           style=TableStyle([
+                               ("FONTNAME",   (0, 0), (-1, 0), "Helvetica-Bold"),
+                               ("FONTSIZE",   (0, 0), (-1, -1), 8),
+                               ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+                               ("ROWBACKGROUNDS", (0, 1), (-1, -1),
+                                [colors.white, colors.whitesmoke]),
+                               ("GRID",       (0, 0), (-1, -1), 0.25, colors.grey)
+                           ])))
+    else:
+        story.append(Paragraph("No transfers recorded.", styles["Normal"]))
+
+    buf = io.BytesIO()
+    SimpleDocTemplate(buf, pagesize=A4, title=f"Material Report: {mid}",
+                      leftMargin=40, rightMargin=40, topMargin=40, bottomMargin=40)\
+        .build(story, onFirstPage=footer, onLaterPages=footer)
+    return buf.getvalue()
+
+
+# ─── Disk cache ────────────────────────────────────────────────────────────────
+class ReportCache:
+    """PDFs on disk keyed by a hash, evicted least-recently-used past max_bytes."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock     = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.pdf")
+
+    def open(self, key):
+        """Open the cached PDF for key, or None.  The handle stays valid even
+        if the file is evicted while it is being sent."""
+        path = self.path(key)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)   # mtime doubles as last-used time for eviction
+        except OSError:
+            pass
+        return f
+
+    def put(self, key, data):
+        path = self.path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)   # readers never see a half-written file
+        self.evict()
+        return path
+
+    def evict(self):
+        with self._lock:
+            entries, total = [], 0
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith(".pdf"):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+# ─── Renderer ──────────────────────────────────────────────────────────────────
+class ReportRenderer:
+    def __init__(self, cache, workers=2, timeout=60):
+        self.cache    = cache
+        self.workers  = workers
+        self.timeout  = timeout
+        self._pool    = None
+        self._lock    = threading.Lock()
+        self._running = {}   # key -> Future, so concurrent misses render once
+
+    def open(self, material, load_transfers):
+        """Binary file with the report for `material`, rendering it on a miss.
+
+        load_transfers() is only called when the report isn't cached.
+        """
+        key = (material["materialId"], material.get("lastSequence"))
+        if material.get("revision"):     # merged after indexing; keys before it stay the same
+            key += (material["revision"],)
+        f = self.cache.open(key)
+        if f:
+            return f
+
+        with self._lock:
+            future = self._running.get(key)
+        if future is None:
+            transfers = load_transfers()   # outside the lock; it's a Mongo query
+            with self._lock:
+                future = self._running.get(key)
+                if future is None:
+                    future = self._executor().submit(render_report, material, transfers)
+                    self._running[key] = future
+                    future.add_done_callback(lambda done, key=key: self._done(key, done))
+        return io.BytesIO(future.result(self.timeout))
+
+    def _done(self, key, future):
+        # store once, however many requests were waiting on this render
+        if not future.cancelled() and future.exception() is None:
+            self.cache.put(key, future.result())
+        with self._lock:
+            self._running.pop(key, None)
+
+    def _executor(self):
+        if self._pool is None:
+            # spawn, not fork: the API process is threaded, and forking it
+            # with Mongo/RPC sockets and locks in flight is asking for trouble
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+"""
+rollups.py
+
+Precomputed analytics buckets in the `rollups` collection, so the
+management reports under GET /api/analytics/... read a handful of small
+documents instead of scanning transfers, waste and waste_history.
+
+    ops = rollups.transfer_ops(record)                 # after a transfer is persisted
+    ops = rollups.waste_created_ops(doc)               # after a waste insert / upsert
+    ops = rollups.waste_step_ops(before, after, ts)    # after a waste_history step
+    rollups.apply(rollups_col, ops)                    # or: await apply_async(...)
+
+    flask --app app backfill-rollups                   # or: python rollups.py
+
+Buckets, one document each (`kind` plus its key fields):
+
+    transfers_daily   day (UTC, YYYY-MM-DD), companyName   -> count
+    waste_status      hazardClass, status, units           -> quantity, count
+    waste_disposal    hazardClass                          -> count, seconds
+
+waste_status is the waste currently in each status (a step moves its
+quantity from the old status to the new one); waste_disposal sums the time
+from createdAt to the Disposed step, so the average is seconds / count.
+
+The ops are built by whichever writer actually inserted the record: the
+API route, or indexer.py when it got there first (app.py and indexer.py
+already agree on that for the waste record itself), so a step is counted
+once however the two race.  They are applied last, after the record
+itself has moved, and best-effort: a failed increment is logged rather
+than failing a request whose transaction is already mined.  A bucket left
+short that way (or by a crash in between) is repaired by the backfill,
+which recomputes every bucket from the source collections.  Run it once
+after deploying, and again whenever the numbers look off, ideally while
+writes are quiet: increments made while it runs can be overwritten.
+"""
+
+import os
+import time
+
+from bson import ObjectId
+from pymongo import MongoClient, ReplaceOne
+from pymongo.errors import PyMongoError
+
+TRANSFERS_DAILY = "transfers_daily"
+WASTE_STATUS    = "waste_status"
+WASTE_DISPOSAL  = "waste_disposal"
+
+DAY = 86400
+
+
+def day_of(timestamp):
+    # UTC calendar day of a unix timestamp, as the transfers_daily key
+    return time.strftime("%Y-%m-%d", time.gmtime(timestamp))
+
+
+# ─── Incremental updates ───────────────────────────────────────────────────────
+# Ops are (filter, update) pairs for upserting update_one calls; indexer.py
+# wraps them in UpdateOne for its bulk writes.
+def _inc(key, **amounts):
+    return key, {"$inc": amounts}
+
+def _status_key(waste, status):
+    return {"kind": WASTE_STATUS, "hazardClass": waste.get("hazardClass"),
+            "status": status, "units": waste.get("units")}
+
+def transfer_ops(transfer):
+    """For a transfers document (app.transfer_record)."""
+    return [_inc({"kind": TRANSFERS_DAILY, "day": day_of(transfer["timestamp"]),
+                  "companyName": transfer.get("companyName")}, count=1)]
+
+def waste_created_ops(waste):
+    """For a new waste document."""
+    return [_inc(_status_key(waste, waste["status"]), quantity=waste.get("quantity", 0), count=1)]
+
+def waste_step_ops(before, after, timestamp):
+    """For a waste record moving from `before` to `after` in a step recorded
+    at `timestamp`."""
+    if before["status"] == after["status"]:
+        return []
+    quantity = before.get("quantity", 0)
+    ops = [_inc(_status_key(before, before["status"]), quantity=-quantity, count=-1),
+           _inc(_status_key(before, after["status"]), quantity=quantity, count=1)]
+    if after["status"] == "Disposed" and "createdAt" in before:
+        ops.append(_inc({"kind": WASTE_DISPOSAL, "hazardClass": before.get("hazardClass")},
+                        count=1, seconds=timestamp - before["createdAt"]))
+    return ops
+
+def apply(col, ops, session=None):
+    try:
+        for key, update in ops:
+            col.update_one(key, update, upsert=True, session=session)
+    except PyMongoError as e:
+        print(f"Rollups: {e}", flush=True)
+
+async def apply_async(col, ops, session=None):
+    # apply() for an AsyncMongoClient collection (asgi.py)
+    try:
+        for key, update in ops:
+            await col.update_one(key, update, upsert=True, session=session)
+    except PyMongoError as e:
+        print(f"Rollups: {e}", flush=True)
+
+
+# ─── Backfill ──────────────────────────────────────────────────────────────────
+def compute(db):
+    """Every bucket, recomputed from transfers, waste and waste_history."""
+    buckets = []
+    for b in db["transfers"].aggregate([
+        {"$group": {
+            # whole UTC days, so the grouping needs no date operators
+            "_id":   {"day": {"$subtract": ["$timestamp", {"$mod": ["$timestamp", DAY]}]},
+                      "companyName": "$companyName"},
+            "count": {"$sum": 1}
+        }}
+    ], allowDiskUse=True):
+        buckets.append({"kind": TRANSFERS_DAILY, "day": day_of(int(b["_id"]["day"])),
+                        "companyName": b["_id"]["companyName"], "count": b["count"]})
+
+    for b in db["waste"].aggregate([
+        {"$group": {
+            "_id":      {"hazardClass": "$hazardClass", "status": "$status", "units": "$units"},
+            "quantity": {"$sum": "$quantity"},
+            "count":    {"$sum": 1}
+        }}
+    ]):
+        buckets.append({"kind": WASTE_STATUS, **b["_id"],
+                        "quantity": b["quantity"], "count": b["count"]})
+
+    for b in db["waste_history"].aggregate([
+        {"$match": {"event": "Disposed"}},
+        {"$lookup": {"from": "waste", "localField": "wasteId", "foreignField": "wasteId",
+                     "as": "waste"}},
+        {"$unwind": "$waste"},
+        {"$match": {"waste.createdAt": {"$exists": True}}},
+        {"$group": {
+            "_id":     "$waste.hazardClass",
+            "count":   {"$sum": 1},
+            "seconds": {"$sum": {"$subtract": ["$timestamp", "$waste.createdAt"]}}
+        }}
+    ]):
+        buckets.append({"kind": WASTE_DISPOSAL, "hazardClass": b["_id"],
+                        "count": b["count"], "seconds": b["seconds"]})
+    return buckets
+
+KEY_FIELDS = {
+    TRANSFERS_DAILY: ("day", "companyName"),
+    WASTE_STATUS:    ("hazardClass", "status", "units"),
+    WASTE_DISPOSAL:  ("hazardClass",),
+}
+
+def backfill(db):
+    """Replace every bucket with its recomputed value and drop the ones
+    nothing maps to any more; returns {kind: buckets written}."""
+    col, run, ops, written = db["rollups"], ObjectId(), [], {}
+    for b in compute(db):
+        key = {"kind": b["kind"], **{k: b[k] for k in KEY_FIELDS[b["kind"]]}}
+        ops.append(ReplaceOne(key, {**b, "backfill": run}, upsert=True))
+        written[b["kind"]] = written.get(b["kind"], 0) + 1
+        if len(ops) == 1000:
+            col.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        col.bulk_write(ops, ordered=False)
+    col.delete_many({"backfill": {"$ne": run}})
+    return written
+
+def run(db):
+    """backfill() with a report; what `flask backfill-rollups` and this script do."""
+    written = backfill(db)
+    for kind in KEY_FIELDS:
+        print(f"{kind}: {written.get(kind, 0)} buckets")
+
+
+def main():
+    client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    run(client["chain_custody_db"])
+
+
+if __name__ == "__main__":
+    main()
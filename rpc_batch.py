@@ -0,0 +1,69 @@
+"""
+rpc_batch.py
+
+JSON-RPC batching for the HTTP provider.  web3 6.x sends one HTTP request
+per call; here many calls go out as a single JSON array in one POST and
+the responses come back matched up by id.
+
+Providers without an HTTP endpoint (e.g. the in-process tester) fall back
+to one make_request() per call, so callers never need to care.
+"""
+
+import itertools
+import threading
+
+import requests
+
+
+class RPCError(Exception):
+    def __init__(self, error):
+        super().__init__(error.get("message", str(error)))
+        self.error = error
+
+
+_ids   = itertools.count(1)
+_local = threading.local()
+
+
+def _session():
+    # requests.Session is not thread-safe; keep one pooled session per thread
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def batch_call(w3, calls, timeout=60):
+    """Send [(method, params), ...] and return results in the same order.
+
+    A call that failed comes back as an RPCError instance in its slot
+    rather than raising, so one revert doesn't sink the whole batch.
+    """
+    if not calls:
+        return []
+
+    uri = getattr(w3.provider, "endpoint_uri", None)
+    if not uri:
+        results = []
+        for method, params in calls:
+            resp = w3.provider.make_request(method, params)
+            results.append(RPCError(resp["error"]) if "error" in resp else resp["result"])
+        return results
+
+    payload = [
+        {"jsonrpc": "2.0", "id": next(_ids), "method": method, "params": params}
+        for method, params in calls
+    ]
+    resp = _session().post(uri, json=payload, timeout=timeout)
+    resp.raise_for_status()
+    by_id = {r.get("id"): r for r in resp.json()}
+
+    results = []
+    for req in payload:
+        r = by_id.get(req["id"])
+        if r is None:
+            results.append(RPCError({"message": "missing response"}))
+        elif "error" in r:
+            results.append(RPCError(r["error"]))
+        else:
+            results.append(r["result"])
+    return results
@@ -0,0 +1,188 @@
+"""
+signer.py
+
+Local transaction signing with in-process nonce allocation.
+
+Keys come from SIGNER_KEYS (comma-separated hex private keys) or
+SIGNER_KEYS_FILE (one key per line).  Transactions from those accounts are
+built and signed here and sent with eth_sendRawTransaction, so several
+requests can submit from the same account without waiting on each other:
+each account has a NonceManager that hands out nonces from a local counter
+instead of asking the node for every transaction.
+
+The per-account lock is held from nonce allocation until the node has
+accepted the transaction (not until it is mined).  Automining nodes such
+as Hardhat refuse a nonce that arrives ahead of its predecessor instead of
+queueing it, so sends from one account go out strictly in order; sends
+from different accounts run in parallel.
+
+When the caller doesn't care which account sends (creating a material or
+waste record), SignerPool.pick() spreads the load round-robin across the
+pool.  Calls that must come from a specific address the pool has no key
+for — e.g. transferMaterial from a node-managed holder — fall back to
+eth_sendTransaction, still with a locally allocated nonce.  With no keys
+configured at all the pool degrades to the node's default account.
+
+Nonces are per process.  Gunicorn workers sharing one set of keys will
+trip over each other's nonces; send() resyncs and retries when its nonce was taken,
+but giving each worker its own keys is what actually scales.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from eth_account import Account
+
+from metrics import phase
+
+NONCE_RETRIES = 3
+
+
+def load_keys():
+    keys = [k.strip() for k in os.getenv("SIGNER_KEYS", "").split(",") if k.strip()]
+    path = os.getenv("SIGNER_KEYS_FILE")
+    if path:
+        with open(path) as f:
+            keys += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    return keys
+
+
+# another sender (a second worker on the same key) took our nonce: resync and resign
+NONCE_ERRORS = ("nonce too low", "replacement transaction underpriced")
+
+def _is_nonce_error(e):
+    msg = str(e).lower()
+    return any(m in msg for m in NONCE_ERRORS)
+
+def _is_already_known(e):
+    # the node already has this exact signed transaction; it is not a failure
+    return "already known" in str(e).lower()
+
+
+class NonceManager:
+    """Thread-safe nonce counter for one account."""
+
+    def __init__(self, w3, address):
+        self.w3      = w3
+        self.address = address
+        self._lock   = threading.Lock()
+        self._next   = None
+
+    @contextmanager
+    def reserve(self):
+        """Yield the next nonce; it is only consumed if the block succeeds."""
+        with self._lock:
+            if self._next is None:
+                self._next = self.w3.eth.get_transaction_count(self.address, "pending")
+            try:
+                yield self._next
+            except Exception:
+                # whatever happened, the node and our counter may disagree now
+                self._next = None
+                raise
+            self._next += 1
+
+    def resync(self):
+        # Forget the local counter; the next reserve() re-reads the node's
+        # pending count.  After a dropped transaction that count points at the
+        # gap, so the next send fills it and unsticks everything queued behind.
+        with self._lock:
+            self._next = None
+
+
+class SignerPool:
+    def __init__(self, w3, keys=(), default_account=None, track=10000):
+        self.w3              = w3
+        self.default_account = default_account
+        self._accounts       = OrderedDict()
+        for key in keys:
+            acct = Account.from_key(key)
+            self._accounts[acct.address] = acct
+
+        self._nonces     = {}
+        self._nonce_lock = threading.Lock()
+        self._rr_lock    = threading.Lock()
+        self._rr         = 0
+        self._chain_id   = None
+        self._sent       = OrderedDict()   # tx hash -> sender, for dropped()
+        self._track      = track
+
+    @property
+    def addresses(self):
+        return list(self._accounts)
+
+    def pick(self):
+        """Sender for a call that may come from any of our accounts."""
+        if not self._accounts:
+            return self.default_account
+        with self._rr_lock:
+            address = self.addresses[self._rr % len(self._accounts)]
+            self._rr += 1
+        return address
+
+    def send(self, fn_call, sender=None):
+        """Estimate, sign and broadcast a contract call; returns the tx hash.
+
+        Reverts surface from the gas estimate (ContractLogicError) before a
+        nonce is taken, so a rejected call never leaves a gap.
+        """
+        with phase("tx_submit"):   # includes waiting for the account's nonce lock
+            sender = sender or self.pick()
+            gas    = fn_call.estimate_gas({"from": sender})
+            nonces = self._nonce_manager(sender)
+
+            for attempt in range(NONCE_RETRIES):
+                try:
+                    with nonces.reserve() as nonce:
+                        tx_hash = self._broadcast(fn_call, sender, nonce, gas)
+                except Exception as e:
+                    if not _is_nonce_error(e) or attempt == NONCE_RETRIES - 1:
+                        raise
+                    continue
+                self._remember(tx_hash, sender)
+                return tx_hash
+
+    def _broadcast(self, fn_call, sender, nonce, gas):
+        if sender not in self._accounts:
+            return fn_call.transact({"from": sender, "nonce": nonce, "gas": gas})
+        tx = fn_call.build_transaction({
+            "from":    sender,
+            "nonce":   nonce,
+            "gas":     gas,
+            "chainId": self._chain()
+        })
+        signed = self._accounts[sender].sign_transaction(tx)
+        try:
+            return self.w3.eth.send_raw_transaction(signed.rawTransaction)
+        except Exception as e:
+            # resigning under a new nonce would send the call twice; the one
+            # the node holds is ours, and so is its nonce
+            if _is_already_known(e):
+                return signed.hash
+            raise
+
+    def dropped(self, tx_hash):
+        """A transaction never got mined: make its sender re-read its nonce."""
+        with self._nonce_lock:
+            sender = self._sent.pop(tx_hash, None)
+        if sender:
+            self._nonce_manager(sender).resync()
+
+    def _nonce_manager(self, address):
+        with self._nonce_lock:
+            if address not in self._nonces:
+                self._nonces[address] = NonceManager(self.w3, address)
+            return self._nonces[address]
+
+    def _chain(self):
+        if self._chain_id is None:
+            self._chain_id = self.w3.eth.chain_id
+        return self._chain_id
+
+    def _remember(self, tx_hash, sender):
+        with self._nonce_lock:
+            self._sent[tx_hash] = sender
+            while len(self._sent) > self._track:
+                self._sent.popitem(last=False)
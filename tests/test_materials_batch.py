@@ -0,0 +1,82 @@
+"""
+tests/test_materials_batch.py
+
+POST /api/materials/batch against the same stand-ins as
+benchmarks/load.py (mongomock and an in-process EVM):
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "benchmarks"))
+
+load = pytest.importorskip("load")
+pytest.importorskip("mongomock")
+pytest.importorskip("eth_tester")
+
+from web3.exceptions import Web3ValidationError
+
+
+@pytest.fixture(scope="module")
+def api():
+    os.environ.setdefault("RECEIPT_POLL_INTERVAL", "0.02")
+    w3, chain, waste = load.start_chain()
+    return load.wire_app(load.start_mongo("memory"), w3, chain, waste)
+
+@pytest.fixture
+def client(api):
+    token = api.jwt.encode({"companyName": "Acme"}, api.app.config["SECRET_KEY"],
+                           algorithm="HS256")
+    c = api.app.test_client()
+    c.environ_base["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+    return c
+
+
+def test_mixed_batch_fails_only_the_bad_items(api, client, monkeypatch):
+    send = api.signers.send
+
+    def flaky_send(fn_call, sender=None):
+        # a send that blows up after earlier items are already on-chain
+        if fn_call.args[0] == "B-SEND":
+            raise Web3ValidationError("could not encode the call")
+        return send(fn_call, sender)
+    monkeypatch.setattr(api.signers, "send", flaky_send)
+
+    items = [
+        {"materialId": "B-OK1", "description": "first"},
+        {"materialId": ["x"], "description": "list id"},
+        {"materialId": 7, "description": "int id"},
+        {"materialId": "B-DICT", "description": {"not": "a string"}},
+        {"materialId": "", "description": "empty id"},
+        {"description": "no id"},
+        "not an object",
+        {"materialId": "B-SEND", "description": "send fails"},
+        {"materialId": "B-OK1", "description": "duplicate"},
+        {"materialId": "B-OK2", "description": "second", "location": {"lat": 50, "lng": 4}},
+    ]
+    r = client.post("/api/materials/batch", json=items)
+
+    assert r.status_code == 207
+    body = r.get_json()
+    statuses = [res["status"] for res in body["results"]]
+    assert statuses == ["created"] + ["failed"] * 8 + ["created"]
+    assert (body["created"], body["failed"]) == (2, 8)
+    assert "non-empty strings" in body["results"][1]["error"]
+    assert "could not encode" in body["results"][7]["error"]
+    assert body["results"][8]["error"] == "duplicate materialId in batch"
+
+    # both mined items got their documents despite the failure in between
+    for mid in ("B-OK1", "B-OK2"):
+        doc = api.materials_col.find_one({"materialId": mid})
+        assert doc is not None and doc["txHash"]
+    assert api.materials_col.find_one({"materialId": "B-SEND"}) is None
+
+def test_single_create_rejects_non_string_fields(client):
+    r = client.post("/api/materials", json={"materialId": 7, "description": "int id"})
+    assert r.status_code == 400
+    assert "non-empty strings" in r.get_json()["error"]